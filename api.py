@@ -1,5 +1,6 @@
 """Flask API 入口"""
 import os
+import sys
 
 # 启动时加载 conf/.env 环境变量
 try:
@@ -12,22 +13,86 @@ except ImportError:
 
 from flask import Flask
 
+from biz.api.routes.logs import logs_bp
+from biz.api.routes.profiles import profiles_bp
+from biz.api.routes.queue import queue_bp
 from biz.api.routes.webhook import webhook_bp
+from biz.service.deferral_service import start_auto_drainer
 from biz.service.storage_service import StorageService
+from biz.utils.queue import start_dispatcher
 
 app = Flask(__name__)
 app.register_blueprint(webhook_bp)
+app.register_blueprint(queue_bp)
+app.register_blueprint(profiles_bp)
+app.register_blueprint(logs_bp)
 
 
 @app.route("/")
 def index():
-    return {"message": "Code-to-Reasoning server is running.", "webhook": "/reasoning/webhook"}
+    return {
+        "message": "Code-to-Reasoning server is running.",
+        "webhook": "/reasoning/webhook",
+        "queue_metrics": "/reasoning/queue/metrics",
+        "profiles": "/reasoning/profiles",
+        "logs": "/reasoning/logs",
+    }
+
+
+def _post_fork(server, worker):
+    # 每个 worker 启动后立即接管已退出 worker 遗留的任务；错峰检查线程同样在 worker 中启动，
+    # 由 DRAIN_LOCK 保证只有一个 worker 清空延迟队列
+    start_dispatcher()
+    start_auto_drainer()
+
+
+def run_production(host: str, port: int):
+    """
+    生产模式：优先 gunicorn（gthread worker），Windows 等无 gunicorn 环境退回 waitress。
+    API_WORKERS 为进程数，API_THREADS 为每进程线程数。
+    """
+    workers = int(os.getenv("API_WORKERS", "2"))
+    threads = int(os.getenv("API_THREADS", "8"))
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+
+    if BaseApplication is not None:
+        class _GunicornApp(BaseApplication):
+            def load_config(self):
+                self.cfg.set("bind", f"{host}:{port}")
+                self.cfg.set("workers", workers)
+                self.cfg.set("threads", threads)
+                self.cfg.set("worker_class", "gthread")
+                self.cfg.set("timeout", int(os.getenv("API_TIMEOUT", "30")))
+                self.cfg.set("keepalive", 5)
+                self.cfg.set("post_fork", _post_fork)
+
+            def load(self):
+                return app
+
+        _GunicornApp().run()
+        return
+
+    try:
+        from waitress import serve
+    except ImportError:
+        raise RuntimeError("Production mode requires gunicorn or waitress: pip install gunicorn")
+    start_dispatcher()
+    start_auto_drainer()
+    serve(app, host=host, port=port, threads=workers * threads)
 
 
 def main():
     StorageService.init_db()
     port = int(os.getenv("PORT", 5003))
-    app.run(host="0.0.0.0", port=port)
+    if os.getenv("API_SERVER_MODE", "dev").lower() == "production" or "--prod" in sys.argv[1:]:
+        run_production("0.0.0.0", port)
+    else:
+        start_dispatcher()
+        start_auto_drainer()
+        app.run(host="0.0.0.0", port=port)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,326 @@
+"""
+热点函数微基准：用合成的 small / medium / huge MR 测量单次事件处理路径上的各个函数，
+与保存的基线对比，耗时比超过阈值时返回非零退出码，用于发现性能回退。
+
+    python -m benchmark.hot_paths                          # 运行全部用例并与基线对比
+    python -m benchmark.hot_paths --filter filter_changes --sizes huge
+    python -m benchmark.hot_paths --save-baseline          # 更新基线（换机器后需重新生成）
+    python -m benchmark.hot_paths --max-regression 1.3     # 任一用例慢于基线 30% 时失败
+
+覆盖：三个平台的 filter_changes、_commit_messages、diff 渲染（render_changes）、
+count_tokens / truncate_text_by_tokens、_parse_json，以及 StorageService 的 insert / check_exists / get_logs /
+search_logs（两字词走二元组表、三字以上走 trigram）。
+缺少可选依赖（如 get_logs 需要 pandas）或依赖数据（如离线时 tiktoken 无法下载编码文件）的用例会标记为 skipped。
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmark", "baselines", "hot_paths.json")
+
+# (文件数, 每个文件的 +/- 行数, 提交数, 库中已有记录数)
+SIZES: Dict[str, Tuple[int, int, int, int]] = {
+    "small": (5, 20, 3, 100),
+    "medium": (50, 80, 20, 2000),
+    "huge": (1000, 200, 200, 20000),
+}
+
+EXTS = (".java", ".py", ".go", ".vue", ".sql", ".yml", ".min.js", ".lock", ".png")
+
+
+def synthetic_diff(rng: random.Random, lines: int) -> str:
+    body = []
+    for j in range(lines):
+        body.append(f"+    order.setStatus(Status.REFUND_{rng.randrange(1000)}); // {j}\n")
+        if j % 3 == 0:
+            body.append(f"-    order.setStatus(Status.PAID_{rng.randrange(1000)});\n")
+        if j % 5 == 0:
+            body.append("     return order;\n")
+    return f"@@ -1,{lines} +1,{lines} @@\n" + "".join(body)
+
+
+def synthetic_changes(size: str, seed: int = 7) -> Dict[str, List[dict]]:
+    """按平台 API 格式生成同一组变更：GitLab 用 new_path/diff，GitHub/Gitea 用 filename/patch"""
+    files, lines, _, _ = SIZES[size]
+    rng = random.Random(seed)
+    gitlab, github, gitea = [], [], []
+    for i in range(files):
+        path = f"src/module{i % 13}/File{i}{EXTS[i % len(EXTS)]}"
+        diff = synthetic_diff(rng, lines)
+        status = "removed" if i % 17 == 0 else "modified"
+        gitlab.append({"new_path": path, "old_path": path, "diff": diff, "deleted_file": status == "removed"})
+        github.append({"filename": path, "patch": diff, "status": status})
+        gitea.append({"filename": path, "patch": diff, "status": status})
+    return {"gitlab": gitlab, "github": github, "gitea": gitea}
+
+
+def synthetic_commits(size: str) -> List[dict]:
+    _, _, commits, _ = SIZES[size]
+    return [{"title": f"feat(order): 支持部分退款 #{i}", "message": f"feat(order): 支持部分退款 #{i}\n\n详细说明"}
+            for i in range(commits)]
+
+
+def synthetic_raw(size: str) -> str:
+    files, _, _, _ = SIZES[size]
+    details = [{"area": f"订单模块{i}", "change": "新增部分退款审批流程，退款金额不得超过实付金额"} for i in range(min(files, 50))]
+    body = json.dumps({"summary": "订单支持部分退款", "categories": ["功能新增", "Bug修复"], "details": details},
+                      ensure_ascii=False, indent=2)
+    return f"```json\n{body}\n```"
+
+
+def _entity(i: int, prefix: str):
+    from biz.entity.reasoning_entity import BusinessReasoningEntity
+
+    return BusinessReasoningEntity(
+        platform="gitlab", repo_name=f"repo{i % 20}", request_number=i, request_url="", request_title=f"MR {i}",
+        source_branch=f"feature/{i}", target_branch="main", last_commit_id=f"{prefix}{i:08x}", author=f"dev{i % 50}",
+        commit_messages="feat: 支持部分退款", business_summary="订单支持部分退款", reasoning_categories="功能新增,Bug修复",
+        reasoning_details=json.dumps([{"area": "订单", "change": "部分退款"}], ensure_ascii=False),
+        raw_reasoning_json='{"summary": "订单支持部分退款"}',
+    )
+
+
+def _prepare_db(rows: int):
+    """临时库：批量写入 rows 条历史记录（触发器照常维护全文索引与汇总表，二元组索引写入后重建）"""
+    import sqlite3
+
+    from biz.service.storage_service import StorageService
+
+    directory = tempfile.mkdtemp(prefix="bench-hot-paths-")
+    atexit.register(shutil.rmtree, directory, True)
+    StorageService.DB_FILE = os.path.join(directory, "data.db")
+    StorageService.init_db()
+    now = int(time.time())
+    with sqlite3.connect(StorageService.DB_FILE) as conn:
+        conn.executemany(
+            """
+            INSERT INTO business_reasoning_log (
+                platform, repo_name, request_number, request_title, source_branch, target_branch,
+                last_commit_id, author, commit_messages, created_at, business_summary,
+                reasoning_categories, reasoning_details
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            [
+                (e.platform, e.repo_name, e.request_number, e.request_title, e.source_branch, e.target_branch,
+                 e.last_commit_id, e.author, e.commit_messages, now - i * 60, e.business_summary,
+                 e.reasoning_categories, e.reasoning_details)
+                for i, e in ((i, _entity(i, "h")) for i in range(rows))
+            ],
+        )
+    StorageService.rebuild_bigrams()
+    return StorageService
+
+
+def build_cases(size: str) -> List[Tuple[str, Callable[[], Callable[[], object]]]]:
+    """用例工厂：(名称, 返回被测零参函数的准备函数)。准备阶段不计时，导入失败时用例标记为 skipped"""
+    changes = synthetic_changes(size)
+
+    def platform_filter(name):
+        def prepare():
+            import importlib
+            module = importlib.import_module(f"biz.platforms.{name}.webhook_handler")
+            return lambda: list(module.filter_changes(changes[name]))
+        return prepare
+
+    def commit_messages():
+        from biz.queue.worker import _commit_messages
+        commits = synthetic_commits(size)
+        return lambda: _commit_messages(commits)
+
+    def render():
+        from biz.platforms.gitlab.webhook_handler import filter_changes
+        from biz.utils.diff_budget import clip_changes, render_changes
+        return lambda: render_changes(filter_changes(clip_changes(iter(changes["gitlab"]))))
+
+    def prompt_text():
+        from biz.utils.diff_budget import render_changes
+        from biz.platforms.gitlab.webhook_handler import filter_changes
+        return render_changes(filter_changes(iter(changes["gitlab"])))[0]
+
+    def tokens_count():
+        from biz.utils.token_util import count_tokens
+        text = prompt_text()
+        # 预先加载编码（tiktoken 首次使用时需下载编码文件），加载耗时不计入
+        count_tokens("")
+        return lambda: count_tokens(text)
+
+    def tokens_truncate():
+        from biz.utils.token_util import truncate_text_by_tokens
+        text = prompt_text()
+        truncate_text_by_tokens("", 1)
+        return lambda: truncate_text_by_tokens(text, 4000)
+
+    def parse_json():
+        from biz.service.business_reasoning_service import BusinessReasoningService
+        # 不创建 LLM 客户端，仅测解析
+        svc = BusinessReasoningService.__new__(BusinessReasoningService)
+        raw = synthetic_raw(size)
+        return lambda: svc._parse_json(raw)
+
+    rows = SIZES[size][3]
+    storage = {}
+
+    def db():
+        if "svc" not in storage:
+            storage["svc"] = _prepare_db(rows)
+        return storage["svc"]
+
+    def insert():
+        svc = db()
+        counter = iter(range(10 ** 9))
+        return lambda: svc.insert(_entity(next(counter), "n"), int(time.time()))
+
+    def check_exists():
+        svc = db()
+        e = _entity(rows // 2, "h")
+        return lambda: svc.check_exists(e.platform, e.repo_name, e.source_branch, e.target_branch, e.last_commit_id)
+
+    def get_logs():
+        import pandas  # noqa: F401  get_logs 依赖 pandas
+        svc = db()
+        since = int(time.time()) - 7 * 86400
+        return lambda: svc.get_logs(repo_names=["repo1", "repo2"], created_at_gte=since)
+
+    def search_logs(keyword):
+        def prepare():
+            import pandas  # noqa: F401  search_logs 依赖 pandas
+            svc = db()
+            return lambda: svc.search_logs(keyword, repo_names=["repo1"])
+        return prepare
+
+    return [
+        ("gitlab.filter_changes", platform_filter("gitlab")),
+        ("github.filter_changes", platform_filter("github")),
+        ("gitea.filter_changes", platform_filter("gitea")),
+        ("worker._commit_messages", commit_messages),
+        ("diff_budget.render_changes", render),
+        ("token_util.count_tokens", tokens_count),
+        ("token_util.truncate_text_by_tokens", tokens_truncate),
+        ("BusinessReasoningService._parse_json", parse_json),
+        ("StorageService.insert", insert),
+        ("StorageService.check_exists", check_exists),
+        ("StorageService.get_logs", get_logs),
+        # 两字词走二元组表，三字及以上走 trigram FTS
+        ("StorageService.search_logs[2char]", search_logs("退款")),
+        ("StorageService.search_logs[3char]", search_logs("部分退款")),
+    ]
+
+
+def measure(fn: Callable[[], object], repeat: int, min_time: float) -> float:
+    """自动确定每轮调用次数（单轮不少于 min_time 秒），取 repeat 轮中最快的单次耗时（毫秒）"""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best * 1000
+
+
+def run(sizes: List[str], name_filter: str, repeat: int, min_time: float) -> Dict[str, dict]:
+    results = {}
+    for size in sizes:
+        for name, prepare in build_cases(size):
+            if name_filter and name_filter not in name:
+                continue
+            key = f"{name}[{size}]"
+            try:
+                fn = prepare()
+            except ImportError as e:
+                results[key] = {"skipped": f"missing dependency: {e.name}"}
+                print(f"{key:48s}  skipped ({e.name} not installed)")
+                continue
+            except OSError as e:
+                # 依赖已安装但所需数据无法获取（如离线环境下 tiktoken 下载编码文件失败）
+                results[key] = {"skipped": f"unavailable: {type(e).__name__}"}
+                print(f"{key:48s}  skipped ({type(e).__name__})")
+                continue
+            ms = measure(fn, repeat, min_time)
+            results[key] = {"ms": round(ms, 4)}
+            print(f"{key:48s} {ms:12.4f}ms")
+    return results
+
+
+def compare(results: Dict[str, dict], baseline: Dict[str, dict], max_regression: float) -> int:
+    """打印与基线的对比表，返回超出阈值的用例数"""
+    print(f"\n{'case':48s} {'baseline':>12s} {'current':>12s} {'ratio':>7s}")
+    regressions = 0
+    for key, current in results.items():
+        base = baseline.get(key, {})
+        if "ms" not in current or "ms" not in base:
+            print(f"{key:48s} {base.get('ms', '-'):>12} {current.get('ms', '-'):>12} {'-':>7s}")
+            continue
+        ratio = current["ms"] / base["ms"] if base["ms"] else 1.0
+        flag = ""
+        if ratio > max_regression:
+            regressions += 1
+            flag = "  << regression"
+        elif ratio < 1 / max_regression:
+            flag = "  faster"
+        print(f"{key:48s} {base['ms']:12.4f} {current['ms']:12.4f} {ratio:7.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="small,medium,huge", help="逗号分隔：small,medium,huge")
+    parser.add_argument("--filter", default="", help="只运行名称包含该子串的用例")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.05, help="每轮最少运行秒数")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="将本次结果合并写入基线文件")
+    parser.add_argument("--max-regression", type=float, default=1.5, help="耗时比超过该值视为回退")
+    args = parser.parse_args(argv)
+
+    os.environ.setdefault("SUPPORTED_EXTENSIONS", ".java,.py,.php,.yml,.vue,.go,.c,.cpp,.h,.js,.css,.md,.sql")
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip() in SIZES]
+    results = run(sizes, args.filter, args.repeat, args.min_time)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    if args.save_baseline:
+        merged = {**baseline, **{k: v for k, v in results.items() if "ms" in v}}
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "machine": f"{platform.system()} {platform.machine()}",
+                "results": dict(sorted(merged.items())),
+            }, f, ensure_ascii=False, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved: {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("\nNo baseline found, run with --save-baseline first")
+        return 0
+    regressions = compare(results, baseline, args.max_regression)
+    if regressions:
+        print(f"\n{regressions} case(s) slower than baseline by more than {args.max_regression}x", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,95 @@
+"""
+启动开销基准：在干净的子进程中导入目标模块，统计 -X importtime 累计耗时、峰值 RSS，
+并检查不应被加载的重型依赖，防止 API/Worker 启动开销回退。
+
+    python -m benchmark.imports                       # 默认检查 api 与 webhook 路由
+    python -m benchmark.imports --module biz.queue.worker --forbid streamlit,pandas
+    python -m benchmark.imports --max-ms 400 --max-rss-mb 80   # 超出预算时返回非零退出码
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# API 进程只处理 Webhook，不应加载以下模块（jinja2 由 Flask 自身导入，不在此列；
+# 检查 Worker 等非 Flask 模块时可用 --forbid 加上 jinja2）
+DEFAULT_FORBIDDEN = ("pandas", "streamlit", "openai", "yaml", "tiktoken", "requests")
+
+_PROBE = """
+import importlib, sys
+sys.stderr.write("--start--\\n"); sys.stderr.flush()
+importlib.import_module({module!r})
+sys.stderr.write("--end--\\n"); sys.stderr.flush()
+import json, resource
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+print(json.dumps({{"rss_kb": rss_kb, "modules": sorted(sys.modules)}}))
+"""
+
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure(module: str) -> dict:
+    import json
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(module=module)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{proc.stderr[-2000:]}")
+    top_level = {}
+    lines = proc.stderr.splitlines()
+    start, end = lines.index("--start--"), lines.index("--end--")
+    for line in lines[start + 1:end]:
+        m = _IMPORTTIME.match(line)
+        # 缩进为 1 个空格的是顶层导入，其累计耗时已包含全部子模块
+        if m and len(m.group(3)) == 1:
+            top_level[m.group(4)] = int(m.group(2))
+    probe = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {
+        "cumulative_us": sum(top_level.values()),
+        "top": sorted(top_level.items(), key=lambda kv: kv[1], reverse=True)[:10],
+        "rss_kb": probe["rss_kb"],
+        "modules": set(probe["modules"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", action="append", help="待测模块，可重复；默认 api 与 biz.api.routes.webhook")
+    parser.add_argument("--forbid", default=",".join(DEFAULT_FORBIDDEN), help="不允许被加载的顶层模块，逗号分隔")
+    parser.add_argument("--max-ms", type=float, help="累计导入耗时上限（毫秒）")
+    parser.add_argument("--max-rss-mb", type=float, help="峰值 RSS 上限（MB）")
+    args = parser.parse_args(argv)
+
+    forbidden = [m for m in args.forbid.split(",") if m]
+    failed = False
+    for module in args.module or ["api", "biz.api.routes.webhook"]:
+        result = measure(module)
+        ms = result["cumulative_us"] / 1000
+        rss_mb = result["rss_kb"] / 1024
+        print(f"{module}: import {ms:.1f}ms, max RSS {rss_mb:.1f}MB")
+        for name, us in result["top"]:
+            print(f"    {us / 1000:8.1f}ms  {name}")
+        loaded = [m for m in forbidden if m in result["modules"]]
+        if loaded:
+            print(f"  FAIL: heavy modules loaded: {', '.join(loaded)}")
+            failed = True
+        if args.max_ms is not None and ms > args.max_ms:
+            print(f"  FAIL: import time {ms:.1f}ms > {args.max_ms}ms")
+            failed = True
+        if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+            print(f"  FAIL: RSS {rss_mb:.1f}MB > {args.max_rss_mb}MB")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,127 @@
+"""
+大 MR 内存基准：合成数百 MB 的 MR（分页 JSON + 超大生成文件 + 大量普通文件），
+在独立子进程中跑完 获取 -> 截断 -> 过滤 -> 渲染 流程，对比不同 MR 规模下的峰值 RSS，
+验证内存占用与 MR 总大小无关。峰值增长超过 --max-growth-mb 时返回非零退出码，可直接作为 CI 检查。
+
+    python -m benchmark.memory                        # 默认对比 40MB 与 400MB，增长超过 32MB 时失败
+    python -m benchmark.memory --sizes 50,200,800 --max-growth-mb 40
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGE_SIZE = 20
+# 每 50 个文件出现一个超大文件（重新生成的测试数据 / 提交进仓库的依赖）
+HUGE_EVERY = 50
+HUGE_FILE_MB = 8
+# 默认的峰值 RSS 增长上限：流式处理时 40MB 与 400MB 的差异约 2MB，
+# 若有阶段持有完整 MR 或整页原文，增长为数百 MB
+DEFAULT_MAX_GROWTH_MB = 32
+
+
+def _diff(lines: int, seed: int) -> str:
+    return "@@ -1,{0} +1,{0} @@\n".format(lines) + "".join(
+        f"-    value_{seed}_{j} = compute_old({j})\n+    value_{seed}_{j} = compute_new({j}, flag=True)\n"
+        for j in range(lines)
+    )
+
+
+def synthetic_pages(total_mb: int):
+    """模拟平台分页接口：每页先序列化为 JSON 再解码，与真实请求一样每次只持有一页"""
+    target = total_mb * 1024 * 1024
+    produced = i = 0
+    while produced < target:
+        page = []
+        for _ in range(PAGE_SIZE):
+            if i % HUGE_EVERY == HUGE_EVERY - 1:
+                path = f"src/data/seed_{i}.py"
+                diff = _diff(HUGE_FILE_MB * 1024 * 1024 // 100, i)
+            else:
+                path = f"src/service/module_{i}.py"
+                diff = _diff(200, i)
+            page.append({"old_path": path, "new_path": path, "diff": diff,
+                         "new_file": False, "renamed_file": False, "deleted_file": False})
+            produced += len(diff)
+            i += 1
+        body = json.dumps(page)
+        del page
+        yield json.loads(body)
+
+
+def synthetic_changes(total_mb: int):
+    for page in synthetic_pages(total_mb):
+        yield from page
+
+
+def _child(total_mb: int):
+    import resource
+
+    from biz.platforms.gitlab.webhook_handler import filter_changes
+    from biz.queue.worker import collect_diffs
+
+    started = time.perf_counter()
+    text, stats = collect_diffs(lambda: synthetic_changes(total_mb), filter_changes)
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss_kb //= 1024
+    print(json.dumps({
+        "rss_kb": rss_kb,
+        "seconds": time.perf_counter() - started,
+        "files": stats.files,
+        "truncated": stats.truncated,
+        "omitted": stats.omitted,
+        "prompt_kb": len(text) // 1024,
+    }))
+
+
+def measure(total_mb: int) -> dict:
+    proc = subprocess.run(
+        [sys.executable, "-m", "benchmark.memory", "--child", str(total_mb)],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{total_mb}MB run failed:\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="40,400", help="合成 MR 的 diff 总量（MB），逗号分隔")
+    parser.add_argument(
+        "--max-growth-mb", type=float, default=DEFAULT_MAX_GROWTH_MB,
+        help="最大与最小规模之间峰值 RSS 增长上限（MB），超出时返回非零",
+    )
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        _child(args.child)
+        return 0
+
+    os.environ.setdefault("SUPPORTED_EXTENSIONS", ".java,.py,.php,.yml,.vue,.go,.c,.cpp,.h,.js,.css,.md,.sql")
+    results = []
+    for size in sorted(int(s) for s in args.sizes.split(",") if s):
+        r = measure(size)
+        results.append(r)
+        print(
+            f"{size:6d}MB MR: max RSS {r['rss_kb'] / 1024:7.1f}MB, {r['seconds']:6.1f}s, "
+            f"{r['files']} files ({r['truncated']} truncated, {r['omitted']} beyond MR limit), "
+            f"prompt {r['prompt_kb']}KB"
+        )
+    growth = (results[-1]["rss_kb"] - results[0]["rss_kb"]) / 1024
+    print(f"peak RSS growth: {growth:.1f}MB")
+    if growth > args.max_growth_mb:
+        print(f"FAIL: RSS growth {growth:.1f}MB > {args.max_growth_mb}MB", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
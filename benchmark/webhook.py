@@ -0,0 +1,98 @@
+"""
+Webhook 吞吐基准：对运行中的 API 持续发送合成 MR 事件，统计 requests/sec 与延迟分位数。
+
+    python api.py --prod &
+    python -m benchmark.webhook --url http://127.0.0.1:5003/reasoning/webhook --concurrency 32 --duration 20
+
+默认发送会被入队前过滤丢弃的 close 事件（不触发 LLM 调用），--action open 可测试完整入队路径。
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def build_payload(action: str, description_kb: int) -> bytes:
+    """合成 GitLab MR 事件，description 模拟大体积负载"""
+    return json.dumps({
+        "object_kind": "merge_request",
+        "user": {"username": "bench"},
+        "project": {"name": "bench-repo", "id": 1},
+        "repository": {"homepage": "http://gitlab.example.com/group/bench-repo"},
+        "object_attributes": {
+            "iid": 1,
+            "action": action,
+            "title": "bench",
+            "description": "x" * (description_kb * 1024),
+            "source_branch": "feature",
+            "target_branch": "main",
+            "target_project_id": 1,
+            "url": "http://gitlab.example.com/group/bench-repo/-/merge_requests/1",
+            "last_commit": {"id": "0" * 40},
+        },
+    }).encode("utf-8")
+
+
+def run(url: str, payload: bytes, concurrency: int, duration: float, token: str):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    headers = {"Content-Type": "application/json", "X-Gitlab-Token": token}
+
+    def client():
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            req = urllib.request.Request(url, data=payload, headers=headers, method="POST")
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req, timeout=10) as resp:
+                    resp.read()
+                local.append(time.perf_counter() - started)
+            except (urllib.error.URLError, OSError):
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return latencies, errors[0], elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5003/reasoning/webhook")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--action", default="close", help="MR action，close 在入队前被过滤，open 会入队")
+    parser.add_argument("--payload-kb", type=int, default=256, help="description 字段大小 (KB)")
+    parser.add_argument("--token", default="bench")
+    args = parser.parse_args(argv)
+
+    payload = build_payload(args.action, args.payload_kb)
+    latencies, errors, elapsed = run(args.url, payload, args.concurrency, args.duration, args.token)
+    if not latencies:
+        print(f"no successful requests ({errors} errors)")
+        return 1
+    latencies.sort()
+    ms = [x * 1000 for x in latencies]
+    print(f"payload={len(payload) / 1024:.0f}KB concurrency={args.concurrency} duration={elapsed:.1f}s")
+    print(f"requests={len(ms)} errors={errors} rps={len(ms) / elapsed:.1f}")
+    print(
+        f"latency ms: p50={statistics.median(ms):.1f} "
+        f"p95={ms[int(len(ms) * 0.95) - 1]:.1f} p99={ms[int(len(ms) * 0.99) - 1]:.1f} max={ms[-1]:.1f}"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
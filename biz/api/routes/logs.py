@@ -0,0 +1,148 @@
+"""
+业务推理日志读取接口（供其他内部系统拉取变更流）：
+
+- GET /reasoning/logs：列表，筛选参数与 Dashboard 一致（platform、repo、author 可重复、since、until、q），
+  fields 选择返回字段，按 id 倒序 keyset 分页（cursor 为上一页返回的 next_cursor）
+- GET /reasoning/logs/<id>：单条记录，include_raw=1 时附带 LLM 原始输出
+- GET /reasoning/logs/facets：筛选条件下各维度的记录数
+
+响应带弱 ETag（由数据版本与请求参数生成），轮询方携带 If-None-Match 时无新数据直接返回 304；
+客户端接受 gzip 且响应较大时压缩返回。
+"""
+import datetime
+import gzip
+import hashlib
+import os
+from typing import Optional
+
+from flask import Blueprint, Response, jsonify, request
+
+from biz.service.storage_service import API_FIELDS, LOG_COLUMNS, StorageService
+
+logs_bp = Blueprint("logs", __name__)
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+# 小于该大小（字节）的响应不压缩
+GZIP_MIN_BYTES = int(os.getenv("API_GZIP_MIN_BYTES", "1024"))
+
+
+def _ts(value: Optional[str]) -> Optional[int]:
+    """YYYY-MM-DD（本地时区当天零点）或 Unix 时间戳"""
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    return int(datetime.datetime.strptime(value, "%Y-%m-%d").timestamp())
+
+
+def _filters() -> dict:
+    return {
+        "platform": request.args.get("platform") or None,
+        "repo_names": request.args.getlist("repo") or None,
+        "authors": request.args.getlist("author") or None,
+        "created_at_gte": _ts(request.args.get("since")),
+        "created_at_lte": _ts(request.args.get("until")),
+    }
+
+
+def _etag() -> str:
+    """数据版本（变更计数、最大 id）+ 请求路径与参数；新增、删除及原地改写记录时均变化"""
+    changes, max_id = StorageService.get_data_version()
+    digest = hashlib.sha1(request.full_path.encode("utf-8")).hexdigest()[:16]
+    return f'W/"{max_id}-{changes}-{digest}"'
+
+
+def _not_modified(etag: str) -> bool:
+    return etag in [t.strip() for t in request.headers.get("If-None-Match", "").split(",")]
+
+
+def _respond(payload, etag: str):
+    response = jsonify(payload)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def _cached(build):
+    """ETag 命中时直接返回 304，不执行查询"""
+    etag = _etag()
+    if _not_modified(etag):
+        return Response(status=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+    return build(etag)
+
+
+@logs_bp.after_request
+def _gzip(response):
+    if response.direct_passthrough or "Content-Encoding" in response.headers:
+        return response
+    if response.status_code == 304:
+        # 304 需带上与 200 相同的 Vary，缓存才会按编码区分条目
+        response.vary.add("Accept-Encoding")
+        return response
+    if response.status_code != 200:
+        return response
+    # 是否压缩取决于请求的 Accept-Encoding（及响应大小），不压缩的响应同样需要 Vary，
+    # 否则共享缓存可能把未压缩版本发给支持 gzip 的客户端，或反之
+    response.vary.add("Accept-Encoding")
+    if "gzip" not in request.headers.get("Accept-Encoding", "").lower():
+        return response
+    data = response.get_data()
+    if len(data) < GZIP_MIN_BYTES:
+        return response
+    response.set_data(gzip.compress(data, compresslevel=5))
+    response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@logs_bp.route("/reasoning/logs", methods=["GET"])
+def list_logs():
+    try:
+        filters = _filters()
+        limit = min(max(request.args.get("limit", DEFAULT_LIMIT, type=int), 1), MAX_LIMIT)
+        cursor = request.args.get("cursor", type=int)
+        fields = tuple(f.strip() for f in request.args.get("fields", "").split(",") if f.strip()) or ("id",) + LOG_COLUMNS
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    invalid = [f for f in fields if f not in API_FIELDS]
+    if invalid:
+        return jsonify({"error": f"Unsupported fields: {invalid}", "fields": list(API_FIELDS)}), 400
+
+    def build(etag):
+        # 始终查询 id 用于生成游标，多取一条判断是否还有下一页
+        query_fields = fields if "id" in fields else ("id",) + fields
+        rows = StorageService.query_logs(
+            query_fields, keyword=request.args.get("q"), before_id=cursor, limit=limit + 1, **filters
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"] if has_more else None
+        if "id" not in fields:
+            for row in rows:
+                del row["id"]
+        return _respond({"items": rows, "next_cursor": next_cursor}, etag)
+
+    return _cached(build)
+
+
+@logs_bp.route("/reasoning/logs/facets", methods=["GET"])
+def get_facets():
+    try:
+        filters = _filters()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = min(max(request.args.get("limit", 50, type=int), 1), MAX_LIMIT)
+    return _cached(lambda etag: _respond(StorageService.get_facets(limit=limit, **filters), etag))
+
+
+@logs_bp.route("/reasoning/logs/<int:log_id>", methods=["GET"])
+def get_log(log_id: int):
+    include_raw = request.args.get("include_raw", "").lower() in ("1", "true")
+
+    def build(etag):
+        row = StorageService.get_log(log_id, include_raw=include_raw)
+        if row is None:
+            return jsonify({"error": "Not found"}), 404
+        return _respond(row, etag)
+
+    return _cached(build)
@@ -0,0 +1,24 @@
+from flask import Blueprint, abort, jsonify, request, send_file
+
+from biz.utils.profiling import list_profiles, profile_file
+
+profiles_bp = Blueprint("profiles", __name__)
+
+_MIMETYPES = {"txt": "text/plain; charset=utf-8", "json": "application/json", "prof": "application/octet-stream"}
+
+
+@profiles_bp.route("/reasoning/profiles", methods=["GET"])
+def get_profiles():
+    """已保存的任务剖析结果（按时间倒序），可按 platform / repo 过滤"""
+    limit = min(request.args.get("limit", 100, type=int), 1000)
+    return jsonify(list_profiles(request.args.get("platform"), request.args.get("repo"), limit))
+
+
+@profiles_bp.route("/reasoning/profiles/<path:name>", methods=["GET"])
+def get_profile(name: str):
+    """获取单个剖析结果：format=txt（默认，报告）| prof（cProfile 原始数据）| json（摘要）"""
+    fmt = request.args.get("format", "txt")
+    path = profile_file(name, fmt)
+    if path is None:
+        abort(404)
+    return send_file(path, mimetype=_MIMETYPES[fmt], as_attachment=fmt == "prof")
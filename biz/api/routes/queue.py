@@ -0,0 +1,16 @@
+from flask import Blueprint, jsonify
+
+from biz.service.deferral_service import in_offpeak_window
+from biz.service.storage_service import StorageService
+from biz.utils.queue import queue_metrics
+
+queue_bp = Blueprint("queue", __name__)
+
+
+@queue_bp.route("/reasoning/queue/metrics", methods=["GET"])
+def get_queue_metrics():
+    """各优先级通道的排队数、执行数与等待时间分位数；多进程部署时为处理本次请求的进程的数据"""
+    metrics = queue_metrics()
+    # 错峰延迟队列保存在数据库中，所有进程共享
+    metrics["deferred"] = {**StorageService.get_deferred_stats(), "in_offpeak_window": in_offpeak_window()}
+    return jsonify(metrics)
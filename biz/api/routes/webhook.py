@@ -2,6 +2,8 @@
 Webhook 路由：支持 GitLab、GitHub、Gitea 多平台 MR/PR
 """
 import os
+import time
+from typing import Optional, Tuple
 from urllib.parse import urlparse
 
 from flask import Blueprint, request, jsonify
@@ -9,42 +11,98 @@ from flask import Blueprint, request, jsonify
 from biz.platforms.gitlab.webhook_handler import (
     MergeRequestHandler as GitLabMRHandler,
     filter_changes as gitlab_filter_changes,
+    slim_webhook_data as gitlab_slim_webhook_data,
 )
 from biz.platforms.github.webhook_handler import (
     PullRequestHandler as GitHubPRHandler,
     filter_changes as github_filter_changes,
+    slim_webhook_data as github_slim_webhook_data,
 )
 from biz.platforms.gitea.webhook_handler import (
     PullRequestHandler as GiteaPRHandler,
     filter_changes as gitea_filter_changes,
+    slim_webhook_data as gitea_slim_webhook_data,
 )
-from biz.queue.worker import handle_merge_request_event
+from biz.utils import json_util
 from biz.utils.log import logger
-from biz.utils.queue import handle_queue
+from biz.utils.queue import job_lane, submit_job
 
 webhook_bp = Blueprint("webhook", __name__)
 
+# Webhook 响应耗时预算（毫秒），超出时告警；平台对慢响应会标记 Webhook 失败
+WEBHOOK_LATENCY_BUDGET_MS = float(os.getenv("WEBHOOK_LATENCY_BUDGET_MS", "200"))
 
-def _run_gitlab(data: dict, token: str, url: str):
+GITLAB_UPDATE_FIELDS = ("draft", "work_in_progress", "target_branch")
+GITHUB_ACTIONS = ("opened", "synchronize")
+GITEA_ACTIONS = ("opened", "open", "reopened", "synchronize", "synchronized")
+# 各平台 token 的环境变量；配置了环境变量时任务参数不携带 token，执行时重新读取
+TOKEN_ENVS = {"gitlab": "GITLAB_ACCESS_TOKEN", "github": "GITHUB_ACCESS_TOKEN", "gitea": "GITEA_ACCESS_TOKEN"}
+
+
+def _classify_gitlab(data: dict, token: str, url: str) -> Tuple[Optional[dict], str]:
+    """入队前过滤：返回 (轻量任务描述, "") 或 (None, 忽略原因)"""
     if not token:
-        logger.error("Missing GitLab token")
-        return
+        return None, "missing GitLab token"
     if not url:
-        repo = data.get("repository") or {}
-        homepage = repo.get("homepage", "")
-        if homepage:
-            p = urlparse(homepage)
-            url = f"{p.scheme}://{p.netloc}/"
-        else:
-            logger.error("Missing GitLab URL")
-            return
-    attrs = data.get("object_attributes", {})
+        return None, "missing GitLab URL"
+    attrs = data.get("object_attributes") or {}
     if attrs.get("draft") or attrs.get("work_in_progress"):
-        logger.info("Draft MR, skip")
-        return
-    if attrs.get("action") not in ("open", "update"):
-        return
+        return None, "draft MR"
+    action = attrs.get("action")
+    if action not in ("open", "update"):
+        return None, f"action {action}"
+    # update 事件仅在推送新提交时携带 oldrev；标记为 Ready、修改目标分支同样需要处理，
+    # 其余标签/指派/标题编辑等直接忽略
+    if action == "update" and not attrs.get("oldrev"):
+        changed = data.get("changes") or {}
+        if not any(k in changed for k in GITLAB_UPDATE_FIELDS):
+            return None, "update without new commits"
+    return gitlab_slim_webhook_data(data), ""
+
+
+def _classify_github(data: dict, token: str) -> Tuple[Optional[dict], str]:
+    if not token:
+        return None, "missing GitHub token"
+    action = data.get("action")
+    if action not in GITHUB_ACTIONS:
+        return None, f"action {action}"
+    return github_slim_webhook_data(data), ""
+
+
+def _classify_gitea(data: dict, token: str) -> Tuple[Optional[dict], str]:
+    if not token:
+        return None, "missing Gitea token"
+    action = data.get("action")
+    if action not in GITEA_ACTIONS:
+        return None, f"action {action}"
+    return gitea_slim_webhook_data(data), ""
+
+
+def _diff_sources(platform: str, handler, token: str):
+    """DIFF_SOURCE=git_mirror 时改用本地镜像计算 diff/提交，否则使用平台 API"""
+    from biz.platforms.git_mirror import mirror_sources
+
+    return mirror_sources(
+        platform,
+        handler.repo_name,
+        handler.repo_full_name,
+        handler.clone_url,
+        token,
+        handler.request_number,
+        handler.target_branch,
+        handler.last_commit_id,
+        handler.get_changes,
+        handler.get_commits,
+    )
+
+
+def _run_gitlab(data: dict, token: str, url: str):
+    # Worker 依赖（LLM SDK、yaml 等）只在子进程中导入，API 进程保持轻量
+    from biz.queue.worker import handle_merge_request_event
+
+    token = token or os.getenv(TOKEN_ENVS["gitlab"], "")
     handler = GitLabMRHandler(data, token, url)
+    get_changes, get_commits = _diff_sources("gitlab", handler, token)
     handle_merge_request_event(
         platform="gitlab",
         repo_name=handler.repo_name,
@@ -55,19 +113,18 @@ def _run_gitlab(data: dict, token: str, url: str):
         target_branch=handler.target_branch,
         last_commit_id=handler.last_commit_id,
         author=handler.author,
-        get_changes=handler.get_changes,
-        get_commits=handler.get_commits,
+        get_changes=get_changes,
+        get_commits=get_commits,
         filter_changes_fn=gitlab_filter_changes,
     )
 
 
 def _run_github(data: dict, token: str, url: str):
-    if not token:
-        logger.error("Missing GitHub token")
-        return
-    if data.get("action") not in ("opened", "synchronize"):
-        return
+    from biz.queue.worker import handle_merge_request_event
+
+    token = token or os.getenv(TOKEN_ENVS["github"], "")
     handler = GitHubPRHandler(data, token, url)
+    get_changes, get_commits = _diff_sources("github", handler, token)
     handle_merge_request_event(
         platform="github",
         repo_name=handler.repo_name,
@@ -78,20 +135,18 @@ def _run_github(data: dict, token: str, url: str):
         target_branch=handler.target_branch,
         last_commit_id=handler.last_commit_id,
         author=handler.author,
-        get_changes=handler.get_changes,
-        get_commits=handler.get_commits,
+        get_changes=get_changes,
+        get_commits=get_commits,
         filter_changes_fn=github_filter_changes,
     )
 
 
 def _run_gitea(data: dict, token: str, url: str):
-    if not token:
-        logger.error("Missing Gitea token")
-        return
-    action = data.get("action", "")
-    if action not in ("opened", "open", "reopened", "synchronize", "synchronized"):
-        return
+    from biz.queue.worker import handle_merge_request_event
+
+    token = token or os.getenv(TOKEN_ENVS["gitea"], "")
     handler = GiteaPRHandler(data, token, url)
+    get_changes, get_commits = _diff_sources("gitea", handler, token)
     handle_merge_request_event(
         platform="gitea",
         repo_name=handler.repo_name,
@@ -102,18 +157,53 @@ def _run_gitea(data: dict, token: str, url: str):
         target_branch=handler.target_branch,
         last_commit_id=handler.last_commit_id,
         author=handler.author,
-        get_changes=handler.get_changes,
-        get_commits=handler.get_commits,
+        get_changes=get_changes,
+        get_commits=get_commits,
         filter_changes_fn=gitea_filter_changes,
     )
 
 
+def _enqueue(platform: str, run, handler_cls, job: dict, token: str, url: str):
+    """
+    按仓库与优先级通道入队（目标分支 / 作者决定通道），同一仓库的任务在调度器中轮转。
+    token 来自环境变量时任务参数不含 token（子进程执行时重新读取），可写入任务表；
+    来自请求头时只在内存中排队，不落盘。
+    """
+    handler = handler_cls(job, token, url)
+    configured = bool(os.getenv(TOKEN_ENVS[platform]))
+    submit_job(
+        run,
+        (job, None if configured else token, url),
+        repo=f"{platform}/{handler.repo_full_name}",
+        lane=job_lane(handler.target_branch, handler.author),
+        journal=configured,
+    )
+
+
+def _ignored(platform: str, reason: str):
+    logger.info(f"{platform} event ignored: {reason}")
+    return jsonify({"message": f"{platform} event ignored: {reason}"}), 200
+
+
 @webhook_bp.route("/reasoning/webhook", methods=["POST"])
 def handle_webhook():
+    """仅做 解析 -> 校验/过滤 -> 入队，不做任何网络或数据库访问"""
+    started = time.perf_counter()
+    resp = _handle_webhook()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if elapsed_ms > WEBHOOK_LATENCY_BUDGET_MS:
+        logger.warn(f"Webhook handling took {elapsed_ms:.1f}ms (budget {WEBHOOK_LATENCY_BUDGET_MS:.0f}ms)")
+    return resp
+
+
+def _handle_webhook():
     if not request.is_json:
         return jsonify({"error": "Invalid JSON"}), 400
-    data = request.get_json()
-    if not data:
+    try:
+        data = json_util.loads(request.get_data(cache=False))
+    except ValueError:
+        return jsonify({"error": "Invalid JSON"}), 400
+    if not data or not isinstance(data, dict):
         return jsonify({"error": "Invalid JSON"}), 400
 
     gh = request.headers.get("X-GitHub-Event")
@@ -121,27 +211,37 @@ def handle_webhook():
 
     if gitea:
         if gitea == "pull_request":
-            tok = os.getenv("GITEA_ACCESS_TOKEN") or request.headers.get("X-Gitea-Token")
+            tok = os.getenv("GITEA_ACCESS_TOKEN") or request.headers.get("X-Gitea-Token") or ""
             url = os.getenv("GITEA_URL", "https://gitea.com")
-            handle_queue(_run_gitea, data, tok or "", url)
+            job, reason = _classify_gitea(data, tok)
+            if job is None:
+                return _ignored("Gitea", reason)
+            _enqueue("gitea", _run_gitea, GiteaPRHandler, job, tok, url)
             return jsonify({"message": "Gitea PR received, processing async."}), 200
         return jsonify({"error": "Only pull_request supported"}), 400
 
     if gh:
         if gh == "pull_request":
-            tok = os.getenv("GITHUB_ACCESS_TOKEN") or request.headers.get("X-GitHub-Token")
+            tok = os.getenv("GITHUB_ACCESS_TOKEN") or request.headers.get("X-GitHub-Token") or ""
             url = os.getenv("GITHUB_URL", "https://github.com")
-            handle_queue(_run_github, data, tok or "", url)
+            job, reason = _classify_github(data, tok)
+            if job is None:
+                return _ignored("GitHub", reason)
+            _enqueue("github", _run_github, GitHubPRHandler, job, tok, url)
             return jsonify({"message": "GitHub PR received, processing async."}), 200
         return jsonify({"error": "Only pull_request supported"}), 400
 
     if data.get("object_kind") == "merge_request":
-        tok = os.getenv("GITLAB_ACCESS_TOKEN") or request.headers.get("X-Gitlab-Token")
+        tok = os.getenv("GITLAB_ACCESS_TOKEN") or request.headers.get("X-Gitlab-Token") or ""
         url = os.getenv("GITLAB_URL") or request.headers.get("X-Gitlab-Instance") or ""
-        if not url and data.get("repository", {}).get("homepage"):
-            p = urlparse(data["repository"]["homepage"])
+        homepage = (data.get("repository") or {}).get("homepage")
+        if not url and homepage:
+            p = urlparse(homepage)
             url = f"{p.scheme}://{p.netloc}/"
-        handle_queue(_run_gitlab, data, tok or "", url)
+        job, reason = _classify_gitlab(data, tok, url)
+        if job is None:
+            return _ignored("GitLab", reason)
+        _enqueue("gitlab", _run_gitlab, GitLabMRHandler, job, tok, url)
         return jsonify({"message": "GitLab MR received, processing async."}), 200
 
     return jsonify({"error": "Unsupported event or platform"}), 400
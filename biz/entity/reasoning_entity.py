@@ -24,6 +24,12 @@ class BusinessReasoningEntity:
         request_url: Optional[str] = None,
         request_title: Optional[str] = None,
         diff_summary: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        cached_tokens: Optional[int] = None,
+        llm_latency_ms: Optional[int] = None,
+        near_dup_of: Optional[int] = None,
+        near_dup_similarity: Optional[float] = None,
     ):
         self.platform = platform
         self.repo_name = repo_name
@@ -40,3 +46,11 @@ class BusinessReasoningEntity:
         self.reasoning_categories = reasoning_categories
         self.reasoning_details = reasoning_details
         self.raw_reasoning_json = raw_reasoning_json
+        # LLM 用量：cached_tokens 为供应商报告的前缀缓存命中 token 数
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.cached_tokens = cached_tokens
+        self.llm_latency_ms = llm_latency_ms
+        # 近似重复：复用或参考的历史记录 id 与估计相似度
+        self.near_dup_of = near_dup_of
+        self.near_dup_similarity = near_dup_similarity
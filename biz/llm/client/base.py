@@ -3,6 +3,9 @@ from typing import Any, Dict, List, Optional
 
 
 class BaseClient:
+    # 最近一次调用的用量：prompt_tokens / completion_tokens / cached_tokens / latency_ms，供应商未返回时为 None
+    last_usage: Optional[Dict[str, int]] = None
+
     @abstractmethod
     def completions(self, messages: List[Dict[str, Any]], model: Optional[str] = None) -> str:
         pass
@@ -1,4 +1,5 @@
 import os
+import time
 from typing import Any, Dict, List, Optional
 
 from openai import OpenAI
@@ -19,12 +20,35 @@ class DeepSeekClient(BaseClient):
     def completions(
         self, messages: List[Dict[str, Any]], model: Optional[str] = None
     ) -> str:
+        self.last_usage = None
         try:
             m = model or self.default_model
+            started = time.perf_counter()
             completion = self.client.chat.completions.create(model=m, messages=messages)
+            self.last_usage = _usage(completion, int((time.perf_counter() - started) * 1000))
             if not completion or not completion.choices:
                 return "AI服务返回为空"
             return completion.choices[0].message.content or ""
         except Exception as e:
             logger.error(f"DeepSeek API error: {e}")
             raise
+
+
+def _usage(completion, latency_ms: int) -> Dict[str, int]:
+    """
+    提取用量与前缀缓存命中：DeepSeek 返回 usage.prompt_cache_hit_tokens，
+    OpenAI 兼容接口返回 usage.prompt_tokens_details.cached_tokens
+    """
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return {"latency_ms": latency_ms}
+    cached = getattr(usage, "prompt_cache_hit_tokens", None)
+    if cached is None:
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", None) if details is not None else None
+    return {
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "cached_tokens": cached,
+        "latency_ms": latency_ms,
+    }
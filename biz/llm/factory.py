@@ -1,7 +1,6 @@
 import os
 
 from biz.llm.client.base import BaseClient
-from biz.llm.client.deepseek import DeepSeekClient
 from biz.utils.log import logger
 
 
@@ -10,5 +9,7 @@ class Factory:
     def get_client(provider: str = None) -> BaseClient:
         provider = (provider or os.getenv("LLM_PROVIDER", "deepseek")).lower()
         if provider == "deepseek":
+            # openai SDK 较重，仅在真正创建客户端时导入
+            from biz.llm.client.deepseek import DeepSeekClient
             return DeepSeekClient()
         raise ValueError(f"Unknown LLM provider: {provider}")
@@ -1 +1,5 @@
 """多平台 MR/PR Handler，统一返回平台无关字段"""
+
+
+class ChangesIncompleteError(Exception):
+    """分页读取 changes 时后续页多次重试仍失败；已读取部分不完整，任务失败而不是按部分 diff 推理入库"""
@@ -0,0 +1,375 @@
+"""
+本地 Git 镜像 diff 源：为配置的仓库维护本地 bare 镜像，每次事件增量 fetch MR/PR head，
+在 merge-base..head 之间本地计算 diff 与提交列表，不依赖平台 changes/files API（无截断、无限流）。
+
+输出格式与平台 API 一致（GitLab changes 字段 + GitHub/Gitea status 字段），
+可直接替换 Handler 的 get_changes/get_commits 传给 handle_merge_request_event。
+
+环境变量：
+- DIFF_SOURCE：api（默认）| git_mirror
+- GIT_MIRROR_DIR：镜像根目录，默认 data/mirrors
+- GIT_MIRROR_REPOS：启用镜像的仓库（name 或 full_name），逗号分隔；为空表示全部
+- GIT_MIRROR_TIMEOUT：单条 git 命令超时（秒），默认 300
+
+clone 地址来自 webhook 请求体，只接受与 GITLAB_URL / GITHUB_URL / GITEA_URL 协议及主机一致的 http(s) 地址，
+否则不使用镜像（token 不会发往其他主机，也不会把任意字符串作为参数传给 git）。
+"""
+import base64
+import os
+import re
+import subprocess
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from biz.utils.diff_budget import max_file_diff_size, truncation_note
+from biz.utils.diff_parser import count_changes
+from biz.utils.log import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows 下不加锁
+    fcntl = None
+
+# 各平台 MR/PR head 的服务端 ref
+HEAD_REFS = {
+    "gitlab": "refs/merge-requests/{number}/head",
+    "github": "refs/pull/{number}/head",
+    "gitea": "refs/pull/{number}/head",
+}
+# 通过 HTTPS 拉取时的 Basic 认证用户名（token 作为密码）
+AUTH_USERS = {"gitlab": "oauth2", "github": "x-access-token", "gitea": "oauth2"}
+# 各平台实例地址（环境变量, 默认值），clone 地址须与其协议、主机一致；GitLab 未配置时不启用镜像
+PLATFORM_URLS = {
+    "gitlab": ("GITLAB_URL", ""),
+    "github": ("GITHUB_URL", "https://github.com"),
+    "gitea": ("GITEA_URL", "https://gitea.com"),
+}
+_SHA_RE = re.compile(r"[0-9a-fA-F]{7,64}")
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class GitMirrorError(Exception):
+    pass
+
+
+def is_enabled(repo_name: str, repo_full_name: str = "") -> bool:
+    if os.getenv("DIFF_SOURCE", "api").lower() != "git_mirror":
+        return False
+    repos = [r.strip() for r in os.getenv("GIT_MIRROR_REPOS", "").split(",") if r.strip()]
+    return not repos or repo_name in repos or (repo_full_name and repo_full_name in repos)
+
+
+def trusted_clone_url(platform: str, clone_url: str) -> bool:
+    """clone 地址是否为配置的平台实例下的 http(s) 地址（不含用户信息，协议与主机端口一致）"""
+    env, default = PLATFORM_URLS.get(platform, ("", ""))
+    base = os.getenv(env, default) if env else ""
+    if not base or not clone_url or clone_url.startswith("-"):
+        return False
+    try:
+        url, expected = urlparse(clone_url), urlparse(base)
+        port, expected_port = url.port, expected.port
+    except ValueError:
+        return False
+    return (
+        url.scheme in ("http", "https")
+        and url.scheme == expected.scheme
+        and "@" not in url.netloc
+        and bool(url.hostname)
+        and url.hostname == expected.hostname
+        and port == expected_port
+    )
+
+
+def _mirror_root() -> str:
+    root = os.getenv("GIT_MIRROR_DIR", "data/mirrors")
+    return root if os.path.isabs(root) else os.path.join(_BASE_DIR, root)
+
+
+class GitMirror:
+    def __init__(self, platform: str, repo_full_name: str, clone_url: str, token: str):
+        self.platform = platform
+        self.clone_url = clone_url
+        self.token = token
+        safe_name = repo_full_name.strip("/").replace("/", "__") or "repo"
+        self.path = os.path.join(_mirror_root(), platform, safe_name + ".git")
+        self.timeout = int(os.getenv("GIT_MIRROR_TIMEOUT", "300"))
+        self._ranges = {}
+
+    def _auth_env(self) -> dict:
+        """
+        通过环境变量注入 http.extraHeader 传递 token（需 git >= 2.31），
+        不出现在命令行参数（ps、/proc/*/cmdline 可见）、镜像配置或 git 的错误输出中
+        """
+        env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+        if not self.token or not trusted_clone_url(self.platform, self.clone_url):
+            return env
+        user = AUTH_USERS.get(self.platform, "oauth2")
+        credential = base64.b64encode(f"{user}:{self.token}".encode("utf-8")).decode("ascii")
+        env.update({
+            "GIT_CONFIG_COUNT": "1",
+            "GIT_CONFIG_KEY_0": "http.extraHeader",
+            "GIT_CONFIG_VALUE_0": f"Authorization: Basic {credential}",
+        })
+        return env
+
+    def _redact(self, text: str) -> str:
+        return text.replace(self.token, "***") if self.token else text
+
+    def _run(self, cmd: List[str], env: Optional[dict] = None, name: str = "") -> str:
+        name = name or cmd[1]
+        try:
+            proc = subprocess.run(cmd, capture_output=True, timeout=self.timeout, env=env)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise GitMirrorError(self._redact(f"git {name} failed: {e}"))
+        if proc.returncode != 0:
+            err = proc.stderr.decode("utf-8", "replace").strip()
+            raise GitMirrorError(self._redact(f"git {name} failed: {err}"))
+        return proc.stdout.decode("utf-8", "replace")
+
+    def _git(self, *args: str, env: Optional[dict] = None) -> str:
+        return self._run(["git", "-c", "core.quotepath=false", "--git-dir", self.path, *args], env=env, name=args[0])
+
+    @contextmanager
+    def _locked(self):
+        """同一镜像的 fetch 串行执行，避免 ref 锁冲突"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".lock", "w") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def fetch(self, request_number, target_branch: str) -> Tuple[str, str]:
+        """增量拉取目标分支与 MR/PR head，返回 (目标分支本地 ref, head 本地 ref)"""
+        head_ref = HEAD_REFS[self.platform].format(number=request_number)
+        local_target = f"refs/remotes/origin/{target_branch}"
+        local_head = f"refs/mr/{request_number}"
+        if not trusted_clone_url(self.platform, self.clone_url):
+            raise GitMirrorError(f"untrusted clone URL for mirror {self.path}")
+        try:
+            with self._locked():
+                if not os.path.exists(os.path.join(self.path, "HEAD")):
+                    # git 缺失、目录只读等同样抛出 GitMirrorError，由调用方回退到平台 API
+                    self._run(["git", "init", "--bare", "-q", self.path])
+                # -- 之后的参数不会被当作选项解析
+                self._git(
+                    "fetch", "--no-tags", "--force", "--quiet", "--", self.clone_url,
+                    f"+refs/heads/{target_branch}:{local_target}",
+                    f"+{head_ref}:{local_head}",
+                    env=self._auth_env(),
+                )
+        except OSError as e:
+            # 创建镜像目录或锁文件失败
+            raise GitMirrorError(f"mirror {self.path} unavailable: {e}")
+        return local_target, local_head
+
+    def _range(self, request_number, target_branch: str, head_sha: str) -> Tuple[str, str]:
+        """(merge-base, head)，同一任务内 changes 与 commits 共用一次 fetch"""
+        key = (request_number, target_branch, head_sha)
+        if key not in self._ranges:
+            try:
+                self._ranges[key] = self._resolve_range(request_number, target_branch, head_sha)
+            except GitMirrorError as e:
+                # 失败结果同样缓存，commits 直接回退而不再重复 fetch
+                self._ranges[key] = e
+        if isinstance(self._ranges[key], GitMirrorError):
+            raise self._ranges[key]
+        return self._ranges[key]
+
+    def _resolve_range(self, request_number, target_branch: str, head_sha: str) -> Tuple[str, str]:
+        local_target, local_head = self.fetch(request_number, target_branch)
+        head = local_head
+        if head_sha and not _SHA_RE.fullmatch(head_sha):
+            logger.warn(f"Invalid commit id {head_sha!r} in event, using {local_head}")
+        elif head_sha:
+            # 事件中的提交优先；head 已前移时仍按事件对应的提交计算
+            try:
+                self._git("cat-file", "-e", f"{head_sha}^{{commit}}")
+                head = head_sha
+            except GitMirrorError:
+                logger.warn(f"Commit {head_sha} not in mirror, using {local_head}")
+        base = self._git("merge-base", local_target, head).strip()
+        return base, head
+
+    def get_changes(self, request_number, target_branch: str, head_sha: str) -> Iterator[dict]:
+        # fetch/merge-base 立即执行，diff 本身按文件流式产出
+        base, head = self._range(request_number, target_branch, head_sha)
+        return self._iter_diff(base, head)
+
+    def get_commits(self, request_number, target_branch: str, head_sha: str) -> List[dict]:
+        base, head = self._range(request_number, target_branch, head_sha)
+        # GitLab API 按时间倒序返回提交，GitHub/Gitea 为正序，保持一致
+        order = [] if self.platform == "gitlab" else ["--reverse"]
+        out = self._git("log", "--no-color", *order, "--format=%H%x1f%s%x1f%B%x1e", f"{base}..{head}")
+        commits = []
+        for record in out.split("\x1e"):
+            record = record.strip("\n")
+            if not record:
+                continue
+            sha, title, message = (record.split("\x1f") + ["", ""])[:3]
+            commits.append({"id": sha, "title": title, "message": message.strip()})
+        return commits
+
+    def _iter_diff(self, base: str, head: str) -> Iterator[dict]:
+        """流式读取 git diff 输出，按文件产出平台格式的 change；单文件超过 MAX_FILE_DIFF_KB 的部分只计数不保留"""
+        limit = max_file_diff_size()
+        cmd = [
+            "git", "-c", "core.quotepath=false", "--git-dir", self.path,
+            "diff", "--no-color", "--no-ext-diff", "-M", base, head,
+        ]
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        current = None
+        try:
+            for raw in proc.stdout:
+                line = raw.decode("utf-8", "replace")
+                if line.startswith("diff --git "):
+                    if current is not None:
+                        yield _finish(current)
+                    current = _new_change(line)
+                elif current is None:
+                    continue
+                elif current["size"] or line.startswith("@@"):
+                    _add_line(current, line, len(raw), limit)
+                else:
+                    _parse_header(current, line)
+            # 先确认 git diff 成功再产出最后一个文件，失败时不会产出不完整的内容
+            if proc.wait() != 0:
+                raise GitMirrorError(f"git diff {base}..{head} failed")
+            if current is not None:
+                yield _finish(current)
+        finally:
+            # 调用方提前停止迭代时结束子进程
+            if proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+
+
+def _new_change(line: str) -> dict:
+    # diff --git a/old b/new（路径含空格时以 +++/--- 或 rename 行为准）
+    paths = line[len("diff --git "):].rstrip("\n")
+    old_path, _, new_path = paths.partition(" b/")
+    return {
+        "old_path": old_path[2:] if old_path.startswith("a/") else old_path,
+        "new_path": new_path,
+        "new_file": False,
+        "deleted_file": False,
+        "renamed_file": False,
+        "binary": False,
+        "lines": [],
+        "size": 0,
+        "dropped": None,
+    }
+
+
+def _add_line(change: dict, line: str, size: int, limit: int):
+    """size 为该行原始输出的字节数"""
+    change["size"] += size
+    if change["dropped"] is None and change["size"] <= limit:
+        change["lines"].append(line)
+        return
+    # 超出单文件上限：不再保留内容，只统计被丢弃部分的增删行数
+    if change["dropped"] is None:
+        change["dropped"] = [0, 0]
+    if line.startswith("+") and not line.startswith("+++"):
+        change["dropped"][0] += 1
+    elif line.startswith("-") and not line.startswith("---"):
+        change["dropped"][1] += 1
+
+
+def _parse_header(change: dict, line: str):
+    value = line.rstrip("\n")
+    if value.startswith("new file mode"):
+        change["new_file"] = True
+    elif value.startswith("deleted file mode"):
+        change["deleted_file"] = True
+    elif value.startswith("rename from "):
+        change["old_path"] = value[len("rename from "):]
+        change["renamed_file"] = True
+    elif value.startswith("rename to "):
+        change["new_path"] = value[len("rename to "):]
+        change["renamed_file"] = True
+    elif value.startswith("--- a/"):
+        # 含空格的路径，git 会在行尾追加制表符
+        change["old_path"] = value[len("--- a/"):].rstrip("\t")
+    elif value.startswith("+++ b/"):
+        change["new_path"] = value[len("+++ b/"):].rstrip("\t")
+    elif value.startswith("Binary files "):
+        change["binary"] = True
+
+
+def _finish(change: dict) -> dict:
+    if change["deleted_file"]:
+        change["new_path"] = change["old_path"]
+        status = "removed"
+    elif change["new_file"]:
+        status = "added"
+    elif change["renamed_file"]:
+        status = "renamed"
+    else:
+        status = "modified"
+    diff = "".join(change.pop("lines"))
+    size, dropped = change.pop("size"), change.pop("dropped")
+    if change.pop("binary"):
+        diff = ""
+    elif dropped is not None:
+        additions, deletions = count_changes(diff)
+        change["additions"] = additions + dropped[0]
+        change["deletions"] = deletions + dropped[1]
+        change["truncated"] = True
+        diff += truncation_note(size, change["additions"], change["deletions"])
+    change.update({"diff": diff, "filename": change["new_path"], "status": status})
+    return change
+
+
+def mirror_sources(
+    platform: str,
+    repo_name: str,
+    repo_full_name: str,
+    clone_url: str,
+    token: str,
+    request_number,
+    target_branch: str,
+    head_sha: str,
+    get_changes: Callable[[], Iterable[dict]],
+    get_commits: Callable[[], List],
+) -> Tuple[Callable[[], Iterable[dict]], Callable[[], List]]:
+    """
+    启用镜像时返回基于本地镜像的 (get_changes, get_commits)，失败时自动回退到平台 API；
+    未启用、缺少 clone 地址或地址不属于配置的平台实例时原样返回。
+    """
+    if not clone_url or not request_number or not is_enabled(repo_name, repo_full_name):
+        return get_changes, get_commits
+    if not trusted_clone_url(platform, clone_url):
+        logger.warn(f"Untrusted clone URL for {repo_full_name or repo_name}, using platform API: {clone_url[:200]!r}")
+        return get_changes, get_commits
+    mirror = GitMirror(platform, repo_full_name or repo_name, clone_url, token)
+
+    def _with_fallback(local: Callable[..., Iterable], fallback: Callable[[], Iterable], what: str):
+        def run() -> Iterable:
+            try:
+                return local(request_number, target_branch, head_sha)
+            except GitMirrorError as e:
+                logger.warn(f"Git mirror {what} failed for {repo_full_name or repo_name}, fallback to API: {e}")
+                return fallback()
+        return run
+
+    def changes_with_fallback() -> Iterator[dict]:
+        # diff 为流式产出，git diff 的错误在迭代中才出现：尚未产出任何文件时回退 API，否则任务失败
+        yielded = False
+        try:
+            for change in mirror.get_changes(request_number, target_branch, head_sha):
+                yielded = True
+                yield change
+        except GitMirrorError as e:
+            if yielded:
+                raise
+            logger.warn(f"Git mirror changes failed for {repo_full_name or repo_name}, fallback to API: {e}")
+            yield from get_changes()
+
+    return changes_with_fallback, _with_fallback(mirror.get_commits, get_commits, "commits")
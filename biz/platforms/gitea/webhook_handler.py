@@ -2,37 +2,62 @@
 Gitea Pull Request Handler
 平台字段映射：number/index -> request_number, repository.name -> repo_name
 """
-import os
-import re
 import time
+from typing import Iterable, Iterator
 from urllib.parse import urljoin
 
-import requests
-
+from biz.platforms import ChangesIncompleteError
+from biz.utils.diff_parser import parse_change
 from biz.utils.log import logger
+from biz.utils.path_rules import get_path_rules
 
 PLATFORM = "gitea"
+# files 接口分页大小（不超过服务端 MAX_RESPONSE_ITEMS，默认 50）
+FILES_PER_PAGE = 50
 
 
-def filter_changes(changes: list) -> list:
-    """复用 SUPPORTED_EXTENSIONS"""
-    supported_extensions = os.getenv("SUPPORTED_EXTENSIONS", ".java,.py,.php").split(",")
-    result = []
+def filter_changes(changes: Iterable[dict]) -> Iterator[dict]:
+    """按 path_rules 过滤文件，逐个产出"""
+    rules = get_path_rules()
     for item in changes:
         status = (item.get("status") or "").lower()
         if status in ("removed", "deleted"):
             continue
         new_path = item.get("new_path") or item.get("filename") or item.get("path")
-        if not new_path or not any(new_path.endswith(ext) for ext in supported_extensions):
-            continue
         diff_text = item.get("diff") or item.get("patch") or ""
-        result.append({
+        if not rules.accept(new_path, diff_text):
+            continue
+        parsed = item.get("parsed") or parse_change(item)
+        yield {
             "diff": diff_text,
             "new_path": new_path,
-            "additions": item.get("additions", 0),
-            "deletions": item.get("deletions", 0),
-        })
-    return result
+            "additions": item.get("additions", parsed.additions),
+            "deletions": item.get("deletions", parsed.deletions),
+            "truncated": item.get("truncated", False),
+            "parsed": parsed,
+        }
+
+
+def slim_webhook_data(data: dict) -> dict:
+    """仅保留 PullRequestHandler 用到的字段，作为轻量任务描述入队"""
+    pr = data.get("pull_request") or {}
+    repo = data.get("repository") or {}
+    head = pr.get("head") or {}
+    user = pr.get("user") or {}
+    return {
+        "action": data.get("action"),
+        "pull_request": {
+            **{
+                k: pr[k]
+                for k in ("number", "index", "id", "html_url", "url", "title", "head_branch", "base_branch", "merge_base")
+                if k in pr
+            },
+            "head": {"ref": head.get("ref"), "sha": head.get("sha")},
+            "base": {"ref": (pr.get("base") or {}).get("ref")},
+            "user": {"login": user.get("login"), "username": user.get("username") or ""},
+        },
+        "repository": {k: repo[k] for k in ("name", "full_name", "clone_url") if k in repo},
+    }
 
 
 class PullRequestHandler:
@@ -46,6 +71,7 @@ class PullRequestHandler:
         repo = webhook_data.get("repository", {})
         self.repo_name = repo.get("name", "")
         self.repo_full_name = repo.get("full_name", self.repo_name)
+        self.clone_url = repo.get("clone_url", "")
         self.request_number = pr.get("number") or pr.get("index") or pr.get("id")  # Gitea: number or index
         self.request_url = pr.get("html_url") or pr.get("url", "")
         self.request_title = pr.get("title", "")
@@ -64,31 +90,53 @@ class PullRequestHandler:
             "Accept": "application/json",
         }
 
-    def get_changes(self) -> list:
+    def get_changes(self) -> Iterator[dict]:
+        """分页读取 PR 文件并逐个产出，每次只持有一页"""
+        import requests
+
         if not self.repo_full_name or not self.request_number:
-            return []
+            return
         url = urljoin(
             self.base_url,
             f"api/v1/repos/{self.repo_full_name}/pulls/{self.request_number}/files",
         )
-        for attempt in range(3):
-            resp = requests.get(url, headers=self._headers(), verify=False)
-            if resp.status_code == 200:
-                files = resp.json() or []
-                if files:
-                    return [
-                        {
-                            "diff": f.get("patch") or f.get("diff", ""),
-                            "new_path": f.get("filename") or f.get("path", ""),
-                            "additions": f.get("additions", 0),
-                            "deletions": f.get("deletions", 0),
-                        }
-                        for f in files
-                    ]
-            time.sleep(10)
-        return []
+        page, first = 1, None
+        while True:
+            for attempt in range(3):
+                resp = requests.get(
+                    url, params={"page": page, "limit": FILES_PER_PAGE}, headers=self._headers(), verify=False
+                )
+                if resp.status_code == 200:
+                    files = resp.json() or []
+                    if files or page > 1:
+                        break
+                time.sleep(10)
+            else:
+                if page > 1:
+                    raise ChangesIncompleteError(
+                        f"{PLATFORM} {self.repo_full_name} #{self.request_number}: page {page} failed "
+                        f"after retries (HTTP {resp.status_code})"
+                    )
+                return
+            # 旧版本 Gitea 忽略分页参数、每页都返回全部文件
+            if page > 1 and files and files[0].get("filename") == first:
+                return
+            first = files[0].get("filename") if files else None
+            for f in files:
+                yield {
+                    "diff": f.get("patch") or f.get("diff", ""),
+                    "new_path": f.get("filename") or f.get("path", ""),
+                    "additions": f.get("additions", 0),
+                    "deletions": f.get("deletions", 0),
+                }
+            if len(files) < FILES_PER_PAGE:
+                return
+            del files
+            page += 1
 
     def get_commits(self) -> list:
+        import requests
+
         if not self.repo_full_name or not self.request_number:
             return []
         url = urljoin(
@@ -2,43 +2,60 @@
 GitHub Pull Request Handler
 平台字段映射：number -> request_number, repository.name -> repo_name
 """
-import os
-import re
 import time
+from typing import Iterable, Iterator
 
-import requests
-
+from biz.platforms import ChangesIncompleteError
+from biz.utils.diff_parser import parse_change
 from biz.utils.log import logger
+from biz.utils.path_rules import get_path_rules
 
 PLATFORM = "github"
+# files API 单页上限为 100，最多返回 3000 个文件
+FILES_PER_PAGE = 100
 
 
-def filter_changes(changes: list) -> list:
-    """复用 SUPPORTED_EXTENSIONS，兼容 GitHub files API 格式"""
-    supported_extensions = os.getenv("SUPPORTED_EXTENSIONS", ".java,.py,.php").split(",")
-    not_deleted = []
+def filter_changes(changes: Iterable[dict]) -> Iterator[dict]:
+    """按 path_rules 过滤文件，兼容 GitHub files API 格式，逐个产出"""
+    rules = get_path_rules()
     for c in changes:
         if c.get("status") == "removed":
             continue
+        new_path = c.get("new_path") or c.get("filename") or ""
         diff = c.get("diff") or c.get("patch") or ""
-        if diff:
-            m = re.match(r"@@ -\d+,\d+ \+0,0 @@", diff)
-            if m and all(
-                line.startswith("-") or not line
-                for line in diff.split("\n")[1:]
-            ):
-                continue
-        not_deleted.append(c)
-    return [
-        {
-            "diff": item.get("diff") or item.get("patch", ""),
-            "new_path": item.get("new_path") or item.get("filename", ""),
-            "additions": item.get("additions", 0),
-            "deletions": item.get("deletions", 0),
+        # 先做廉价的路径判断，再检查是否为纯删除
+        if not rules.accept(new_path, diff):
+            continue
+        parsed = c.get("parsed") or parse_change(c)
+        if parsed.is_pure_deletion:
+            continue
+        yield {
+            "diff": c.get("diff") or c.get("patch", ""),
+            "new_path": c.get("new_path") or c.get("filename", ""),
+            "additions": c.get("additions", parsed.additions),
+            "deletions": c.get("deletions", parsed.deletions),
+            "truncated": c.get("truncated", False),
+            "parsed": parsed,
         }
-        for item in not_deleted
-        if any((item.get("new_path") or item.get("filename") or "").endswith(ext) for ext in supported_extensions)
-    ]
+
+
+def slim_webhook_data(data: dict) -> dict:
+    """仅保留 PullRequestHandler 用到的字段，作为轻量任务描述入队"""
+    pr = data.get("pull_request") or {}
+    repo = data.get("repository") or {}
+    head = pr.get("head") or {}
+    return {
+        "action": data.get("action"),
+        "pull_request": {
+            "number": pr.get("number"),
+            "html_url": pr.get("html_url", ""),
+            "title": pr.get("title", ""),
+            "head": {"ref": head.get("ref", ""), "sha": head.get("sha", "")},
+            "base": {"ref": (pr.get("base") or {}).get("ref", "")},
+            "user": {"login": (pr.get("user") or {}).get("login", "")},
+        },
+        "repository": {k: repo.get(k, "") for k in ("name", "full_name", "clone_url")},
+    }
 
 
 class PullRequestHandler:
@@ -52,6 +69,7 @@ class PullRequestHandler:
         repo = webhook_data.get("repository", {})
         self.repo_name = repo.get("name", "")
         self.repo_full_name = repo.get("full_name", self.repo_name)
+        self.clone_url = repo.get("clone_url", "")
         self.request_number = pr.get("number")  # GitHub: number
         self.request_url = pr.get("html_url", "")
         self.request_title = pr.get("title", "")
@@ -61,39 +79,56 @@ class PullRequestHandler:
         self.last_commit_id = (pr.get("head") or {}).get("sha", "")
         self.author = (pr.get("user") or {}).get("login", "")
 
-    def get_changes(self) -> list:
+    def get_changes(self) -> Iterator[dict]:
+        """分页读取 PR 文件并逐个产出，每次只持有一页"""
+        import requests
+
         if not self.repo_full_name or not self.request_number:
-            return []
+            return
         url = f"{self.base_url.replace('github.com', 'api.github.com')}/repos/{self.repo_full_name}/pulls/{self.request_number}/files"
         if "api." not in url:
             url = f"https://api.github.com/repos/{self.repo_full_name}/pulls/{self.request_number}/files"
-        for attempt in range(3):
-            resp = requests.get(
-                url,
-                headers={
-                    "Authorization": f"token {self.token}",
-                    "Accept": "application/vnd.github.v3+json",
-                },
-            )
-            if resp.status_code == 200:
-                files = resp.json()
-                if files:
-                    return [
-                        {
-                            "filename": f.get("filename"),
-                            "new_path": f.get("filename"),
-                            "diff": f.get("patch", ""),
-                            "patch": f.get("patch", ""),
-                            "additions": f.get("additions", 0),
-                            "deletions": f.get("deletions", 0),
-                            "status": f.get("status", ""),
-                        }
-                        for f in files
-                    ]
-            time.sleep(10)
-        return []
+        page = 1
+        while True:
+            for attempt in range(3):
+                resp = requests.get(
+                    url,
+                    params={"page": page, "per_page": FILES_PER_PAGE},
+                    headers={
+                        "Authorization": f"token {self.token}",
+                        "Accept": "application/vnd.github.v3+json",
+                    },
+                )
+                if resp.status_code == 200:
+                    files = resp.json()
+                    if files or page > 1:
+                        break
+                time.sleep(10)
+            else:
+                if page > 1:
+                    raise ChangesIncompleteError(
+                        f"{PLATFORM} {self.repo_full_name} #{self.request_number}: page {page} failed "
+                        f"after retries (HTTP {resp.status_code})"
+                    )
+                return
+            for f in files:
+                yield {
+                    "filename": f.get("filename"),
+                    "new_path": f.get("filename"),
+                    "diff": f.get("patch", ""),
+                    "patch": f.get("patch", ""),
+                    "additions": f.get("additions", 0),
+                    "deletions": f.get("deletions", 0),
+                    "status": f.get("status", ""),
+                }
+            if len(files) < FILES_PER_PAGE:
+                return
+            del files
+            page += 1
 
     def get_commits(self) -> list:
+        import requests
+
         if not self.repo_full_name or not self.request_number:
             return []
         url = f"https://api.github.com/repos/{self.repo_full_name}/pulls/{self.request_number}/commits"
@@ -2,32 +2,59 @@
 GitLab Merge Request Handler
 平台字段映射：iid -> request_number, project.name -> repo_name
 """
-import os
-import re
 import time
+from typing import Iterable, Iterator
 from urllib.parse import urljoin
 
-import requests
-
+from biz.platforms import ChangesIncompleteError
+from biz.utils.diff_parser import parse_change
 from biz.utils.log import logger
+from biz.utils.path_rules import get_path_rules
 
 PLATFORM = "gitlab"
+# /diffs 分页大小：每次只解码一页 JSON，超大 MR 的内存占用与文件总数无关
+DIFFS_PER_PAGE = 20
 
 
-def filter_changes(changes: list) -> list:
-    """复用 SUPPORTED_EXTENSIONS 过滤文件类型"""
-    supported_extensions = os.getenv("SUPPORTED_EXTENSIONS", ".java,.py,.php").split(",")
-    filter_deleted = [c for c in changes if not c.get("deleted_file")]
-    return [
-        {
-            "diff": item.get("diff", ""),
+def filter_changes(changes: Iterable[dict]) -> Iterator[dict]:
+    """按 path_rules（SUPPORTED_EXTENSIONS + include/exclude + 生成文件识别）过滤文件，逐个产出"""
+    rules = get_path_rules()
+    for item in changes:
+        if item.get("deleted_file"):
+            continue
+        diff = item.get("diff") or ""
+        if not rules.accept(item.get("new_path") or "", diff):
+            continue
+        parsed = item.get("parsed") or parse_change(item)
+        yield {
+            "diff": diff,
             "new_path": item.get("new_path", ""),
-            "additions": len(re.findall(r"^\+(?!\+\+)", item.get("diff", ""), re.MULTILINE)),
-            "deletions": len(re.findall(r"^-(?!--)", item.get("diff", ""), re.MULTILINE)),
+            # 超大文件截断前已记录完整行数
+            "additions": item.get("additions", parsed.additions),
+            "deletions": item.get("deletions", parsed.deletions),
+            "truncated": item.get("truncated", False),
+            "parsed": parsed,
         }
-        for item in filter_deleted
-        if any((item.get("new_path") or "").endswith(ext) for ext in supported_extensions)
-    ]
+
+
+def slim_webhook_data(data: dict) -> dict:
+    """仅保留 MergeRequestHandler 用到的字段，作为轻量任务描述入队"""
+    attrs = data.get("object_attributes") or {}
+    return {
+        "object_attributes": {
+            **{
+                k: attrs[k]
+                for k in ("iid", "url", "title", "source_branch", "target_branch", "action", "target_project_id")
+                if k in attrs
+            },
+            "last_commit": {"id": (attrs.get("last_commit") or {}).get("id", "")},
+        },
+        "project": {
+            k: (data.get("project") or {}).get(k, "")
+            for k in ("name", "path_with_namespace", "git_http_url")
+        },
+        "user": {"username": (data.get("user") or {}).get("username", "")},
+    }
 
 
 class MergeRequestHandler:
@@ -38,7 +65,10 @@ class MergeRequestHandler:
         self.token = token
         self.base_url = base_url.rstrip("/") + "/"
         self.attrs = webhook_data.get("object_attributes", {})
-        self.repo_name = (webhook_data.get("project") or {}).get("name", "")
+        project = webhook_data.get("project") or {}
+        self.repo_name = project.get("name", "")
+        self.repo_full_name = project.get("path_with_namespace") or self.repo_name
+        self.clone_url = project.get("git_http_url", "")
         self.request_number = self.attrs.get("iid")  # GitLab: iid
         self.request_url = self.attrs.get("url", "")
         self.request_title = self.attrs.get("title", "")
@@ -50,9 +80,51 @@ class MergeRequestHandler:
         self.author = (webhook_data.get("user") or {}).get("username", "")
         self.project_id = self.attrs.get("target_project_id")
 
-    def get_changes(self) -> list:
+    def get_changes(self) -> Iterator[dict]:
+        """分页读取 MR diffs 并逐文件产出；GitLab < 15.7 无 /diffs 接口时回退到一次性返回的 /changes"""
+        import requests
+
         if not self.project_id or not self.request_number:
-            return []
+            return
+        url = urljoin(
+            self.base_url,
+            f"api/v4/projects/{self.project_id}/merge_requests/{self.request_number}/diffs",
+        )
+        page = 1
+        max_retries = 3
+        while True:
+            for attempt in range(max_retries):
+                resp = requests.get(
+                    url,
+                    params={"page": page, "per_page": DIFFS_PER_PAGE},
+                    headers={"Private-Token": self.token},
+                    verify=False,
+                )
+                if resp.status_code == 404 and page == 1:
+                    yield from self._get_changes_legacy()
+                    return
+                if resp.status_code == 200:
+                    items = resp.json()
+                    # MR 刚创建时 diff 可能尚未生成，仅首页为空时重试
+                    if items or page > 1:
+                        break
+                time.sleep(10)
+            else:
+                if page > 1:
+                    raise ChangesIncompleteError(
+                        f"{PLATFORM} {self.repo_full_name} #{self.request_number}: page {page} failed "
+                        f"after retries (HTTP {resp.status_code})"
+                    )
+                return
+            yield from items
+            if len(items) < DIFFS_PER_PAGE:
+                return
+            del items
+            page += 1
+
+    def _get_changes_legacy(self) -> list:
+        import requests
+
         max_retries = 3
         for attempt in range(max_retries):
             url = urljoin(
@@ -70,6 +142,8 @@ class MergeRequestHandler:
         return []
 
     def get_commits(self) -> list:
+        import requests
+
         if not self.project_id or not self.request_number:
             return []
         url = urljoin(
@@ -4,12 +4,31 @@ MR/PR 事件处理：获取 changes -> 业务推理 -> 存储
 """
 import traceback
 from datetime import datetime
-from typing import Any, Callable, List
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 from biz.entity.reasoning_entity import BusinessReasoningEntity
 from biz.service.business_reasoning_service import BusinessReasoningService
+from biz.service.deferral_service import defer_reason
 from biz.service.storage_service import StorageService
+from biz.utils.diff_budget import clip_changes, render_changes
+from biz.utils.diff_parser import utf8_size
 from biz.utils.log import logger
+from biz.utils.minhash import MinHasher, near_dup_mode, near_dup_threshold
+from biz.utils.profiling import profile_job
+
+
+def collect_diffs(
+    get_changes: Callable[[], Iterable[dict]],
+    filter_changes_fn: Callable[[Iterable[dict]], Iterable[dict]],
+    hasher: Optional[MinHasher] = None,
+):
+    """
+    获取 -> 截断超大文件 -> 过滤 -> 渲染，全程逐文件流式处理，不保留原始 changes 列表。
+    hasher 非空时，对展开进 prompt 的 diff 累积近似重复签名。
+    返回 (diffs_text, 渲染统计)。
+    """
+    on_expand = hasher.update_change if hasher is not None else None
+    return render_changes(filter_changes_fn(clip_changes(get_changes())), on_expand=on_expand)
 
 
 def _commit_messages(commits: List[dict]) -> str:
@@ -22,6 +41,7 @@ def _commit_messages(commits: List[dict]) -> str:
     return "; ".join(texts)
 
 
+@profile_job
 def handle_merge_request_event(
     platform: str,
     repo_name: str,
@@ -32,9 +52,9 @@ def handle_merge_request_event(
     target_branch: str,
     last_commit_id: str,
     author: str,
-    get_changes: Callable[[], List],
+    get_changes: Callable[[], Iterable[dict]],
     get_commits: Callable[[], List],
-    filter_changes_fn: Callable[[List], List],
+    filter_changes_fn: Callable[[Iterable[dict]], Iterable[dict]],
 ):
     """
     通用 MR/PR 处理逻辑，平台无关。
@@ -53,34 +73,101 @@ def handle_merge_request_event(
         )
         return
 
-    changes = get_changes()
-    changes = filter_changes_fn(changes)
-    if not changes:
+    mode = near_dup_mode()
+    hasher = MinHasher() if mode != "off" else None
+    diffs_text, stats = collect_diffs(get_changes, filter_changes_fn, hasher)
+    if not stats.files:
         logger.info("No supported file changes, skip")
         return
+    if stats.truncated or stats.omitted:
+        logger.info(
+            f"Large MR {platform}/{repo_name} #{request_number}: {stats.files} files, "
+            f"{stats.truncated} truncated, {stats.omitted} beyond MR diff limit"
+        )
 
     commits = get_commits()
     commits_text = _commit_messages(commits)
-    diffs_text = str(changes)
+    signature = hasher.signature() if hasher is not None else None
+    mr = {
+        "platform": platform,
+        "repo_name": repo_name,
+        "request_number": int(request_number) if request_number is not None else None,
+        "request_url": request_url or "",
+        "request_title": request_title or "",
+        "source_branch": source_branch,
+        "target_branch": target_branch,
+        "last_commit_id": last_commit_id,
+        "author": author,
+    }
+
+    reason = defer_reason(utf8_size(diffs_text), author, target_branch)
+    if reason and not (mode == "reuse" and _find_match(mr, signature, mode)):
+        if StorageService.defer(mr, diffs_text, commits_text, reason, signature):
+            logger.info(f"Deferred to off-peak window ({reason}): {platform}/{repo_name} #{request_number}")
+        return
+
+    reason_and_save(mr, diffs_text, commits_text, signature)
 
-    svc = BusinessReasoningService()
-    result = svc.reason(diffs_text, commits_text)
+
+def _find_match(mr: dict, signature: Optional[List[int]], mode: str) -> Optional[dict]:
+    if not signature or mode not in ("reuse", "reference"):
+        return None
+    return StorageService.find_near_duplicate(mr["platform"], mr["repo_name"], signature, near_dup_threshold())
+
+
+def reason_and_save(
+    mr: dict,
+    diffs_text: str,
+    commits_text: str,
+    signature: Optional[List[int]] = None,
+    save_failed: bool = True,
+) -> Dict[str, Any]:
+    """
+    推理并入库（实时任务与延迟队列共用）。mr 为平台无关的 MR 字段，与 BusinessReasoningEntity 同名。
+    save_failed=False 时 LLM 调用失败（retryable）的结果不入库，由调用方稍后重试。
+    返回的 result["saved"] 表示记录是否已在库中，为 False 时调用方应保留任务。
+    """
+    mode = near_dup_mode()
+    match = _find_match(mr, signature, mode)
+    if match and mode == "reuse":
+        logger.info(
+            f"Near duplicate of #{match['id']} (similarity {match['similarity']:.2f}), reuse reasoning without LLM call"
+        )
+        result = {k: match[k] for k in ("summary", "categories", "details", "raw")}
+        result["ok"] = True
+    else:
+        if match:
+            logger.info(f"Near duplicate of #{match['id']} (similarity {match['similarity']:.2f}), use update prompt")
+        svc = BusinessReasoningService()
+        result = svc.reason(diffs_text, commits_text, reference=match)
+    if result.get("retryable") and not save_failed:
+        return result
+    usage = result.get("usage") or {}
 
     entity = BusinessReasoningEntity(
-        platform=platform,
-        repo_name=repo_name,
-        request_number=int(request_number) if request_number is not None else None,
-        request_url=request_url or "",
-        request_title=request_title or "",
-        source_branch=source_branch,
-        target_branch=target_branch,
-        last_commit_id=last_commit_id,
-        author=author,
+        **mr,
         commit_messages=commits_text,
         business_summary=result.get("summary", ""),
         reasoning_categories=result.get("categories", ""),
         reasoning_details=result.get("details", "[]"),
         raw_reasoning_json=result.get("raw", ""),
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        cached_tokens=usage.get("cached_tokens"),
+        llm_latency_ms=usage.get("latency_ms"),
+        near_dup_of=match["id"] if match else None,
+        near_dup_similarity=match["similarity"] if match else None,
+    )
+    # 推理失败的记录不进入近似重复索引，避免错误结果被复用
+    log_id = StorageService.insert(
+        entity, int(datetime.now().timestamp()), signature=signature if result.get("ok") else None
+    )
+    # 写入失败时（如 database is locked）若同一 commit 已由其他任务写入，同样视为已保存
+    result["saved"] = log_id is not None or StorageService.check_exists(
+        mr["platform"], mr["repo_name"], mr["source_branch"], mr["target_branch"], mr["last_commit_id"]
     )
-    StorageService.insert(entity, int(datetime.now().timestamp()))
-    logger.info(f"Saved: {platform}/{repo_name} #{request_number} -> {result.get('summary', '')[:50]}")
+    if result["saved"]:
+        logger.info(f"Saved: {mr['platform']}/{mr['repo_name']} #{mr['request_number']} -> {result.get('summary', '')[:50]}")
+    else:
+        logger.error(f"Failed to save reasoning for {mr['platform']}/{mr['repo_name']} #{mr['request_number']}")
+    return result
@@ -4,10 +4,7 @@
 import json
 import os
 import re
-from typing import Any, Dict, List
-
-import yaml
-from jinja2 import Template
+from typing import Any, Dict, List, Optional
 
 from biz.llm.factory import Factory
 from biz.utils.log import logger
@@ -20,29 +17,51 @@ class BusinessReasoningService:
         self.prompts = self._load_prompts()
 
     def _load_prompts(self) -> Dict[str, Any]:
+        import yaml
+
         base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         path = os.path.join(base, "conf", "prompt_templates.yml")
         with open(path, "r", encoding="utf-8") as f:
-            cfg = yaml.safe_load(f).get("business_reasoning_prompt", {})
+            templates = yaml.safe_load(f)
+        cfg = templates.get("business_reasoning_prompt", {})
+        update_cfg = templates.get("business_reasoning_update_prompt", {})
         return {
             "system_message": {"role": "system", "content": cfg.get("system_prompt", "")},
             "user_message": {"role": "user", "content": cfg.get("user_prompt", "")},
+            "update_message": {"role": "user", "content": update_cfg.get("user_prompt", "")},
         }
 
-    def reason(self, diffs_text: str, commits_text: str) -> Dict[str, Any]:
+    def reason(
+        self, diffs_text: str, commits_text: str, reference: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
         """
-        调用 LLM 反推业务，返回解析后的 JSON；解析失败时返回含 raw 的默认结构
+        调用 LLM 反推业务，返回解析后的 JSON；解析失败时返回含 raw 的默认结构。
+        reference 为近似重复的历史结果（StorageService.find_near_duplicate），
+        提供时使用更新 prompt，diff 只保留 REASONING_UPDATE_MAX_TOKENS。
         """
         if not diffs_text or not diffs_text.strip():
             return self._fallback_result("无有效代码变更")
 
-        max_tokens = int(os.getenv("REASONING_MAX_TOKENS", "10000"))
+        use_reference = reference is not None and bool(self.prompts["update_message"]["content"])
+        if use_reference:
+            max_tokens = int(os.getenv("REASONING_UPDATE_MAX_TOKENS", "2000"))
+        else:
+            max_tokens = int(os.getenv("REASONING_MAX_TOKENS", "10000"))
         if count_tokens(diffs_text) > max_tokens:
             diffs_text = truncate_text_by_tokens(diffs_text, max_tokens)
 
-        user_content = self.prompts["user_message"]["content"].format(
-            diffs_text=diffs_text, commits_text=commits_text or "无"
-        )
+        # 固定的 system 消息与 user 模板开头构成稳定前缀，可命中供应商的前缀缓存；提交信息与 diff 位于末尾
+        if use_reference:
+            user_content = self.prompts["update_message"]["content"].format(
+                similarity=f"{reference['similarity']:.2f}",
+                reference_json=self._reference_json(reference),
+                diffs_text=diffs_text,
+                commits_text=commits_text or "无",
+            )
+        else:
+            user_content = self.prompts["user_message"]["content"].format(
+                diffs_text=diffs_text, commits_text=commits_text or "无"
+            )
         messages = [
             self.prompts["system_message"],
             {"role": "user", "content": user_content},
@@ -51,42 +70,84 @@ class BusinessReasoningService:
             raw = self.client.completions(messages)
         except Exception as e:
             logger.error(f"LLM call failed: {e}")
-            return self._fallback_result(f"LLM 调用失败: {e}", raw="")
+            result = self._fallback_result(f"LLM 调用失败: {e}", raw="")
+            result["retryable"] = True
+            return result
 
-        return self._parse_json(raw)
+        result = self._parse_json(raw)
+        result["usage"] = self._log_usage(self.client.last_usage)
+        return result
 
-    def _parse_json(self, raw: str) -> Dict[str, Any]:
-        """解析 LLM 返回的 JSON，兼容 markdown 代码块"""
-        raw = (raw or "").strip()
-        # 去除 ```json ... ``` 包裹
-        m = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", raw)
-        if m:
-            raw = m.group(1).strip()
+    @staticmethod
+    def _reference_json(reference: Dict[str, Any]) -> str:
         try:
-            data = json.loads(raw)
-            if not isinstance(data, dict):
-                return self._fallback_result("返回格式异常", raw=raw)
-            summary = data.get("summary", "")
-            categories = data.get("categories", [])
-            details = data.get("details", [])
-            if isinstance(categories, list):
-                categories = ",".join(str(c) for c in categories)
-            if isinstance(details, list):
-                details = json.dumps(details, ensure_ascii=False)
-            return {
-                "summary": summary or "无法解析",
-                "categories": categories,
+            details = json.loads(reference.get("details") or "[]")
+        except json.JSONDecodeError:
+            details = []
+        return json.dumps(
+            {
+                "summary": reference.get("summary", ""),
+                "categories": [c for c in (reference.get("categories") or "").split(",") if c],
                 "details": details,
-                "raw": raw,
-            }
-        except json.JSONDecodeError as e:
-            logger.warn(f"JSON parse failed: {e}, raw={raw[:200]}...")
-            return self._fallback_result(f"JSON 解析失败: {e}", raw=raw)
+            },
+            ensure_ascii=False,
+        )
+
+    def _log_usage(self, usage: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+        if not usage:
+            return None
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        cached = usage.get("cached_tokens")
+        hit = f"{cached}/{prompt_tokens} ({cached * 100 // prompt_tokens}%)" if cached is not None and prompt_tokens else "n/a"
+        logger.info(
+            f"LLM usage: prompt {prompt_tokens}, completion {usage.get('completion_tokens')}, "
+            f"cached {hit}, {usage.get('latency_ms')}ms"
+        )
+        return usage
+
+    def _parse_json(self, raw: str) -> Dict[str, Any]:
+        return parse_reasoning_json(raw)
 
     def _fallback_result(self, msg: str, raw: str = "") -> Dict[str, Any]:
+        return fallback_result(msg, raw)
+
+
+def parse_reasoning_json(raw: str) -> Dict[str, Any]:
+    """解析 LLM 返回的 JSON，兼容 markdown 代码块（纯函数，manage.py reprocess 复用）"""
+    raw = (raw or "").strip()
+    # 去除 ```json ... ``` 包裹
+    m = re.search(r"```(?:json)?\s*([\s\S]*?)\s*```", raw)
+    if m:
+        raw = m.group(1).strip()
+    try:
+        data = json.loads(raw)
+        if not isinstance(data, dict):
+            return fallback_result("返回格式异常", raw=raw)
+        summary = data.get("summary", "")
+        categories = data.get("categories", [])
+        details = data.get("details", [])
+        if isinstance(categories, list):
+            categories = ",".join(str(c) for c in categories)
+        if isinstance(details, list):
+            details = json.dumps(details, ensure_ascii=False)
         return {
-            "summary": msg,
-            "categories": "其他",
-            "details": "[]",
+            "summary": summary or "无法解析",
+            "categories": categories,
+            "details": details,
             "raw": raw,
+            "ok": True,
         }
+    except json.JSONDecodeError as e:
+        logger.warn(f"JSON parse failed: {e}, raw={raw[:200]}...")
+        return fallback_result(f"JSON 解析失败: {e}", raw=raw)
+
+
+def fallback_result(msg: str, raw: str = "") -> Dict[str, Any]:
+    return {
+        "summary": msg,
+        "categories": "其他",
+        "details": "[]",
+        "raw": raw,
+        "usage": None,
+        "ok": False,
+    }
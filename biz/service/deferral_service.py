@@ -0,0 +1,208 @@
+"""
+错峰处理：把可等待的 MR（超大 diff、机器人作者、非优先分支）在推理前放入延迟队列，
+在 OFFPEAK_WINDOW 时段（如 DeepSeek 优惠时段）按 DEFER_DRAIN_CONCURRENCY 并发集中处理。
+
+环境变量：
+- DEFER_CLASSES：需要延迟的类别，逗号分隔，可选 large / bot / branch；为空（默认）表示不延迟
+- DEFER_LARGE_DIFF_KB：large 类别的阈值（渲染后的 diff 大小），默认 200
+- OFFPEAK_WINDOW：时间窗口 HH:MM-HH:MM，可跨零点，默认 00:30-08:30（DeepSeek 优惠时段）；格式错误时记录错误并使用默认值
+- OFFPEAK_TZ：窗口所在时区（IANA 名称），默认 Asia/Shanghai，与服务器本地时区无关
+- DEFER_DRAIN_CONCURRENCY：窗口内同时进行的 LLM 调用数，默认 8
+- DEFER_MAX_ATTEMPTS：LLM 调用失败后的最大重试次数，超过后按失败结果入库，默认 3
+- DEFER_AUTO_DRAIN：true 时 API 进程在窗口内自动派生子进程清空队列（gunicorn 多 worker 时由持有 data/queue/drainer.lock 的一个 worker 负责）；
+  否则由 cron 调用 manage.py drain-deferred
+
+窗口内到达的任务不延迟；bot / branch 判断复用任务调度的 QUEUE_BOT_AUTHORS / QUEUE_PRIORITY_BRANCHES。
+"""
+import datetime
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
+
+try:
+    import fcntl
+except ImportError:  # Windows 下为单进程（waitress），无需选主
+    fcntl = None
+
+from biz.utils.log import logger
+from biz.utils.queue import JOB_DB, job_lane
+
+DEFER_CLASSES = ("large", "bot", "branch")
+DEFAULT_WINDOW = "00:30-08:30"
+DEFAULT_TZ = "Asia/Shanghai"
+# 自动清空：检查窗口的间隔（秒）
+AUTO_DRAIN_INTERVAL = 60
+# 各 worker 进程都运行检查线程，持有该文件 flock 的一个负责清空；持有者退出后锁由内核释放，其他 worker 接管
+DRAIN_LOCK = os.path.join(os.path.dirname(JOB_DB), "drainer.lock")
+
+_auto_drainer_pid = None
+
+
+def _classes() -> set:
+    return {c.strip() for c in os.getenv("DEFER_CLASSES", "").split(",") if c.strip() in DEFER_CLASSES}
+
+
+def _parse_window(value: str) -> Tuple[datetime.time, datetime.time]:
+    start, _, end = value.partition("-")
+    return (
+        datetime.datetime.strptime(start.strip(), "%H:%M").time(),
+        datetime.datetime.strptime(end.strip(), "%H:%M").time(),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _window(value: str) -> Tuple[datetime.time, datetime.time]:
+    """按配置值缓存解析结果，格式错误只记录一次，不会在每个任务与指标请求中抛出"""
+    try:
+        return _parse_window(value)
+    except ValueError:
+        logger.error(f"Invalid OFFPEAK_WINDOW={value!r}, expected HH:MM-HH:MM; using {DEFAULT_WINDOW}")
+        return _parse_window(DEFAULT_WINDOW)
+
+
+@functools.lru_cache(maxsize=None)
+def _timezone(name: str) -> Optional[datetime.tzinfo]:
+    """窗口所在时区；无法加载（缺少 tzdata）时退回服务器本地时区"""
+    if ZoneInfo is None:
+        logger.error(f"zoneinfo unavailable, OFFPEAK_WINDOW uses server local time instead of {name}")
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        logger.error(f"Unknown OFFPEAK_TZ={name!r}, OFFPEAK_WINDOW uses server local time (pip install tzdata on Windows)")
+        return None
+
+
+def in_offpeak_window(now: Optional[datetime.datetime] = None) -> bool:
+    start, end = _window(os.getenv("OFFPEAK_WINDOW", DEFAULT_WINDOW))
+    tz = _timezone(os.getenv("OFFPEAK_TZ", DEFAULT_TZ))
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    if now.tzinfo is None:
+        now = now.astimezone()  # naive 时间按服务器本地时区解释
+    t = (now.astimezone(tz) if tz is not None else now.astimezone()).time()
+    if start <= end:
+        return start <= t < end
+    return t >= start or t < end
+
+
+def defer_reason(diff_size: int, author: str, target_branch: str, now: Optional[datetime.datetime] = None) -> Optional[str]:
+    """命中延迟策略时返回类别名（large/bot/branch），否则返回 None"""
+    classes = _classes()
+    if not classes or in_offpeak_window(now):
+        return None
+    if "large" in classes and diff_size > int(os.getenv("DEFER_LARGE_DIFF_KB", "200")) * 1024:
+        return "large"
+    lane = job_lane(target_branch, author)
+    if "bot" in classes and lane == "low":
+        return "bot"
+    if "branch" in classes and lane == "normal":
+        return "branch"
+    return None
+
+
+def _drain_one(item: dict) -> bool:
+    from biz.queue.worker import reason_and_save
+    from biz.service.storage_service import StorageService
+
+    max_attempts = int(os.getenv("DEFER_MAX_ATTEMPTS", "3"))
+    try:
+        result = reason_and_save(
+            item["mr"],
+            item["diffs_text"],
+            item["commits_text"],
+            item["signature"],
+            save_failed=item["attempts"] + 1 >= max_attempts,
+        )
+    except Exception as e:
+        logger.error(f"Deferred job {item['id']} failed: {e}")
+        if item["attempts"] + 1 >= max_attempts:
+            StorageService.delete_deferred(item["id"])
+            return True
+        result = {}
+    if result.get("saved"):
+        StorageService.delete_deferred(item["id"])
+        return True
+    # LLM 调用失败待重试，或结果写入失败（如 database is locked）：留在队列中下次处理
+    StorageService.retry_deferred(item["id"])
+    return False
+
+
+def drain(concurrency: int = None, limit: int = None, force: bool = False) -> Tuple[int, int]:
+    """
+    处理延迟队列（按入队顺序），返回 (完成数, 待重试数)。
+    非 force 时只在窗口内执行，窗口结束后停止领取新任务。
+    """
+    from biz.service.storage_service import StorageService
+
+    concurrency = concurrency or int(os.getenv("DEFER_DRAIN_CONCURRENCY", "8"))
+    done = retried = 0
+    after_id = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while force or in_offpeak_window():
+            batch_size = concurrency * 2 if limit is None else min(concurrency * 2, limit - done - retried)
+            if batch_size <= 0:
+                break
+            items = StorageService.fetch_deferred(after_id, batch_size)
+            if not items:
+                break
+            after_id = items[-1]["id"]
+            for ok in pool.map(_drain_one, items):
+                if ok:
+                    done += 1
+                else:
+                    retried += 1
+    logger.info(f"Deferred queue drained: {done} done, {retried} to retry")
+    return done, retried
+
+
+def _acquire_drain_lock():
+    """非阻塞获取 DRAIN_LOCK，成功时返回持有锁的文件对象（随进程存活一直持有），否则返回 None"""
+    if fcntl is None:
+        return True
+    os.makedirs(os.path.dirname(DRAIN_LOCK), exist_ok=True)
+    f = open(DRAIN_LOCK, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return f
+    except BlockingIOError:
+        f.close()
+        return None
+
+
+def _auto_drain_loop():
+    from biz.service.storage_service import StorageService
+
+    worker = None
+    lock = None
+    while True:
+        try:
+            lock = lock or _acquire_drain_lock()
+            if lock and (worker is None or not worker.is_alive()) and in_offpeak_window():
+                if StorageService.get_deferred_stats()["total"]:
+                    # 检查线程所在的 worker 进程有多个 Web 线程：用 spawn 而不是 fork（线程中 fork 不安全）
+                    worker = multiprocessing.get_context("spawn").Process(target=drain, name="deferred-drain")
+                    worker.start()
+        except Exception as e:
+            logger.error(f"Deferred auto drain failed: {e}")
+        time.sleep(AUTO_DRAIN_INTERVAL)
+
+
+def start_auto_drainer():
+    """
+    DEFER_AUTO_DRAIN=true 时在当前进程启动窗口检查线程（每个进程仅一个）。
+    gunicorn 下在 post_fork 中调用，不在主进程启动：主进程 fork worker 时不应带着其他线程。
+    """
+    global _auto_drainer_pid
+    if os.getenv("DEFER_AUTO_DRAIN", "false").lower() != "true" or _auto_drainer_pid == os.getpid():
+        return
+    _auto_drainer_pid = os.getpid()
+    threading.Thread(target=_auto_drain_loop, name="deferred-drainer", daemon=True).start()
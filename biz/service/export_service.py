@@ -0,0 +1,133 @@
+"""
+导出服务：将业务推理日志流式导出为 CSV / JSONL / Parquet，供下游 BI 同步
+"""
+import csv
+import json
+import os
+import sys
+from typing import List, Optional, Tuple
+
+from biz.service.storage_service import EXPORT_COLUMNS, StorageService
+from biz.utils.log import logger
+
+FORMATS = ("csv", "jsonl", "parquet")
+
+
+class _CsvWriter:
+    def __init__(self, fp, columns: Tuple[str, ...]):
+        self.writer = csv.writer(fp)
+        self.writer.writerow(columns)
+
+    def write(self, rows: List[tuple]):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+
+class _JsonlWriter:
+    def __init__(self, fp, columns: Tuple[str, ...]):
+        self.fp = fp
+        self.columns = columns
+
+    def write(self, rows: List[tuple]):
+        self.fp.writelines(
+            json.dumps(dict(zip(self.columns, row)), ensure_ascii=False) + "\n" for row in rows
+        )
+
+    def close(self):
+        pass
+
+
+class _ParquetWriter:
+    """每批写入一个 row group，需要 pyarrow"""
+
+    def __init__(self, path: str, columns: Tuple[str, ...]):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow: pip install pyarrow")
+        self.pa = pa
+        self.columns = columns
+        self.schema = pa.schema([
+            (c, pa.int64() if c in ("id", "request_number", "created_at") else pa.string())
+            for c in columns
+        ])
+        self.writer = pq.ParquetWriter(path, self.schema, compression="zstd")
+
+    def write(self, rows: List[tuple]):
+        arrays = [
+            self.pa.array([row[i] for row in rows], type=self.schema.field(i).type)
+            for i in range(len(self.columns))
+        ]
+        self.writer.write_table(self.pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+class ExportService:
+    @staticmethod
+    def load_state(state_file: str) -> Optional[int]:
+        """增量导出状态：上次导出的最大 id"""
+        if not state_file or not os.path.exists(state_file):
+            return None
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f).get("last_id")
+
+    @staticmethod
+    def save_state(state_file: str, last_id: int):
+        tmp = state_file + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"last_id": last_id}, f)
+        os.replace(tmp, state_file)
+
+    @classmethod
+    def export(
+        cls,
+        fmt: str,
+        output: str,
+        columns: Tuple[str, ...] = EXPORT_COLUMNS,
+        since_id: Optional[int] = None,
+        state_file: Optional[str] = None,
+        batch_size: int = 1000,
+        **filters,
+    ) -> Tuple[int, Optional[int]]:
+        """
+        流式导出，返回 (导出行数, 最大 id)。
+        output 为 "-" 时写到 stdout（仅 csv/jsonl）；指定 state_file 时从上次位置继续，成功后更新状态。
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported export format: {fmt}")
+        if "id" not in columns:
+            columns = ("id",) + tuple(columns)
+        if since_id is None and state_file:
+            since_id = cls.load_state(state_file)
+
+        id_idx = columns.index("id")
+        total, last_id = 0, since_id
+        fp = None
+        if fmt == "parquet":
+            if output == "-":
+                raise ValueError("Parquet export requires an output file")
+            writer = _ParquetWriter(output, columns)
+        else:
+            fp = sys.stdout if output == "-" else open(output, "w", encoding="utf-8", newline="")
+            writer = _CsvWriter(fp, columns) if fmt == "csv" else _JsonlWriter(fp, columns)
+        try:
+            for rows in StorageService.iter_logs(
+                columns=columns, since_id=since_id, batch_size=batch_size, **filters
+            ):
+                writer.write(rows)
+                total += len(rows)
+                last_id = rows[-1][id_idx]
+        finally:
+            writer.close()
+            if fp is not None and fp is not sys.stdout:
+                fp.close()
+
+        if state_file and last_id is not None:
+            cls.save_state(state_file, last_id)
+        logger.info(f"Exported {total} rows as {fmt} to {output}, last_id={last_id}")
+        return total, last_id
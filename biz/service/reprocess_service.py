@@ -0,0 +1,80 @@
+"""
+重新解析服务：用当前的 parse_reasoning_json 重新解析已保存的 LLM 原始输出，原地更新摘要、分类与明细，
+解析逻辑修复或调整后无需重新调用 LLM 即可应用到全部历史记录
+"""
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from biz.service.business_reasoning_service import parse_reasoning_json
+from biz.service.export_service import ExportService
+from biz.service.storage_service import StorageService
+from biz.utils.log import logger
+
+
+def _reparse_batch(rows: List[tuple]) -> Tuple[List[tuple], int, int]:
+    """子进程内解析一批记录，返回 (有变化的 (id, summary, categories, details), 无原始输出数, 解析失败数)"""
+    changed, missing, failed = [], 0, 0
+    for log_id, raw, summary, categories, details in rows:
+        if not raw:
+            missing += 1
+            continue
+        result = parse_reasoning_json(raw)
+        if not result.get("ok"):
+            # 新解析仍失败时保留原值
+            failed += 1
+            continue
+        new = (result["summary"], result["categories"], result["details"])
+        if new != (summary, categories, details):
+            changed.append((log_id,) + new)
+    return changed, missing, failed
+
+
+class ReprocessService:
+    @classmethod
+    def reprocess(
+        cls,
+        since_id: Optional[int] = None,
+        state_file: Optional[str] = None,
+        batch_size: int = 500,
+        workers: Optional[int] = None,
+        dry_run: bool = False,
+        **filters,
+    ) -> dict:
+        """
+        按 id 升序分批读取，多进程解析，按批次顺序写回；每批提交后更新 state_file，中断后从上次位置继续。
+        返回统计：scanned / updated / missing_raw / parse_failed / last_id。
+        """
+        if since_id is None and state_file:
+            since_id = ExportService.load_state(state_file)
+        workers = workers or os.cpu_count() or 1
+        stats = {"scanned": 0, "updated": 0, "missing_raw": 0, "parse_failed": 0, "last_id": since_id}
+
+        def commit(last_id: int, future):
+            changed, missing, failed = future.result()
+            if not dry_run:
+                StorageService.update_reasoning(changed)
+                if state_file:
+                    ExportService.save_state(state_file, last_id)
+            stats["updated"] += len(changed)
+            stats["missing_raw"] += missing
+            stats["parse_failed"] += failed
+            stats["last_id"] = last_id
+
+        # 在途批次数受限，读取速度不会超过解析与写回，内存占用恒定
+        pending = deque()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rows in StorageService.iter_reasoning_raw(since_id=since_id, batch_size=batch_size, **filters):
+                stats["scanned"] += len(rows)
+                pending.append((rows[-1][0], pool.submit(_reparse_batch, rows)))
+                if len(pending) >= workers * 2:
+                    commit(*pending.popleft())
+            while pending:
+                commit(*pending.popleft())
+
+        logger.info(
+            f"Reprocessed {stats['scanned']} rows{' (dry run)' if dry_run else ''}: {stats['updated']} updated, "
+            f"{stats['missing_raw']} without raw output, {stats['parse_failed']} still unparsable, last_id={stats['last_id']}"
+        )
+        return stats
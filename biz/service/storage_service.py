@@ -1,14 +1,150 @@
 """
 存储服务：平台无关的业务推理日志持久化
 """
+import datetime
 import json
 import os
+import re
 import sqlite3
-from typing import List, Optional
-
-import pandas as pd
+import time
+import zlib
+from typing import TYPE_CHECKING, Iterator, List, Optional, Tuple
 
 from biz.entity.reasoning_entity import BusinessReasoningEntity
+from biz.utils import minhash
+from biz.utils.diff_parser import utf8_size
+
+if TYPE_CHECKING:
+    # pandas 仅 Dashboard/查询接口需要，延迟到首次查询时导入，Webhook/Worker 进程不加载
+    import pandas as pd
+
+# Dashboard / 查询接口返回的列
+LOG_COLUMNS = (
+    "platform", "repo_name", "request_number", "request_url", "request_title",
+    "source_branch", "target_branch", "author", "created_at", "business_summary",
+    "reasoning_categories", "reasoning_details", "last_commit_id",
+)
+
+# LLM 用量列（后加列，旧库在 init_db 时自动补齐）
+USAGE_COLUMNS = {
+    "prompt_tokens": "INTEGER",
+    "completion_tokens": "INTEGER",
+    "cached_tokens": "INTEGER",
+    "llm_latency_ms": "INTEGER",
+}
+# 近似重复：复用或参考的历史记录 id 及估计相似度
+NEAR_DUP_COLUMNS = {
+    "near_dup_of": "INTEGER",
+    "near_dup_similarity": "REAL",
+}
+
+# 导出时的默认列（按 id 升序流式读取）
+EXPORT_COLUMNS = ("id",) + LOG_COLUMNS + ("commit_messages",) + tuple(USAGE_COLUMNS)
+# 导出可选择的列（--columns），raw_reasoning_json 读取时透明解压
+EXPORTABLE_COLUMNS = EXPORT_COLUMNS + ("raw_reasoning_json",)
+
+# 延迟队列中与 BusinessReasoningEntity 同名的 MR 字段
+DEFERRED_MR_COLUMNS = (
+    "platform, repo_name, request_number, request_url, request_title, "
+    "source_branch, target_branch, last_commit_id, author"
+)
+
+# LLM 原始输出压缩后存放在 business_reasoning_raw，日志表中的同名列仅保留给未迁移的历史数据；
+# 读取时用该表达式透明解压（需以 l 作为日志表别名）
+RAW_JSON_EXPR = (
+    "COALESCE(l.raw_reasoning_json, "
+    "raw_json((SELECT r.data FROM business_reasoning_raw r WHERE r.log_id = l.id)))"
+)
+RAW_COMPRESS_LEVEL = 6
+
+# HTTP 读取接口可选择的字段（fields 参数），默认返回 LOG_COLUMNS
+API_FIELDS = ("id",) + LOG_COLUMNS + ("commit_messages",) + tuple(USAGE_COLUMNS) + tuple(NEAR_DUP_COLUMNS)
+# 分面统计的维度
+FACET_COLUMNS = ("platform", "repo_name", "author", "category")
+
+# 全文检索覆盖的列，顺序即 bm25 权重顺序
+FTS_COLUMNS = ("business_summary", "reasoning_details", "request_title", "commit_messages")
+FTS_WEIGHTS = (10.0, 2.0, 5.0, 1.0)
+
+# trigram 分词器要求检索词至少 3 个字符
+TRIGRAM_MIN_LEN = 3
+# 两字中日韩词（如「退款」）查 business_reasoning_bigram 二元组索引；其余不足 3 字的词仍为 LIKE 全表扫描
+CJK_RUN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]{2,}")
+
+# 聚合查询允许的分组列与时间粒度（本地时区，周以周一为起点）
+GROUP_COLUMNS = ("platform", "repo_name", "author")
+PERIOD_EXPRS = {
+    "day": "date({}.created_at, 'unixepoch', 'localtime')",
+    "week": "date({}.created_at, 'unixepoch', 'localtime', 'weekday 0', '-6 days')",
+}
+
+# 趋势汇总可选维度；category 为空串的汇总行表示不分分类的 MR 总数
+TREND_DIMENSIONS = ("platform", "repo_name", "author", "category")
+ROLLUP_KEY = "period, bucket, platform, repo_name, author, category"
+
+
+ROLLUP_PERIODS = "(SELECT 'day' AS period UNION ALL SELECT 'week' AS period) p"
+
+
+def _rollup_key(alias: str, category: str) -> str:
+    """某条日志在汇总表中的键（需与 ROLLUP_PERIODS 交叉连接，每条日志得到 day/week 两行）"""
+    return (
+        f"p.period, CASE p.period WHEN 'day' THEN {PERIOD_EXPRS['day'].format(alias)} "
+        f"ELSE {PERIOD_EXPRS['week'].format(alias)} END, "
+        f"{alias}.platform, {alias}.repo_name, COALESCE({alias}.author, ''), {category}"
+    )
+
+
+def _read_sql(query: str, conn: sqlite3.Connection, params) -> "pd.DataFrame":
+    import pandas as pd
+    return pd.read_sql_query(sql=query, con=conn, params=params)
+
+
+def _empty_frame() -> "pd.DataFrame":
+    import pandas as pd
+    return pd.DataFrame()
+
+
+def _compress(text: Optional[str]) -> Optional[bytes]:
+    return zlib.compress(text.encode("utf-8"), RAW_COMPRESS_LEVEL) if text else None
+
+
+def _inflate(data: Optional[bytes]) -> Optional[str]:
+    return zlib.decompress(data).decode("utf-8") if data is not None else None
+
+
+def cjk_bigrams(texts) -> set:
+    """各列文本中连续中日韩字符的全部二元组（不跨列、不跨非中日韩字符）"""
+    grams = set()
+    for text in texts:
+        for run in CJK_RUN_RE.findall(text or ""):
+            grams.update(run[i:i + 2] for i in range(len(run) - 1))
+    return grams
+
+
+def split_categories(categories: Optional[str]) -> List[str]:
+    """将逗号拼接的分类拆分为去重后的列表"""
+    result = []
+    for c in (categories or "").split(","):
+        c = c.strip()
+        if c and c not in result:
+            result.append(c)
+    return result
+
+
+def parse_details(details: Optional[str]) -> List[Tuple[str, str]]:
+    """将 reasoning_details JSON 解析为 [(area, change)]，格式异常时返回空列表"""
+    try:
+        arr = json.loads(details or "[]")
+    except (TypeError, ValueError):
+        return []
+    if not isinstance(arr, list):
+        return []
+    return [
+        (str(d.get("area") or "").strip(), str(d.get("change") or "").strip())
+        for d in arr
+        if isinstance(d, dict)
+    ]
 
 
 class StorageService:
@@ -16,11 +152,66 @@ class StorageService:
 
     DB_FILE = "data/data.db"
 
+    _fts_trigram: Optional[bool] = None
+
     @classmethod
     def _db_path(cls) -> str:
         base = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
         return os.path.join(base, cls.DB_FILE)
 
+    @classmethod
+    def _connect(cls) -> sqlite3.Connection:
+        conn = sqlite3.connect(cls._db_path())
+        conn.create_function("raw_json", 1, _inflate, deterministic=True)
+        return conn
+
+    @staticmethod
+    def _table_exists(conn: sqlite3.Connection, name: str) -> bool:
+        row = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = ?", (name,)
+        ).fetchone()
+        return row is not None
+
+    @staticmethod
+    def _ensure_columns(conn: sqlite3.Connection, table: str, columns: dict):
+        """为已有表补齐新增列（SQLite 仅支持逐列 ADD COLUMN）"""
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+        for name, decl in columns.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {decl}")
+
+    @staticmethod
+    def _build_filters(
+        alias: str = "",
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> Tuple[str, list]:
+        """拼接与 get_logs 一致的筛选条件，返回 (" AND ..." 片段, 参数)"""
+        col = f"{alias}." if alias else ""
+        sql = ""
+        params = []
+        if platform:
+            sql += f" AND {col}platform = ?"
+            params.append(platform)
+        if repo_names:
+            placeholders = ",".join(["?"] * len(repo_names))
+            sql += f" AND {col}repo_name IN ({placeholders})"
+            params.extend(repo_names)
+        if authors:
+            placeholders = ",".join(["?"] * len(authors))
+            sql += f" AND {col}author IN ({placeholders})"
+            params.extend(authors)
+        if created_at_gte is not None:
+            sql += f" AND {col}created_at >= ?"
+            params.append(created_at_gte)
+        if created_at_lte is not None:
+            sql += f" AND {col}created_at <= ?"
+            params.append(created_at_lte)
+        return sql, params
+
     @classmethod
     def init_db(cls):
         """初始化数据库及表结构（平台无关设计）"""
@@ -28,6 +219,8 @@ class StorageService:
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         try:
             with sqlite3.connect(db_path) as conn:
+                # 仅对新建的空库生效；已有库由 manage.py maintain 首次执行时转换
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
                 cursor = conn.cursor()
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS business_reasoning_log (
@@ -48,6 +241,12 @@ class StorageService:
                         reasoning_details TEXT,
                         raw_reasoning_json TEXT,
                         diff_summary TEXT,
+                        prompt_tokens INTEGER,
+                        completion_tokens INTEGER,
+                        cached_tokens INTEGER,
+                        llm_latency_ms INTEGER,
+                        near_dup_of INTEGER,
+                        near_dup_similarity REAL,
                         UNIQUE(platform, repo_name, source_branch, target_branch, last_commit_id)
                     )
                 """)
@@ -60,10 +259,458 @@ class StorageService:
                 conn.execute(
                     "CREATE INDEX IF NOT EXISTS idx_brl_created_at ON business_reasoning_log(created_at)"
                 )
+                cls._ensure_columns(conn, "business_reasoning_log", {**USAGE_COLUMNS, **NEAR_DUP_COLUMNS})
+                cls._init_fts(conn)
+                cls._init_children(conn)
+                cls._init_rollups(conn)
+                cls._init_minhash(conn)
+                cls._init_deferred(conn)
+                cls._init_raw(conn)
+                cls._init_bigrams(conn)
+                cls._init_version(conn)
                 conn.commit()
         except sqlite3.DatabaseError as e:
             print(f"Database initialization failed: {e}")
 
+    @classmethod
+    def _init_fts(cls, conn: sqlite3.Connection):
+        """
+        FTS5 全文索引（external content 指向 business_reasoning_log，由触发器同步）。
+        优先使用 trigram 分词器以支持中文子串检索，SQLite 过旧时退回 unicode61。
+        """
+        if not cls._table_exists(conn, "business_reasoning_fts"):
+            columns = ", ".join(FTS_COLUMNS)
+            try:
+                conn.execute(f"""
+                    CREATE VIRTUAL TABLE business_reasoning_fts USING fts5(
+                        {columns},
+                        content='business_reasoning_log', content_rowid='id', tokenize='trigram'
+                    )
+                """)
+            except sqlite3.OperationalError:
+                conn.execute(f"""
+                    CREATE VIRTUAL TABLE business_reasoning_fts USING fts5(
+                        {columns},
+                        content='business_reasoning_log', content_rowid='id'
+                    )
+                """)
+            # 新建索引时回填历史数据
+            conn.execute("INSERT INTO business_reasoning_fts(business_reasoning_fts) VALUES ('rebuild')")
+
+        new_values = ", ".join(f"new.{c}" for c in FTS_COLUMNS)
+        old_values = ", ".join(f"old.{c}" for c in FTS_COLUMNS)
+        columns = ", ".join(FTS_COLUMNS)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS brl_fts_ai AFTER INSERT ON business_reasoning_log BEGIN
+                INSERT INTO business_reasoning_fts(rowid, {columns}) VALUES (new.id, {new_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS brl_fts_ad AFTER DELETE ON business_reasoning_log BEGIN
+                INSERT INTO business_reasoning_fts(business_reasoning_fts, rowid, {columns})
+                VALUES ('delete', old.id, {old_values});
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS brl_fts_au AFTER UPDATE OF {columns} ON business_reasoning_log BEGIN
+                INSERT INTO business_reasoning_fts(business_reasoning_fts, rowid, {columns})
+                VALUES ('delete', old.id, {old_values});
+                INSERT INTO business_reasoning_fts(rowid, {columns}) VALUES (new.id, {new_values});
+            END
+        """)
+
+    @classmethod
+    def _init_children(cls, conn: sqlite3.Connection):
+        """分类与明细子表（写入时拆分），首次建表时回填历史数据"""
+        backfill = not cls._table_exists(conn, "business_reasoning_category")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS business_reasoning_category (
+                log_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                PRIMARY KEY (log_id, category)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS business_reasoning_detail (
+                log_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                area TEXT NOT NULL,
+                change TEXT,
+                PRIMARY KEY (log_id, seq)
+            ) WITHOUT ROWID
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_brc_category ON business_reasoning_category(category, log_id)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_brd_area ON business_reasoning_detail(area, log_id)"
+        )
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS brl_children_ad AFTER DELETE ON business_reasoning_log BEGIN
+                DELETE FROM business_reasoning_category WHERE log_id = old.id;
+                DELETE FROM business_reasoning_detail WHERE log_id = old.id;
+            END
+        """)
+        if backfill:
+            rows = conn.execute(
+                "SELECT id, reasoning_categories, reasoning_details FROM business_reasoning_log"
+            )
+            for log_id, categories, details in rows.fetchall():
+                cls._save_children(conn, log_id, categories, details)
+
+    @staticmethod
+    def _save_children(conn: sqlite3.Connection, log_id: int, categories: str, details: str):
+        """（重新）写入某条日志的分类与明细子表"""
+        conn.execute("DELETE FROM business_reasoning_category WHERE log_id = ?", (log_id,))
+        conn.execute("DELETE FROM business_reasoning_detail WHERE log_id = ?", (log_id,))
+        conn.executemany(
+            "INSERT INTO business_reasoning_category (log_id, category) VALUES (?, ?)",
+            [(log_id, c) for c in split_categories(categories)],
+        )
+        conn.executemany(
+            "INSERT INTO business_reasoning_detail (log_id, seq, area, change) VALUES (?, ?, ?, ?)",
+            [(log_id, i, area, change) for i, (area, change) in enumerate(parse_details(details))],
+        )
+
+    @classmethod
+    def _init_bigrams(cls, conn: sqlite3.Connection):
+        """
+        全文检索列的中日韩二元组影子索引（写入时拆分为空格分隔的二元组），补足 trigram 无法检索的两字词。
+        detail='none' 只保存 rowid 倒排表，不存位置信息；首次建表时回填历史数据。
+        """
+        backfill = not cls._table_exists(conn, "business_reasoning_bigram")
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS business_reasoning_bigram "
+            "USING fts5(grams, detail='none', columnsize=0)"
+        )
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS brl_bigram_ad AFTER DELETE ON business_reasoning_log BEGIN
+                DELETE FROM business_reasoning_bigram WHERE rowid = old.id;
+            END
+        """)
+        if backfill:
+            cls._rebuild_bigrams(conn)
+
+    @staticmethod
+    def _save_bigrams(conn: sqlite3.Connection, log_id: int, texts):
+        """（重新）写入某条日志的二元组，texts 为 FTS_COLUMNS 各列的值"""
+        conn.execute("DELETE FROM business_reasoning_bigram WHERE rowid = ?", (log_id,))
+        conn.execute(
+            "INSERT INTO business_reasoning_bigram (rowid, grams) VALUES (?, ?)",
+            (log_id, " ".join(sorted(cjk_bigrams(texts)))),
+        )
+
+    @staticmethod
+    def _rebuild_bigrams(conn: sqlite3.Connection):
+        conn.execute("DELETE FROM business_reasoning_bigram")
+        rows = conn.execute(f"SELECT id, {', '.join(FTS_COLUMNS)} FROM business_reasoning_log")
+        conn.executemany(
+            "INSERT INTO business_reasoning_bigram (rowid, grams) VALUES (?, ?)",
+            [(row[0], " ".join(sorted(cjk_bigrams(row[1:])))) for row in rows.fetchall()],
+        )
+
+    @classmethod
+    def rebuild_bigrams(cls):
+        """全量重建二元组索引（绕过 insert 直接写入日志表后使用）"""
+        try:
+            with cls._connect() as conn:
+                cls._rebuild_bigrams(conn)
+                conn.commit()
+        except sqlite3.DatabaseError as e:
+            print(f"Error rebuilding bigrams: {e}")
+
+    @staticmethod
+    def _init_minhash(conn: sqlite3.Connection):
+        """近似重复检测：每条日志的 MinHash 签名 + LSH 分桶索引（仅 NEAR_DUP_MODE 开启后写入）"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS business_reasoning_minhash (
+                log_id INTEGER PRIMARY KEY,
+                signature BLOB NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS business_reasoning_lsh (
+                band INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                log_id INTEGER NOT NULL,
+                PRIMARY KEY (band, bucket, log_id)
+            ) WITHOUT ROWID
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS brl_minhash_ad AFTER DELETE ON business_reasoning_log BEGIN
+                DELETE FROM business_reasoning_minhash WHERE log_id = old.id;
+                DELETE FROM business_reasoning_lsh WHERE log_id = old.id;
+            END
+        """)
+
+    @staticmethod
+    def _save_minhash(conn: sqlite3.Connection, log_id: int, signature: List[int]):
+        conn.execute(
+            "INSERT OR REPLACE INTO business_reasoning_minhash (log_id, signature) VALUES (?, ?)",
+            (log_id, minhash.pack(signature)),
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO business_reasoning_lsh (band, bucket, log_id) VALUES (?, ?, ?)",
+            [(band, bucket, log_id) for band, bucket in minhash.lsh_buckets(signature)],
+        )
+
+    @staticmethod
+    def _init_raw(conn: sqlite3.Connection):
+        """LLM 原始输出（zlib 压缩）单独存放，日志表行更紧凑，Dashboard 扫描读取的页更少"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS business_reasoning_raw (
+                log_id INTEGER PRIMARY KEY,
+                data BLOB NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS brl_raw_ad AFTER DELETE ON business_reasoning_log BEGIN
+                DELETE FROM business_reasoning_raw WHERE log_id = old.id;
+            END
+        """)
+
+    @staticmethod
+    def _init_version(conn: sqlite3.Connection):
+        """数据变更计数：日志表及原始输出表的任意写入（含重新推理、压缩迁移、归档等原地改写）都递增，供 ETag / 缓存失效判断"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS business_reasoning_meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            )
+        """)
+        conn.execute("INSERT OR IGNORE INTO business_reasoning_meta (key, value) VALUES ('changes', 0)")
+        bump = "UPDATE business_reasoning_meta SET value = value + 1 WHERE key = 'changes';"
+        for table, alias in (("business_reasoning_log", "brl"), ("business_reasoning_raw", "brr")):
+            for event, suffix in (("INSERT", "ai"), ("UPDATE", "au"), ("DELETE", "ad")):
+                conn.execute(f"""
+                    CREATE TRIGGER IF NOT EXISTS {alias}_version_{suffix} AFTER {event} ON {table} BEGIN
+                        {bump}
+                    END
+                """)
+
+    @staticmethod
+    def _init_deferred(conn: sqlite3.Connection):
+        """错峰处理的延迟队列：保存渲染后的 diff 与提交信息快照，处理时无需再次请求平台 API"""
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS business_reasoning_deferred (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                platform TEXT NOT NULL,
+                repo_name TEXT NOT NULL,
+                request_number INTEGER,
+                request_url TEXT,
+                request_title TEXT,
+                source_branch TEXT NOT NULL,
+                target_branch TEXT NOT NULL,
+                last_commit_id TEXT NOT NULL,
+                author TEXT,
+                diffs_text TEXT NOT NULL,
+                commits_text TEXT,
+                signature BLOB,
+                reason TEXT NOT NULL,
+                diff_size INTEGER NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                created_at INTEGER NOT NULL,
+                UNIQUE(platform, repo_name, source_branch, target_branch, last_commit_id)
+            )
+        """)
+
+    @classmethod
+    def _init_rollups(cls, conn: sqlite3.Connection):
+        """
+        趋势汇总表：按 day/week × platform × repo × author × category 计数，
+        由日志表与分类子表上的触发器增量维护，首次建表时全量重建。
+        """
+        rebuild = not cls._table_exists(conn, "business_reasoning_rollup")
+        conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS business_reasoning_rollup (
+                period TEXT NOT NULL,
+                bucket TEXT NOT NULL,
+                platform TEXT NOT NULL,
+                repo_name TEXT NOT NULL,
+                author TEXT NOT NULL,
+                category TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY ({ROLLUP_KEY})
+            ) WITHOUT ROWID
+        """)
+        upsert = f"ON CONFLICT ({ROLLUP_KEY}) DO UPDATE SET count = count + excluded.count"
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS brl_rollup_ai AFTER INSERT ON business_reasoning_log BEGIN
+                INSERT INTO business_reasoning_rollup ({ROLLUP_KEY}, count)
+                SELECT {_rollup_key("new", "''")}, 1 FROM {ROLLUP_PERIODS} WHERE true {upsert};
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS brl_rollup_bd BEFORE DELETE ON business_reasoning_log BEGIN
+                UPDATE business_reasoning_rollup SET count = count - 1
+                WHERE ({ROLLUP_KEY}) IN (SELECT {_rollup_key("old", "''")} FROM {ROLLUP_PERIODS});
+                UPDATE business_reasoning_rollup SET count = count - 1
+                WHERE ({ROLLUP_KEY}) IN (
+                    SELECT {_rollup_key("old", "c.category")}
+                    FROM {ROLLUP_PERIODS}, business_reasoning_category c WHERE c.log_id = old.id
+                );
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS brc_rollup_ai AFTER INSERT ON business_reasoning_category BEGIN
+                INSERT INTO business_reasoning_rollup ({ROLLUP_KEY}, count)
+                SELECT {_rollup_key("l", "new.category")}, 1
+                FROM {ROLLUP_PERIODS}, business_reasoning_log l WHERE l.id = new.log_id {upsert};
+            END
+        """)
+        conn.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS brc_rollup_ad AFTER DELETE ON business_reasoning_category BEGIN
+                UPDATE business_reasoning_rollup SET count = count - 1
+                WHERE ({ROLLUP_KEY}) IN (
+                    SELECT {_rollup_key("l", "old.category")}
+                    FROM {ROLLUP_PERIODS}, business_reasoning_log l WHERE l.id = old.log_id
+                );
+            END
+        """)
+        if rebuild:
+            cls._rebuild_rollups(conn)
+
+    @staticmethod
+    def _rebuild_rollups(conn: sqlite3.Connection):
+        conn.execute("DELETE FROM business_reasoning_rollup")
+        conn.execute(f"""
+            INSERT INTO business_reasoning_rollup ({ROLLUP_KEY}, count)
+            SELECT {_rollup_key("l", "''")}, COUNT(*)
+            FROM {ROLLUP_PERIODS}, business_reasoning_log l
+            GROUP BY 1, 2, 3, 4, 5, 6
+        """)
+        conn.execute(f"""
+            INSERT INTO business_reasoning_rollup ({ROLLUP_KEY}, count)
+            SELECT {_rollup_key("l", "c.category")}, COUNT(*)
+            FROM {ROLLUP_PERIODS}, business_reasoning_category c
+            JOIN business_reasoning_log l ON l.id = c.log_id
+            GROUP BY 1, 2, 3, 4, 5, 6
+        """)
+
+    @classmethod
+    def rebuild_rollups(cls):
+        """全量重建趋势汇总（修复/压缩用，清理计数归零的行）"""
+        try:
+            with cls._connect() as conn:
+                cls._rebuild_rollups(conn)
+                conn.commit()
+        except sqlite3.DatabaseError as e:
+            print(f"Error rebuilding rollups: {e}")
+
+    @staticmethod
+    def _db_stats(conn: sqlite3.Connection) -> dict:
+        """库文件大小、空闲页大小，以及与 get_logs 相同的全量查询耗时"""
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        start = time.perf_counter()
+        conn.execute(
+            f"SELECT {', '.join(LOG_COLUMNS)} FROM business_reasoning_log ORDER BY created_at DESC"
+        ).fetchall()
+        return {
+            "size_bytes": page_count * page_size,
+            "free_bytes": freelist * page_size,
+            "get_logs_ms": round((time.perf_counter() - start) * 1000, 1),
+        }
+
+    @staticmethod
+    def _compress_raw(conn: sqlite3.Connection, batch_size: int = 500) -> int:
+        """将日志表中未压缩的 raw_reasoning_json 分批迁移到 business_reasoning_raw，返回迁移条数"""
+        moved = 0
+        last_id = 0
+        while True:
+            rows = conn.execute(
+                "SELECT id, raw_reasoning_json FROM business_reasoning_log "
+                "WHERE id > ? AND raw_reasoning_json IS NOT NULL ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                return moved
+            conn.executemany(
+                "INSERT OR REPLACE INTO business_reasoning_raw (log_id, data) VALUES (?, ?)",
+                [(log_id, _compress(raw)) for log_id, raw in rows if raw],
+            )
+            conn.executemany(
+                "UPDATE business_reasoning_log SET raw_reasoning_json = NULL WHERE id = ?",
+                [(log_id,) for log_id, _ in rows],
+            )
+            conn.commit()
+            moved += len(rows)
+            last_id = rows[-1][0]
+
+    @staticmethod
+    def _archive_raw(conn: sqlite3.Connection, before: int, archive_path: Optional[str]) -> int:
+        """created_at 早于 before 的原始输出移入归档库（archive_path 为空时直接删除），返回条数"""
+        ids = (
+            "SELECT r.log_id FROM main.business_reasoning_raw r "
+            "JOIN main.business_reasoning_log l ON l.id = r.log_id WHERE l.created_at < ?"
+        )
+        if archive_path:
+            os.makedirs(os.path.dirname(os.path.abspath(archive_path)), exist_ok=True)
+            conn.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS archive.business_reasoning_raw (
+                    log_id INTEGER PRIMARY KEY,
+                    data BLOB NOT NULL,
+                    archived_at INTEGER NOT NULL
+                )
+            """)
+            conn.execute(
+                f"INSERT OR REPLACE INTO archive.business_reasoning_raw (log_id, data, archived_at) "
+                f"SELECT log_id, data, ? FROM main.business_reasoning_raw WHERE log_id IN ({ids})",
+                (int(time.time()), before),
+            )
+        count = conn.execute(
+            f"DELETE FROM main.business_reasoning_raw WHERE log_id IN ({ids})", (before,)
+        ).rowcount
+        conn.commit()
+        if archive_path:
+            conn.execute("DETACH DATABASE archive")
+        return count
+
+    @classmethod
+    def maintain(
+        cls, raw_retention_days: int = 0, archive_path: Optional[str] = None, vacuum: bool = True
+    ) -> dict:
+        """
+        存储维护：压缩迁移历史原始输出 -> 按保留期归档 -> 合并全文索引 -> 回收空间 -> 更新统计信息。
+        返回维护前后的库大小与 get_logs 查询耗时，以及各步骤处理的条数。
+        """
+        conn = cls._connect()
+        try:
+            report = {"before": cls._db_stats(conn), "compressed": cls._compress_raw(conn), "archived": 0}
+            if raw_retention_days > 0:
+                before = int(time.time()) - raw_retention_days * 86400
+                report["archived"] = cls._archive_raw(conn, before, archive_path)
+            conn.execute("INSERT INTO business_reasoning_fts(business_reasoning_fts) VALUES ('optimize')")
+            conn.execute("INSERT INTO business_reasoning_bigram(business_reasoning_bigram) VALUES ('optimize')")
+            conn.commit()
+            if vacuum:
+                if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                    # 已有库首次转换为增量模式需要一次完整 VACUUM，之后只回收空闲页
+                    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                    conn.execute("VACUUM")
+                    report["vacuum"] = "full"
+                else:
+                    conn.execute("PRAGMA incremental_vacuum").fetchall()
+                    report["vacuum"] = "incremental"
+            conn.execute("ANALYZE")
+            conn.execute("PRAGMA optimize")
+            conn.commit()
+            report["after"] = cls._db_stats(conn)
+            return report
+        finally:
+            conn.close()
+
+    @classmethod
+    def _is_trigram(cls, conn: sqlite3.Connection) -> bool:
+        if cls._fts_trigram is None:
+            row = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE name = 'business_reasoning_fts'"
+            ).fetchone()
+            cls._fts_trigram = bool(row and "trigram" in (row[0] or ""))
+        return cls._fts_trigram
+
     @classmethod
     def check_exists(
         cls,
@@ -75,7 +722,7 @@ class StorageService:
     ) -> bool:
         """检查是否已存在相同提交的记录（去重）"""
         try:
-            with sqlite3.connect(cls._db_path()) as conn:
+            with cls._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
@@ -91,10 +738,55 @@ class StorageService:
             return False
 
     @classmethod
-    def insert(cls, entity: BusinessReasoningEntity, created_at: int):
-        """插入业务推理日志"""
+    def find_near_duplicate(
+        cls, platform: str, repo_name: str, signature: List[int], threshold: float
+    ) -> Optional[dict]:
+        """
+        在同一仓库中查找与签名最相似的历史记录：先按 LSH 分桶取候选，再用完整签名估计相似度。
+        返回达到阈值的最相似记录（含 id、similarity 及推理结果字段），否则返回 None。
+        """
+        buckets = list(minhash.lsh_buckets(signature))
+        values = ", ".join("(?, ?)" for _ in buckets)
+        params = [v for pair in buckets for v in pair] + [platform, repo_name]
+        query = f"""
+            SELECT l.id, m.signature, l.business_summary, l.reasoning_categories,
+                   l.reasoning_details, {RAW_JSON_EXPR}
+            FROM (
+                SELECT DISTINCT h.log_id
+                FROM (VALUES {values}) b
+                JOIN business_reasoning_lsh h ON h.band = b.column1 AND h.bucket = b.column2
+            ) c
+            JOIN business_reasoning_minhash m ON m.log_id = c.log_id
+            JOIN business_reasoning_log l ON l.id = c.log_id
+            WHERE l.platform = ? AND l.repo_name = ?
+        """
         try:
-            with sqlite3.connect(cls._db_path()) as conn:
+            with cls._connect() as conn:
+                rows = conn.execute(query, params).fetchall()
+        except sqlite3.DatabaseError as e:
+            print(f"Error searching near duplicates: {e}")
+            return None
+        best = None
+        for log_id, blob, summary, categories, details, raw in rows:
+            score = minhash.similarity(signature, minhash.unpack(blob))
+            if score >= threshold and (best is None or score > best["similarity"]):
+                best = {
+                    "id": log_id,
+                    "similarity": score,
+                    "summary": summary,
+                    "categories": categories,
+                    "details": details,
+                    "raw": raw,
+                }
+        return best
+
+    @classmethod
+    def insert(
+        cls, entity: BusinessReasoningEntity, created_at: int, signature: Optional[List[int]] = None
+    ) -> Optional[int]:
+        """插入业务推理日志，同时拆分写入分类/明细子表（及近似重复签名），返回新记录 id"""
+        try:
+            with cls._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute(
                     """
@@ -102,8 +794,10 @@ class StorageService:
                         platform, repo_name, request_number, request_url, request_title,
                         source_branch, target_branch, last_commit_id, author, commit_messages,
                         created_at, business_summary, reasoning_categories, reasoning_details,
-                        raw_reasoning_json, diff_summary
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        raw_reasoning_json, diff_summary,
+                        prompt_tokens, completion_tokens, cached_tokens, llm_latency_ms,
+                        near_dup_of, near_dup_similarity
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
                     """,
                     (
                         entity.platform,
@@ -120,13 +814,174 @@ class StorageService:
                         entity.business_summary,
                         entity.reasoning_categories,
                         entity.reasoning_details,
-                        entity.raw_reasoning_json,
+                        None,
                         entity.diff_summary,
+                        entity.prompt_tokens,
+                        entity.completion_tokens,
+                        entity.cached_tokens,
+                        entity.llm_latency_ms,
+                        entity.near_dup_of,
+                        entity.near_dup_similarity,
                     ),
                 )
+                log_id = cursor.lastrowid
+                if entity.raw_reasoning_json:
+                    conn.execute(
+                        "INSERT INTO business_reasoning_raw (log_id, data) VALUES (?, ?)",
+                        (log_id, _compress(entity.raw_reasoning_json)),
+                    )
+                cls._save_children(
+                    conn, log_id, entity.reasoning_categories, entity.reasoning_details
+                )
+                cls._save_bigrams(conn, log_id, [getattr(entity, c) for c in FTS_COLUMNS])
+                if signature:
+                    cls._save_minhash(conn, log_id, signature)
                 conn.commit()
+                return log_id
         except sqlite3.DatabaseError as e:
             print(f"Error inserting reasoning log: {e}")
+            return None
+
+    @classmethod
+    def defer(
+        cls, mr: dict, diffs_text: str, commits_text: str, reason: str, signature: Optional[List[int]] = None
+    ) -> bool:
+        """放入延迟队列，同一 commit 已在队列中时忽略；返回是否新入队"""
+        try:
+            with cls._connect() as conn:
+                cursor = conn.execute(
+                    """
+                    INSERT OR IGNORE INTO business_reasoning_deferred (
+                        platform, repo_name, request_number, request_url, request_title,
+                        source_branch, target_branch, last_commit_id, author,
+                        diffs_text, commits_text, signature, reason, diff_size, created_at
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (
+                        mr["platform"],
+                        mr["repo_name"],
+                        mr["request_number"],
+                        mr["request_url"],
+                        mr["request_title"],
+                        mr["source_branch"],
+                        mr["target_branch"],
+                        mr["last_commit_id"],
+                        mr["author"],
+                        diffs_text,
+                        commits_text,
+                        minhash.pack(signature) if signature else None,
+                        reason,
+                        utf8_size(diffs_text),
+                        int(datetime.datetime.now().timestamp()),
+                    ),
+                )
+                conn.commit()
+                return cursor.rowcount > 0
+        except sqlite3.DatabaseError as e:
+            print(f"Error deferring job: {e}")
+            return False
+
+    @classmethod
+    def fetch_deferred(cls, after_id: int = 0, limit: int = 16) -> List[dict]:
+        """按入队顺序读取 id > after_id 的一批延迟任务（含 diff 快照）"""
+        try:
+            with cls._connect() as conn:
+                rows = conn.execute(
+                    f"""
+                    SELECT id, attempts, diffs_text, commits_text, signature, {DEFERRED_MR_COLUMNS}
+                    FROM business_reasoning_deferred
+                    WHERE id > ?
+                    ORDER BY id
+                    LIMIT ?
+                    """,
+                    (after_id, limit),
+                ).fetchall()
+        except sqlite3.DatabaseError as e:
+            print(f"Error fetching deferred jobs: {e}")
+            return []
+        mr_keys = [c.strip() for c in DEFERRED_MR_COLUMNS.split(",")]
+        return [
+            {
+                "id": row[0],
+                "attempts": row[1],
+                "diffs_text": row[2],
+                "commits_text": row[3],
+                "signature": minhash.unpack(row[4]) if row[4] else None,
+                "mr": dict(zip(mr_keys, row[5:])),
+            }
+            for row in rows
+        ]
+
+    @classmethod
+    def delete_deferred(cls, deferred_id: int):
+        try:
+            with cls._connect() as conn:
+                conn.execute("DELETE FROM business_reasoning_deferred WHERE id = ?", (deferred_id,))
+                conn.commit()
+        except sqlite3.DatabaseError as e:
+            print(f"Error deleting deferred job: {e}")
+
+    @classmethod
+    def retry_deferred(cls, deferred_id: int):
+        """记录一次失败，任务留在队列中等待下次处理"""
+        try:
+            with cls._connect() as conn:
+                conn.execute(
+                    "UPDATE business_reasoning_deferred SET attempts = attempts + 1 WHERE id = ?",
+                    (deferred_id,),
+                )
+                conn.commit()
+        except sqlite3.DatabaseError as e:
+            print(f"Error updating deferred job: {e}")
+
+    @classmethod
+    def get_deferred_stats(cls) -> dict:
+        """延迟队列概况：总数、按原因计数、diff 总大小、最早入队时间"""
+        stats = {"total": 0, "reasons": {}, "diff_bytes": 0, "oldest": None}
+        try:
+            with cls._connect() as conn:
+                rows = conn.execute(
+                    "SELECT reason, COUNT(*), SUM(diff_size), MIN(created_at) "
+                    "FROM business_reasoning_deferred GROUP BY reason"
+                ).fetchall()
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving deferred stats: {e}")
+            return stats
+        for reason, count, size, oldest in rows:
+            stats["reasons"][reason] = count
+            stats["total"] += count
+            stats["diff_bytes"] += size or 0
+            stats["oldest"] = oldest if stats["oldest"] is None else min(stats["oldest"], oldest)
+        return stats
+
+    @classmethod
+    def get_deferred(cls) -> "pd.DataFrame":
+        """延迟队列明细（不含 diff 快照），Dashboard 用"""
+        query = f"""
+            SELECT {DEFERRED_MR_COLUMNS}, reason, diff_size, attempts, created_at
+            FROM business_reasoning_deferred
+            ORDER BY id
+        """
+        try:
+            with cls._connect() as conn:
+                return _read_sql(query, conn, None)
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving deferred jobs: {e}")
+            return _empty_frame()
+
+    @classmethod
+    def get_data_version(cls) -> Tuple[int, int]:
+        """数据版本 (变更计数, 最大 id)：读取触发器维护的计数与主键最大值，均为常数开销，不扫描日志表；供 ETag 与 Dashboard 缓存失效判断"""
+        try:
+            with cls._connect() as conn:
+                changes, max_id = conn.execute(
+                    "SELECT (SELECT value FROM business_reasoning_meta WHERE key = 'changes'), "
+                    "(SELECT MAX(id) FROM business_reasoning_log)"
+                ).fetchone()
+                return changes or 0, max_id or 0
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving data version: {e}")
+            return 0, 0
 
     @classmethod
     def get_logs(
@@ -136,37 +991,539 @@ class StorageService:
         authors: Optional[List[str]] = None,
         created_at_gte: Optional[int] = None,
         created_at_lte: Optional[int] = None,
-    ) -> pd.DataFrame:
+    ) -> "pd.DataFrame":
         """获取业务推理日志（Dashboard 用）"""
         try:
-            with sqlite3.connect(cls._db_path()) as conn:
-                query = """
-                    SELECT platform, repo_name, request_number, request_url, request_title,
-                           source_branch, target_branch, author, created_at, business_summary,
-                           reasoning_categories, reasoning_details, last_commit_id
+            with cls._connect() as conn:
+                query = f"""
+                    SELECT {", ".join(LOG_COLUMNS)}
                     FROM business_reasoning_log
                     WHERE 1=1
                 """
-                params = []
-                if platform:
-                    query += " AND platform = ?"
-                    params.append(platform)
-                if repo_names:
-                    placeholders = ",".join(["?"] * len(repo_names))
-                    query += f" AND repo_name IN ({placeholders})"
-                    params.extend(repo_names)
-                if authors:
-                    placeholders = ",".join(["?"] * len(authors))
-                    query += f" AND author IN ({placeholders})"
-                    params.extend(authors)
-                if created_at_gte is not None:
-                    query += " AND created_at >= ?"
-                    params.append(created_at_gte)
-                if created_at_lte is not None:
-                    query += " AND created_at <= ?"
-                    params.append(created_at_lte)
-                query += " ORDER BY created_at DESC"
-                return pd.read_sql_query(sql=query, con=conn, params=params or None)
+                where, params = cls._build_filters(
+                    platform=platform,
+                    repo_names=repo_names,
+                    authors=authors,
+                    created_at_gte=created_at_gte,
+                    created_at_lte=created_at_lte,
+                )
+                query += where + " ORDER BY created_at DESC"
+                return _read_sql(query, conn, params or None)
         except sqlite3.DatabaseError as e:
             print(f"Error retrieving logs: {e}")
-            return pd.DataFrame()
+            return _empty_frame()
+
+    @classmethod
+    def get_logs_since(
+        cls,
+        last_id: Optional[int] = None,
+        limit: int = 200,
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> "pd.DataFrame":
+        """
+        增量读取（Dashboard 实时视图用）：id > last_id 的新记录，按 id 升序，最多 limit 条；
+        last_id 为空时返回最新的 limit 条。走主键范围扫描，耗时只与新增记录数相关。返回列：id + LOG_COLUMNS
+        """
+        where, params = cls._build_filters(
+            "l",
+            platform=platform,
+            repo_names=repo_names,
+            authors=authors,
+            created_at_gte=created_at_gte,
+            created_at_lte=created_at_lte,
+        )
+        columns = ", ".join(f"l.{c}" for c in ("id",) + LOG_COLUMNS)
+        if last_id is None:
+            query = f"""
+                SELECT * FROM (
+                    SELECT {columns} FROM business_reasoning_log l
+                    WHERE 1=1{where}
+                    ORDER BY l.id DESC
+                    LIMIT ?
+                ) ORDER BY id
+            """
+        else:
+            query = f"""
+                SELECT {columns} FROM business_reasoning_log l
+                WHERE l.id > ?{where}
+                ORDER BY l.id
+                LIMIT ?
+            """
+            params = [last_id] + params
+        try:
+            with cls._connect() as conn:
+                return _read_sql(query, conn, params + [limit])
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving new logs: {e}")
+            return _empty_frame()
+
+    @classmethod
+    def iter_logs(
+        cls,
+        columns: Tuple[str, ...] = EXPORT_COLUMNS,
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+        since_id: Optional[int] = None,
+        batch_size: int = 1000,
+    ) -> Iterator[List[tuple]]:
+        """
+        按 id 升序流式读取日志，每批（列顺序同 columns）单独按 id 续查，内存占用与总量无关；
+        批次之间不持有读锁，导出期间 Worker 仍可写入。since_id 用于增量导出：只返回 id > since_id 的记录。
+        """
+        invalid = [c for c in columns if c not in EXPORTABLE_COLUMNS]
+        if invalid:
+            raise ValueError(f"Unsupported columns: {invalid}")
+        where, params = cls._build_filters(
+            "l",
+            platform=platform,
+            repo_names=repo_names,
+            authors=authors,
+            created_at_gte=created_at_gte,
+            created_at_lte=created_at_lte,
+        )
+        select = ", ".join(
+            f"{RAW_JSON_EXPR} AS raw_reasoning_json" if c == "raw_reasoning_json" else f"l.{c}" for c in columns
+        )
+        # 首列固定为 id，用于续查，产出前去掉
+        query = f"""
+            SELECT l.id, {select}
+            FROM business_reasoning_log l
+            WHERE l.id > ?{where}
+            ORDER BY l.id
+            LIMIT ?
+        """
+        last_id = since_id or 0
+        while True:
+            with cls._connect() as conn:
+                rows = conn.execute(query, [last_id] + params + [batch_size]).fetchall()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [row[1:] for row in rows]
+
+    @classmethod
+    def iter_reasoning_raw(
+        cls,
+        since_id: Optional[int] = None,
+        batch_size: int = 1000,
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> Iterator[List[tuple]]:
+        """
+        按 id 升序分批读取 (id, raw_reasoning_json, business_summary, reasoning_categories, reasoning_details)。
+        每批单独按 id 续查，批次之间不持有读锁，调用方可在迭代过程中写回。
+        """
+        where, params = cls._build_filters(
+            "l",
+            platform=platform,
+            repo_names=repo_names,
+            authors=authors,
+            created_at_gte=created_at_gte,
+            created_at_lte=created_at_lte,
+        )
+        query = f"""
+            SELECT l.id, {RAW_JSON_EXPR}, l.business_summary, l.reasoning_categories, l.reasoning_details
+            FROM business_reasoning_log l
+            WHERE l.id > ?{where}
+            ORDER BY l.id
+            LIMIT ?
+        """
+        last_id = since_id or 0
+        while True:
+            with cls._connect() as conn:
+                rows = conn.execute(query, [last_id] + params + [batch_size]).fetchall()
+            if not rows:
+                return
+            yield rows
+            last_id = rows[-1][0]
+
+    @classmethod
+    def update_reasoning(cls, rows: List[Tuple[int, str, str, str]]) -> int:
+        """
+        批量更新 (id, business_summary, reasoning_categories, reasoning_details) 并重写分类/明细子表与二元组，
+        全文索引与趋势汇总由触发器同步；单个事务提交，返回更新条数
+        """
+        if not rows:
+            return 0
+        columns = ", ".join(FTS_COLUMNS)
+        with cls._connect() as conn:
+            conn.executemany(
+                "UPDATE business_reasoning_log "
+                "SET business_summary = ?, reasoning_categories = ?, reasoning_details = ? WHERE id = ?",
+                [(summary, categories, details, log_id) for log_id, summary, categories, details in rows],
+            )
+            for log_id, _, categories, details in rows:
+                cls._save_children(conn, log_id, categories, details)
+                texts = conn.execute(
+                    f"SELECT {columns} FROM business_reasoning_log WHERE id = ?", (log_id,)
+                ).fetchone()
+                if texts:
+                    cls._save_bigrams(conn, log_id, texts)
+            conn.commit()
+        return len(rows)
+
+    @classmethod
+    def _keyword_filter(cls, conn: sqlite3.Connection, terms: List[str]) -> Tuple[Optional[str], str, list]:
+        """
+        关键词拆分为 FTS MATCH 表达式（无可用词时为 None）与附加条件（" AND ..." 片段及参数，日志表别名 l）。
+        trigram 下不足 3 字的词无法走 FTS：两字中日韩词查二元组表，其余退化为 LIKE 匹配。
+        """
+        trigram = cls._is_trigram(conn)
+        match_terms = [t for t in terms if not trigram or len(t) >= TRIGRAM_MIN_LEN]
+        bigram_terms = [t for t in terms if t not in match_terms and len(t) == 2 and CJK_RUN_RE.fullmatch(t)]
+        where, params = "", []
+        if bigram_terms:
+            where += " AND l.id IN (SELECT rowid FROM business_reasoning_bigram WHERE business_reasoning_bigram MATCH ?)"
+            params.append(" AND ".join(f'"{t}"' for t in bigram_terms))
+        for t in terms:
+            if t in match_terms or t in bigram_terms:
+                continue
+            pattern = "%" + t.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            where += " AND (" + " OR ".join(f"l.{c} LIKE ? ESCAPE '\\'" for c in FTS_COLUMNS) + ")"
+            params.extend([pattern] * len(FTS_COLUMNS))
+        match = " AND ".join('"' + t.replace('"', '""') + '"' for t in match_terms) if match_terms else None
+        return match, where, params
+
+    @classmethod
+    def search_logs(
+        cls,
+        keyword: str,
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+        limit: int = 200,
+    ) -> "pd.DataFrame":
+        """
+        全文检索业务摘要/明细/标题/提交信息，按 bm25 相关度排序。
+        关键词以空白分隔、AND 组合；trigram 下两字中日韩词（如「退款」）查二元组表，其余不足 3 字的词退化为 LIKE 匹配。
+        """
+        terms = [t for t in (keyword or "").split() if t]
+        if not terms:
+            return cls.get_logs(platform, repo_names, authors, created_at_gte, created_at_lte)
+        try:
+            with cls._connect() as conn:
+                match, like_where, like_params = cls._keyword_filter(conn, terms)
+                where, params = cls._build_filters(
+                    "l",
+                    platform=platform,
+                    repo_names=repo_names,
+                    authors=authors,
+                    created_at_gte=created_at_gte,
+                    created_at_lte=created_at_lte,
+                )
+                where += like_where
+                params.extend(like_params)
+
+                columns = ", ".join(f"l.{c}" for c in LOG_COLUMNS)
+                if match:
+                    weights = ", ".join(str(w) for w in FTS_WEIGHTS)
+                    query = f"""
+                        SELECT {columns}, bm25(business_reasoning_fts, {weights}) AS rank
+                        FROM business_reasoning_fts
+                        JOIN business_reasoning_log l ON l.id = business_reasoning_fts.rowid
+                        WHERE business_reasoning_fts MATCH ?{where}
+                        ORDER BY rank
+                        LIMIT ?
+                    """
+                    params = [match] + params
+                else:
+                    query = f"""
+                        SELECT {columns}
+                        FROM business_reasoning_log l
+                        WHERE 1=1{where}
+                        ORDER BY l.created_at DESC
+                        LIMIT ?
+                    """
+                params.append(limit)
+                return _read_sql(query, conn, params)
+        except sqlite3.DatabaseError as e:
+            print(f"Error searching logs: {e}")
+            return _empty_frame()
+
+    @classmethod
+    def query_logs(
+        cls,
+        fields: Tuple[str, ...] = ("id",) + LOG_COLUMNS,
+        keyword: Optional[str] = None,
+        before_id: Optional[int] = None,
+        limit: int = 50,
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> List[dict]:
+        """
+        读取接口用：按 id 倒序的 keyset 分页（before_id 为上一页最后一条的 id），不依赖 pandas。
+        keyword 与 search_logs 相同的匹配规则，但结果同样按 id 倒序，保证翻页稳定。
+        """
+        invalid = [f for f in fields if f not in API_FIELDS]
+        if invalid:
+            raise ValueError(f"Unsupported fields: {invalid}")
+        where, params = cls._build_filters(
+            "l",
+            platform=platform,
+            repo_names=repo_names,
+            authors=authors,
+            created_at_gte=created_at_gte,
+            created_at_lte=created_at_lte,
+        )
+        if before_id is not None:
+            where += " AND l.id < ?"
+            params.append(before_id)
+        try:
+            with cls._connect() as conn:
+                conn.row_factory = sqlite3.Row
+                terms = [t for t in (keyword or "").split() if t]
+                if terms:
+                    match, like_where, like_params = cls._keyword_filter(conn, terms)
+                    if match:
+                        where += " AND l.id IN (SELECT rowid FROM business_reasoning_fts WHERE business_reasoning_fts MATCH ?)"
+                        params.append(match)
+                    where += like_where
+                    params.extend(like_params)
+                query = f"""
+                    SELECT {", ".join(f"l.{f}" for f in fields)}
+                    FROM business_reasoning_log l
+                    WHERE 1=1{where}
+                    ORDER BY l.id DESC
+                    LIMIT ?
+                """
+                return [dict(row) for row in conn.execute(query, params + [limit])]
+        except sqlite3.DatabaseError as e:
+            print(f"Error querying logs: {e}")
+            return []
+
+    @classmethod
+    def get_log(cls, log_id: int, include_raw: bool = False) -> Optional[dict]:
+        """单条记录（全部 API_FIELDS，可选附带解压后的 raw_reasoning_json）"""
+        columns = ", ".join(f"l.{f}" for f in API_FIELDS)
+        if include_raw:
+            columns += f", {RAW_JSON_EXPR} AS raw_reasoning_json"
+        try:
+            with cls._connect() as conn:
+                conn.row_factory = sqlite3.Row
+                row = conn.execute(
+                    f"SELECT {columns} FROM business_reasoning_log l WHERE l.id = ?", (log_id,)
+                ).fetchone()
+                return dict(row) if row else None
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving log {log_id}: {e}")
+            return None
+
+    @classmethod
+    def get_facets(cls, limit: int = 50, **filters) -> dict:
+        """筛选条件下各维度（平台、仓库、作者、分类）的记录数，每个维度按数量取前 limit 项"""
+        where, params = cls._build_filters("l", **filters)
+        facets = {}
+        try:
+            with cls._connect() as conn:
+                for column in FACET_COLUMNS:
+                    if column == "category":
+                        source, key = "business_reasoning_category c JOIN business_reasoning_log l ON l.id = c.log_id", "c.category"
+                    else:
+                        source, key = "business_reasoning_log l", f"l.{column}"
+                    rows = conn.execute(
+                        f"""
+                        SELECT {key}, COUNT(*) FROM {source}
+                        WHERE {key} IS NOT NULL AND {key} != ''{where}
+                        GROUP BY 1 ORDER BY 2 DESC, 1 LIMIT ?
+                        """,
+                        params + [limit],
+                    ).fetchall()
+                    facets[column] = [{"value": value, "count": count} for value, count in rows]
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving facets: {e}")
+        return facets
+
+    @classmethod
+    def _aggregate(
+        cls,
+        child_table: str,
+        key_column: str,
+        group_by: Tuple[str, ...],
+        period: Optional[str],
+        **filters,
+    ) -> "pd.DataFrame":
+        invalid = [c for c in group_by if c not in GROUP_COLUMNS]
+        if invalid:
+            raise ValueError(f"Unsupported group_by columns: {invalid}")
+        if period is not None and period not in PERIOD_EXPRS:
+            raise ValueError(f"Unsupported period: {period}")
+        keys = [f"l.{c} AS {c}" for c in group_by]
+        if period:
+            keys.append(f"{PERIOD_EXPRS[period].format('l')} AS bucket")
+        keys.append(f"c.{key_column} AS {key_column}")
+        group = ", ".join(str(i + 1) for i in range(len(keys)))
+        where, params = cls._build_filters("l", **filters)
+        query = f"""
+            SELECT {", ".join(keys)}, COUNT(DISTINCT c.log_id) AS count
+            FROM {child_table} c
+            JOIN business_reasoning_log l ON l.id = c.log_id
+            WHERE 1=1{where}
+            GROUP BY {group}
+            ORDER BY {group}
+        """
+        try:
+            with cls._connect() as conn:
+                return _read_sql(query, conn, params or None)
+        except sqlite3.DatabaseError as e:
+            print(f"Error aggregating {child_table}: {e}")
+            return _empty_frame()
+
+    @classmethod
+    def get_category_stats(
+        cls,
+        group_by: Tuple[str, ...] = (),
+        period: Optional[str] = None,
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> "pd.DataFrame":
+        """
+        按分类统计变更数，如「每个仓库每周的功能新增数」：
+        get_category_stats(group_by=("repo_name",), period="week")
+        返回列：group_by 各列、bucket（指定 period 时）、category、count
+        """
+        return cls._aggregate(
+            "business_reasoning_category", "category", tuple(group_by), period,
+            platform=platform, repo_names=repo_names, authors=authors,
+            created_at_gte=created_at_gte, created_at_lte=created_at_lte,
+        )
+
+    @classmethod
+    def get_detail_area_stats(
+        cls,
+        group_by: Tuple[str, ...] = (),
+        period: Optional[str] = None,
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> "pd.DataFrame":
+        """按业务模块 (details.area) 统计涉及的变更数，返回列同 get_category_stats（area 代替 category）"""
+        return cls._aggregate(
+            "business_reasoning_detail", "area", tuple(group_by), period,
+            platform=platform, repo_names=repo_names, authors=authors,
+            created_at_gte=created_at_gte, created_at_lte=created_at_lte,
+        )
+
+    @classmethod
+    def get_llm_usage_stats(
+        cls,
+        period: str = "day",
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> "pd.DataFrame":
+        """
+        按时间桶统计 LLM 调用量、prompt/缓存命中 token 与平均耗时，
+        返回列：bucket, calls, prompt_tokens, cached_tokens, completion_tokens, avg_latency_ms
+        """
+        if period not in PERIOD_EXPRS:
+            raise ValueError(f"Unsupported period: {period}")
+        where, params = cls._build_filters(
+            "l", platform=platform, repo_names=repo_names, authors=authors,
+            created_at_gte=created_at_gte, created_at_lte=created_at_lte,
+        )
+        query = f"""
+            SELECT {PERIOD_EXPRS[period].format('l')} AS bucket,
+                   COUNT(*) AS calls,
+                   SUM(l.prompt_tokens) AS prompt_tokens,
+                   SUM(COALESCE(l.cached_tokens, 0)) AS cached_tokens,
+                   SUM(l.completion_tokens) AS completion_tokens,
+                   CAST(AVG(l.llm_latency_ms) AS INTEGER) AS avg_latency_ms
+            FROM business_reasoning_log l
+            WHERE l.prompt_tokens IS NOT NULL{where}
+            GROUP BY 1
+            ORDER BY 1
+        """
+        try:
+            with cls._connect() as conn:
+                return _read_sql(query, conn, params or None)
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving LLM usage stats: {e}")
+            return _empty_frame()
+
+    @staticmethod
+    def _bucket_of(period: str, ts: int) -> str:
+        d = datetime.date.fromtimestamp(ts)
+        if period == "week":
+            d -= datetime.timedelta(days=d.weekday())
+        return d.isoformat()
+
+    @classmethod
+    def get_trends(
+        cls,
+        period: str = "day",
+        dimension: str = "repo_name",
+        platform: Optional[str] = None,
+        repo_names: Optional[List[str]] = None,
+        authors: Optional[List[str]] = None,
+        created_at_gte: Optional[int] = None,
+        created_at_lte: Optional[int] = None,
+    ) -> "pd.DataFrame":
+        """
+        从汇总表读取变更趋势，耗时只与时间桶数量相关，与历史总量无关。
+        返回列：bucket、dimension 对应列、count
+        """
+        if period not in PERIOD_EXPRS:
+            raise ValueError(f"Unsupported period: {period}")
+        if dimension not in TREND_DIMENSIONS:
+            raise ValueError(f"Unsupported dimension: {dimension}")
+        where, params = cls._build_filters(platform=platform, repo_names=repo_names, authors=authors)
+        if created_at_gte is not None:
+            where += " AND bucket >= ?"
+            params.append(cls._bucket_of(period, created_at_gte))
+        if created_at_lte is not None:
+            where += " AND bucket <= ?"
+            params.append(cls._bucket_of(period, created_at_lte))
+        where += " AND category != ''" if dimension == "category" else " AND category = ''"
+        query = f"""
+            SELECT bucket, {dimension}, SUM(count) AS count
+            FROM business_reasoning_rollup
+            WHERE period = ?{where}
+            GROUP BY bucket, {dimension}
+            HAVING SUM(count) > 0
+            ORDER BY bucket
+        """
+        try:
+            with cls._connect() as conn:
+                return _read_sql(query, conn, [period] + params)
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving trends: {e}")
+            return _empty_frame()
+
+    @classmethod
+    def get_filter_options(cls) -> dict:
+        """筛选项（仓库、作者）取自汇总表，避免全表扫描"""
+        try:
+            with cls._connect() as conn:
+                rows = conn.execute(
+                    "SELECT DISTINCT repo_name, author FROM business_reasoning_rollup "
+                    "WHERE period = 'week' AND category = '' AND count > 0"
+                ).fetchall()
+        except sqlite3.DatabaseError as e:
+            print(f"Error retrieving filter options: {e}")
+            rows = []
+        return {
+            "repo_names": sorted({r[0] for r in rows if r[0]}),
+            "authors": sorted({r[1] for r in rows if r[1]}),
+        }
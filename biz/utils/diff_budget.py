@@ -0,0 +1,119 @@
+"""
+大 MR 的 diff 体积控制：单文件超限时只保留开头部分并附上统计，整个 MR 超限后其余文件只列出路径与增删行数。
+配合分页获取与生成器式过滤，fetch -> filter -> render 全程只持有当前页与已渲染文本，内存占用与 MR 总大小无关。
+
+环境变量（单位 KB，按 UTF-8 字节数计）：
+- MAX_FILE_DIFF_KB：单文件 diff 上限，默认 100
+- MAX_MR_DIFF_KB：单个 MR 渲染进 prompt 的 diff 总量上限，默认 1024
+"""
+import os
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from biz.utils.diff_parser import parse_change, utf8_prefix, utf8_size
+
+# 渲染进 prompt 的字段；clip_changes/filter_changes 附带的 parsed（解析结果，供过滤与签名复用）不进入 prompt
+RENDER_KEYS = ("diff", "new_path", "additions", "deletions")
+# MR 超限后，仅列路径的文件最多再占用 MR 上限的这一比例，之后只计数
+OMITTED_LIST_RATIO = 0.1
+
+
+def max_file_diff_size() -> int:
+    return int(os.getenv("MAX_FILE_DIFF_KB", "100")) * 1024
+
+
+def max_mr_diff_size() -> int:
+    return int(os.getenv("MAX_MR_DIFF_KB", "1024")) * 1024
+
+
+def truncation_note(size: int, additions: int, deletions: int) -> str:
+    return f"\n... diff 过大已截断（共 {size // 1024}KB，+{additions} -{deletions}）\n"
+
+
+def clip_changes(changes: Iterable[dict], limit: int = None) -> Iterator[dict]:
+    """
+    在过滤前逐个截断超大文件：在最后一个完整行处截断并附上原始规模，原始长文本随即释放。
+    超大文件在截断前解析一次，完整的增删行数与截断后的 hunk 结构以 parsed 随 change 传递，
+    过滤阶段直接复用，不再重新统计。
+    """
+    limit = max_file_diff_size() if limit is None else limit
+    for item in changes:
+        key = "diff" if item.get("diff") else "patch"
+        text = item.get(key) or ""
+        if utf8_size(text) > limit:
+            parsed = parse_change(item)
+            item.setdefault("additions", parsed.additions)
+            item.setdefault("deletions", parsed.deletions)
+            end = utf8_prefix(text, limit)
+            cut = text.rfind("\n", 0, end)
+            clipped = parsed.clip(
+                cut + 1 if cut > 0 else end, truncation_note(parsed.size, parsed.additions, parsed.deletions)
+            )
+            item[key] = clipped
+            if key == "diff" and "patch" in item:
+                item["patch"] = clipped
+            item["truncated"] = True
+            item["parsed"] = parsed
+            del text
+        yield item
+
+
+class DiffRenderer:
+    """
+    增量渲染过滤后的 changes，输出与 str(list_of_dicts) 相同格式的 prompt 文本；
+    累计超过 MR 上限后不再展开 diff，仅保留路径与增删行数，最后汇总未列出的文件数。
+    on_expand 对每个完整展开进 prompt 的 change 调用（如计算近似重复签名）。
+    """
+
+    def __init__(self, limit: int = None, on_expand: Optional[Callable[[dict], None]] = None):
+        self.limit = max_mr_diff_size() if limit is None else limit
+        self.on_expand = on_expand
+        self.size = 0
+        self.files = 0
+        self.truncated = 0
+        self.omitted = 0
+        self.unlisted = 0
+        self.unlisted_additions = 0
+        self.unlisted_deletions = 0
+        self._parts = []
+
+    def add(self, change: dict):
+        self.files += 1
+        if change.get("truncated"):
+            self.truncated += 1
+        entry = {k: change[k] for k in RENDER_KEYS if k in change}
+        if self.size < self.limit:
+            self._append(repr(entry))
+            if self.on_expand is not None:
+                self.on_expand(change)
+            return
+        self.omitted += 1
+        if self.size < self.limit * (1 + OMITTED_LIST_RATIO):
+            entry["diff"] = "（超出单个 MR 的 diff 上限，未展开）"
+            self._append(repr(entry))
+        else:
+            self.unlisted += 1
+            self.unlisted_additions += entry.get("additions") or 0
+            self.unlisted_deletions += entry.get("deletions") or 0
+
+    def _append(self, part: str):
+        self._parts.append(part)
+        self.size += utf8_size(part) + 2
+
+    def render(self) -> str:
+        parts = self._parts
+        if self.unlisted:
+            parts = parts + [repr({
+                "diff": f"另有 {self.unlisted} 个文件（+{self.unlisted_additions} -{self.unlisted_deletions}）未列出",
+                "new_path": "...",
+            })]
+        return "[" + ", ".join(parts) + "]"
+
+
+def render_changes(
+    changes: Iterable[dict], limit: int = None, on_expand: Optional[Callable[[dict], None]] = None
+) -> Tuple[str, DiffRenderer]:
+    """消费 changes 迭代器并渲染，返回 (prompt 文本, 渲染统计)"""
+    renderer = DiffRenderer(limit, on_expand)
+    for change in changes:
+        renderer.add(change)
+    return renderer.render(), renderer
@@ -0,0 +1,130 @@
+"""
+统一 diff 解析：每个文件的 unified diff 只解析一次，得到 hunk 结构与增删行数，
+结果随 change 传递：截断（clip_changes）、过滤（filter_changes）、近似重复签名（MinHasher）复用同一份结果，
+避免对同一段文本反复正则/拆分。
+"""
+import re
+from typing import List, Optional, Tuple
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@", re.MULTILINE)
+
+
+def _count_lines(text: str, prefix: str, start: int = 0, end: Optional[int] = None) -> int:
+    """
+    统计 [start, end) 内以 prefix 开头、但不以 prefix*3 开头的行数（即 ^\+(?!\+\+) 语义）。
+    使用 C 实现的 str.count 按偏移计数，不切片、不为每行创建匹配对象。
+    """
+    end = len(text) if end is None else end
+    n = text.count("\n" + prefix, start, end) - text.count("\n" + prefix * 3, start, end)
+    if start == 0 and text.startswith(prefix) and not text.startswith(prefix * 3):
+        n += 1
+    return n
+
+
+def utf8_size(text: str) -> int:
+    """文本的 UTF-8 字节数（各 *_KB 上限的计量单位）；纯 ASCII 时 str.isascii 为 O(1)，无需编码"""
+    return len(text) if text.isascii() else len(text.encode("utf-8"))
+
+
+def utf8_prefix(text: str, limit: int) -> int:
+    """UTF-8 编码后不超过 limit 字节的最长前缀的字符数"""
+    if text.isascii():
+        return min(len(text), limit)
+    return len(text.encode("utf-8")[:limit].decode("utf-8", "ignore"))
+
+
+class Hunk:
+    __slots__ = ("old_start", "old_count", "new_start", "new_count", "start", "end")
+
+    def __init__(self, old_start: int, old_count: int, new_start: int, new_count: int, start: int):
+        self.old_start = old_start
+        self.old_count = old_count
+        self.new_start = new_start
+        self.new_count = new_count
+        # 在 diff 文本中的起止偏移，需要时再切片，避免复制内容
+        self.start = start
+        self.end = start
+
+
+class ParsedDiff:
+    """单个文件的解析结果"""
+
+    __slots__ = ("text", "new_path", "hunks", "additions", "deletions", "size", "is_binary")
+
+    def __init__(self, text: str, new_path: str):
+        # 持有原 diff 字符串的引用（不复制），hunk 内容按偏移按需切片
+        self.text = text
+        self.new_path = new_path
+        self.hunks: List[Hunk] = []
+        # 增删行数与 UTF-8 字节数均为完整 diff 的值，截断后保持不变
+        self.additions = 0
+        self.deletions = 0
+        self.size = 0
+        self.is_binary = False
+
+    def hunk_text(self, hunk: Hunk) -> str:
+        return self.text[hunk.start:hunk.end]
+
+    def clip(self, end: int, note: str = "") -> str:
+        """
+        在字符偏移 end 处截断 diff 并附加 note，返回截断后的文本：
+        丢弃 end 之后开始的 hunk，末个 hunk 止于 end（不含 note），增删行数与 size 保留原值。
+        """
+        self.text = self.text[:end] + note
+        while self.hunks and self.hunks[-1].start >= end:
+            self.hunks.pop()
+        if self.hunks:
+            self.hunks[-1].end = min(self.hunks[-1].end, end)
+        return self.text
+
+    @property
+    def is_pure_deletion(self) -> bool:
+        """仅删除内容（新文件侧为空），如整文件删除"""
+        return bool(self.hunks) and self.additions == 0 and all(h.new_count == 0 for h in self.hunks)
+
+    def __repr__(self):
+        return (
+            f"ParsedDiff({self.new_path!r}, +{self.additions} -{self.deletions}, "
+            f"hunks={len(self.hunks)}, size={self.size})"
+        )
+
+
+def count_changes(text: str) -> Tuple[int, int]:
+    """仅统计 (新增行数, 删除行数)，不解析 hunk"""
+    return _count_lines(text, "+"), _count_lines(text, "-")
+
+
+def parse_diff(text: str, new_path: str = "") -> ParsedDiff:
+    """解析 unified diff 文本（可带或不带 diff --git 文件头）：正则只定位 hunk 头，行数统计走 str.count"""
+    text = text or ""
+    parsed = ParsedDiff(text, new_path)
+    parsed.size = utf8_size(text)
+    if not text:
+        return parsed
+    head = text[:512]
+    if head.startswith("Binary files") or "\nBinary files " in head or "GIT binary patch" in head:
+        parsed.is_binary = True
+        return parsed
+
+    parsed.additions, parsed.deletions = count_changes(text)
+    hunk = None
+    for m in _HUNK_RE.finditer(text):
+        if hunk is not None:
+            hunk.end = m.start()
+        hunk = Hunk(
+            int(m.group(1)),
+            int(m.group(2)) if m.group(2) is not None else 1,
+            int(m.group(3)),
+            int(m.group(4)) if m.group(4) is not None else 1,
+            m.start(),
+        )
+        parsed.hunks.append(hunk)
+    if hunk is not None:
+        hunk.end = len(text)
+    return parsed
+
+
+def parse_change(item: dict) -> ParsedDiff:
+    """从各平台的 change/file 字典解析（GitLab changes、GitHub/Gitea files 格式）"""
+    new_path = item.get("new_path") or item.get("filename") or item.get("path") or ""
+    return parse_diff(item.get("diff") or item.get("patch") or "", new_path)
@@ -0,0 +1,109 @@
+"""
+diff 近似重复检测：对过滤后 diff 的增删行做 MinHash 签名，配合 LSH 分桶在 SQLite 中检索相似的历史记录，
+用于识别回合到多个发布分支、或换目标分支重开的 MR。
+
+- 只取 +/- 行并压缩空白，忽略上下文行与 hunk 头（行号在不同分支间会变化）
+- 128 个哈希函数，分 16 段 × 8 行做 LSH，相似度约 0.7 以上的记录才会落入同一桶
+"""
+import os
+import random
+import struct
+import zlib
+from typing import Iterable, List, Optional, Tuple
+
+from biz.utils.diff_parser import ParsedDiff
+
+NUM_PERM = 128
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERM // LSH_BANDS
+
+_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+
+def _permutations() -> List[Tuple[int, int]]:
+    # 固定种子，保证签名跨进程、跨版本可比
+    rng = random.Random(0x5EED)
+    return [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+
+_PERMS = _permutations()
+
+NEAR_DUP_MODES = ("off", "index", "reuse", "reference")
+
+
+def near_dup_mode() -> str:
+    """
+    NEAR_DUP_MODE：
+    - off（默认）：不计算签名
+    - index：仅计算并保存签名，不影响推理
+    - reuse：相似度达到阈值时直接复用历史推理结果，不调用 LLM
+    - reference：将历史结果作为参考，使用精简的更新 prompt 调用 LLM
+    """
+    mode = os.getenv("NEAR_DUP_MODE", "off").lower()
+    return mode if mode in NEAR_DUP_MODES else "off"
+
+
+def near_dup_threshold() -> float:
+    return float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))
+
+
+class MinHasher:
+    """逐文件累积 diff 的增删行，最后生成签名"""
+
+    def __init__(self):
+        self._hashes = set()
+
+    def update(self, diff: str):
+        for line in (diff or "").splitlines():
+            if not line or line[0] not in "+-" or line.startswith(("+++", "---")):
+                continue
+            normalized = line[0] + " ".join(line[1:].split())
+            self._hashes.add(zlib.crc32(normalized.encode("utf-8")))
+
+    def update_change(self, change: dict):
+        """
+        过滤后的 change：复用其中 parsed 的解析结果，只扫描各 hunk 的内容，跳过文件头与截断说明；
+        二进制 diff 不含增删行，直接跳过。没有 parsed 或没有 hunk 头的 diff 按全文处理。
+        """
+        parsed: Optional[ParsedDiff] = change.get("parsed")
+        if parsed is None:
+            self.update(change.get("diff"))
+            return
+        if parsed.is_binary:
+            return
+        if not parsed.hunks:
+            self.update(parsed.text)
+            return
+        for hunk in parsed.hunks:
+            self.update(parsed.hunk_text(hunk))
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def signature(self) -> Optional[List[int]]:
+        """无增删行时返回 None"""
+        if not self._hashes:
+            return None
+        values = list(self._hashes)
+        return [min((a * x + b) % _PRIME for x in values) & _MAX_HASH for a, b in _PERMS]
+
+
+def similarity(sig1: List[int], sig2: List[int]) -> float:
+    """估计 Jaccard 相似度：签名中相等位置的比例"""
+    return sum(1 for x, y in zip(sig1, sig2) if x == y) / NUM_PERM
+
+
+def lsh_buckets(signature: List[int]) -> Iterable[Tuple[int, int]]:
+    """(band, bucket)：每段 LSH_ROWS 个值的 crc32"""
+    for band in range(LSH_BANDS):
+        rows = signature[band * LSH_ROWS:(band + 1) * LSH_ROWS]
+        yield band, zlib.crc32(struct.pack(f"<{LSH_ROWS}I", *rows))
+
+
+def pack(signature: List[int]) -> bytes:
+    return struct.pack(f"<{NUM_PERM}I", *signature)
+
+
+def unpack(blob: bytes) -> List[int]:
+    return list(struct.unpack(f"<{NUM_PERM}I", blob))
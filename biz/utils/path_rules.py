@@ -0,0 +1,215 @@
+"""
+文件路径过滤规则：扩展名 + include/exclude glob + 生成文件识别。
+规则在进程内只编译一次，GitLab/GitHub/Gitea 的 filter_changes 共用。
+
+环境变量：
+- SUPPORTED_EXTENSIONS：保留的扩展名，逗号分隔
+- INCLUDE_PATHS：额外保留的路径 glob（不受扩展名限制），逗号分隔
+- EXCLUDE_PATHS：排除的路径 glob，逗号分隔；未设置时使用 DEFAULT_EXCLUDE_PATHS，设为空串则不排除
+- DETECT_GENERATED_FILES：是否根据 diff 内容识别生成/压缩文件，默认 true；
+  生成标记只在文件开头几行中查找（新文件或从第 1 行开始的 hunk），文件中间的注释不会误判
+
+glob 语法：`*` 不跨目录，`**` 跨任意层目录，`?` 单个字符；不含 `/` 的模式匹配任意目录下的文件名。
+"""
+import os
+import re
+from functools import lru_cache
+from typing import Iterable
+
+DEFAULT_EXTENSIONS = ".java,.py,.php"
+DEFAULT_EXCLUDE_PATHS = ",".join((
+    "**/vendor/**",
+    "**/node_modules/**",
+    "**/third_party/**",
+    "*.min.js",
+    "*.min.css",
+    "*.lock",
+    "package-lock.json",
+    "pnpm-lock.yaml",
+    "go.sum",
+    "*.pb.go",
+    "*_pb2.py",
+    "*_pb2_grpc.py",
+))
+
+# 生成文件标记：@generated、C# 的 <auto-generated>，或同一行同时出现 generated 与 DO NOT EDIT
+# （Go 的 "Code generated ... DO NOT EDIT."、protoc 等）；只在文件前 GENERATED_SCAN_LINES 行中查找
+GENERATED_MARKER_RE = re.compile(
+    r"@generated|<auto-generated|\bgenerated\b.*\bDO NOT EDIT\b|\bDO NOT EDIT\b.*\bgenerated\b", re.IGNORECASE
+)
+GENERATED_SCAN_LINES = 5
+GENERATED_SCAN_BYTES = 4096
+# hunk 头中新文件的起始行号
+_HUNK_NEW_START = re.compile(r"@@ -\d+(?:,\d+)? \+(\d+)")
+# 单行超过该长度视为压缩文件
+MINIFIED_LINE_LENGTH = 2000
+
+
+def _split(value: str) -> list:
+    return [v.strip() for v in (value or "").split(",") if v.strip()]
+
+
+def glob_to_regex(pattern: str) -> str:
+    """将 glob 转换为供 re.search 使用的正则：`**/` 前缀匹配任意目录层级，`/**` 后缀匹配目录下全部文件"""
+    prefix, suffix = r"\A", r"\Z"
+    if pattern.startswith("**/"):
+        prefix, pattern = "(?:^|/)", pattern[3:]
+    pattern = pattern.lstrip("/")
+    if pattern.endswith("/**"):
+        suffix, pattern = "/", pattern[:-3]
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+        elif pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+        elif pattern[i] == "*":
+            out.append("[^/]*")
+            i += 1
+        elif pattern[i] == "?":
+            out.append("[^/]")
+            i += 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return prefix + "".join(out) + suffix
+
+
+class GlobSet:
+    """
+    一组 glob 预编译为五类匹配，避免逐条匹配：
+    文件名后缀（`*.lock`）走 str.endswith，精确文件名走 set 查找，
+    任意层级的目录（`**/vendor/**`）走子串查找，其余文件名模式与路径模式各合并为一个正则。
+    """
+
+    def __init__(self, globs: Iterable[str]):
+        suffixes, names, dirs, name_patterns, path_patterns = [], set(), [], [], []
+        for g in globs:
+            if g.startswith("**/") and g.endswith("/**") and not any(ch in g[3:-3] for ch in "*?"):
+                dirs.append(g[3:-3].strip("/"))
+            elif "/" in g:
+                path_patterns.append(glob_to_regex(g))
+            elif g.startswith("*") and not any(ch in g[1:] for ch in "*?"):
+                suffixes.append(g[1:])
+            elif not any(ch in g for ch in "*?"):
+                names.add(g)
+            else:
+                name_patterns.append(glob_to_regex(g))
+        self.suffixes = tuple(suffixes)
+        self.names = names
+        # 目录位于路径开头（vendor/...）或中间（.../vendor/...）
+        self.dir_prefixes = tuple(d + "/" for d in dirs)
+        self.dir_needles = tuple("/" + d + "/" for d in dirs)
+        self.name_regex = re.compile("|".join(name_patterns)) if name_patterns else None
+        self.path_regex = re.compile("|".join(path_patterns)) if path_patterns else None
+        self.empty = not (suffixes or names or dirs or name_patterns or path_patterns)
+
+    def match(self, path: str) -> bool:
+        if self.empty:
+            return False
+        if self.suffixes and path.endswith(self.suffixes):
+            return True
+        if self.dir_prefixes and (
+            path.startswith(self.dir_prefixes) or any(needle in path for needle in self.dir_needles)
+        ):
+            return True
+        name = path[path.rfind("/") + 1:]
+        if name in self.names:
+            return True
+        if self.name_regex is not None and self.name_regex.search(name):
+            return True
+        return self.path_regex is not None and self.path_regex.search(path) is not None
+
+
+class PathRules:
+    def __init__(
+        self,
+        extensions: Iterable[str],
+        include_paths: Iterable[str] = (),
+        exclude_paths: Iterable[str] = (),
+        detect_generated: bool = True,
+    ):
+        self.extensions = tuple(extensions)
+        # 单段扩展名（.java）按最后一个后缀查 set，多段扩展名（.d.ts）仍用 endswith
+        self._ext_set = frozenset(e for e in self.extensions if e.count(".") == 1 and e.startswith("."))
+        self._ext_multi = tuple(e for e in self.extensions if e not in self._ext_set)
+        self.include = GlobSet(include_paths)
+        self.exclude = GlobSet(exclude_paths)
+        self.detect_generated = detect_generated
+
+    @classmethod
+    def from_env(cls) -> "PathRules":
+        return cls(
+            extensions=_split(os.getenv("SUPPORTED_EXTENSIONS", DEFAULT_EXTENSIONS)),
+            include_paths=_split(os.getenv("INCLUDE_PATHS", "")),
+            exclude_paths=_split(os.getenv("EXCLUDE_PATHS", DEFAULT_EXCLUDE_PATHS)),
+            detect_generated=os.getenv("DETECT_GENERATED_FILES", "true").lower() in ("1", "true", "yes"),
+        )
+
+    def match_extension(self, path: str) -> bool:
+        dot = path.rfind(".")
+        if dot >= 0 and path[dot:] in self._ext_set:
+            return True
+        return bool(self._ext_multi) and path.endswith(self._ext_multi)
+
+    def match_path(self, path: str) -> bool:
+        if not path:
+            return False
+        if not self.match_extension(path) and not self.include.match(path):
+            return False
+        return not self.exclude.match(path)
+
+    @staticmethod
+    def leading_lines(head: str) -> list:
+        """
+        diff 覆盖文件开头时（新文件或从第 1 行开始的 hunk），返回新文件的前 GENERATED_SCAN_LINES 行；
+        否则返回空列表。没有 hunk 头的内容视为文件全文。
+        """
+        if head.startswith("@@"):
+            pos = 0
+        else:
+            pos = head.find("\n@@") + 1
+            if not pos:
+                return head.split("\n", GENERATED_SCAN_LINES)[:GENERATED_SCAN_LINES]
+        hunk = _HUNK_NEW_START.match(head, pos)
+        if hunk is None or int(hunk.group(1)) > 1:
+            return []
+        leading = []
+        # 删除行不计入新文件内容，多取几行
+        for line in head[pos:].split("\n", GENERATED_SCAN_LINES * 4)[1:]:
+            if line.startswith(("+", " ")):
+                leading.append(line[1:])
+                if len(leading) >= GENERATED_SCAN_LINES:
+                    break
+            elif not line.startswith(("-", "\\")):
+                break  # 下一个 hunk
+        return leading
+
+    def is_generated(self, diff: str) -> bool:
+        """根据文件开头几行的生成标记或超长行判断是否为生成/压缩文件"""
+        if not diff:
+            return False
+        head = diff if len(diff) <= GENERATED_SCAN_BYTES else diff[:GENERATED_SCAN_BYTES]
+        # 所有标记都含 generated：绝大多数 diff 在这次子串判断后即可跳过逐行解析
+        if ("enerated" in head or "ENERATED" in head) and any(
+            GENERATED_MARKER_RE.search(line) for line in self.leading_lines(head)
+        ):
+            return True
+        # 压缩文件：开头几行中出现超长行（内容不足一行阈值时无需检查）
+        if len(head) < MINIFIED_LINE_LENGTH:
+            return False
+        return any(len(line) >= MINIFIED_LINE_LENGTH for line in head.split("\n", 8)[:8])
+
+    def accept(self, path: str, diff: str = "") -> bool:
+        if not self.match_path(path):
+            return False
+        return not (self.detect_generated and self.is_generated(diff))
+
+
+@lru_cache(maxsize=1)
+def get_path_rules() -> PathRules:
+    """进程内缓存的规则（环境变量在进程启动时确定）"""
+    return PathRules.from_env()
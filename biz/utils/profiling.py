@@ -0,0 +1,161 @@
+"""
+按需性能剖析：对 Worker 任务同时启用 cProfile 与 tracemalloc，定位个别 MR 的耗时与内存热点。
+
+环境变量：
+- PROFILE_JOBS：true 时对所有仓库的任务按采样率剖析
+- PROFILE_REPOS：仅剖析这些仓库（repo_name，glob 逗号分隔），设置后无需 PROFILE_JOBS
+- PROFILE_SAMPLE_RATE：采样比例 0~1，默认 1
+- PROFILE_DIR：输出目录，默认 data/profiles
+- PROFILE_TOP_N：报告中保留的函数/分配位置条数，默认 30
+
+输出：PROFILE_DIR/<platform>/<repo>/<request_number>-<时间>.{prof,txt,json}，
+.prof 可用 snakeviz / python -m pstats 打开，.txt 为耗时与内存分配 Top N 报告，.json 为摘要。
+"""
+import cProfile
+import fnmatch
+import functools
+import glob
+import inspect
+import io
+import json
+import os
+import pstats
+import random
+import re
+import time
+import tracemalloc
+from datetime import datetime
+from typing import List, Optional
+
+from biz.utils.log import logger
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+PROFILE_EXTS = ("prof", "txt", "json")
+
+_UNSAFE = re.compile(r"[^\w.-]+")
+
+
+def profile_dir() -> str:
+    path = os.getenv("PROFILE_DIR", "data/profiles")
+    return path if os.path.isabs(path) else os.path.join(ROOT, path)
+
+
+def _safe(part) -> str:
+    return _UNSAFE.sub("_", str(part)).strip("._") or "_"
+
+
+def should_profile(repo_name: str) -> bool:
+    patterns = [p.strip() for p in os.getenv("PROFILE_REPOS", "").split(",") if p.strip()]
+    if patterns:
+        enabled = any(fnmatch.fnmatch(repo_name or "", p) for p in patterns)
+    else:
+        enabled = os.getenv("PROFILE_JOBS", "false").lower() == "true"
+    return enabled and random.random() < float(os.getenv("PROFILE_SAMPLE_RATE", "1"))
+
+
+def _report(profiler: cProfile.Profile, snapshot: tracemalloc.Snapshot, summary: dict, top_n: int) -> str:
+    out = io.StringIO()
+    out.write(json.dumps(summary, ensure_ascii=False, indent=2) + "\n\n")
+    out.write(f"== cProfile: top {top_n} by cumulative time ==\n")
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(top_n)
+    out.write(f"\n== tracemalloc: top {top_n} allocation sites (live at job end) ==\n")
+    snapshot = snapshot.filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, cProfile.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    for stat in snapshot.statistics("lineno")[:top_n]:
+        out.write(f"{stat}\n")
+    return out.getvalue()
+
+
+def _save(platform: str, repo_name: str, request_number, profiler, snapshot, summary: dict) -> str:
+    directory = os.path.join(profile_dir(), _safe(platform), _safe(repo_name))
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.join(directory, f"{_safe(request_number)}-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    profiler.dump_stats(f"{stem}.prof")
+    with open(f"{stem}.txt", "w", encoding="utf-8") as f:
+        f.write(_report(profiler, snapshot, summary, int(os.getenv("PROFILE_TOP_N", "30"))))
+    with open(f"{stem}.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False)
+    return stem
+
+
+def profile_job(func):
+    """
+    任务装饰器：命中 PROFILE_REPOS / PROFILE_JOBS 及采样率时剖析本次调用。
+    被装饰函数需有 platform、repo_name、request_number 参数，用于确定输出路径。
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        bound = signature.bind_partial(*args, **kwargs).arguments
+        platform, repo_name = bound.get("platform", ""), bound.get("repo_name", "")
+        if not should_profile(repo_name):
+            return func(*args, **kwargs)
+
+        tracemalloc.start()
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        error = None
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            wall_ms = round((time.perf_counter() - start) * 1000, 1)
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            summary = {
+                "function": func.__qualname__,
+                "platform": platform,
+                "repo_name": repo_name,
+                "request_number": bound.get("request_number"),
+                "started_at": int(time.time() - wall_ms / 1000),
+                "wall_ms": wall_ms,
+                "peak_alloc_kb": peak // 1024,
+                "live_alloc_kb": current // 1024,
+                "error": error,
+            }
+            try:
+                stem = _save(platform, repo_name, bound.get("request_number"), profiler, snapshot, summary)
+                logger.info(f"Profile saved: {stem} (wall {wall_ms} ms, peak {peak // 1024} KB)")
+            except OSError as e:
+                logger.error(f"Failed to save profile: {e}")
+
+    return wrapper
+
+
+def list_profiles(platform: Optional[str] = None, repo_name: Optional[str] = None, limit: int = 100) -> List[dict]:
+    """按时间倒序列出已保存的剖析结果摘要，name 为相对 PROFILE_DIR 的路径（不含扩展名）"""
+    base = profile_dir()
+    if not os.path.isdir(base):
+        return []
+    pattern = os.path.join(
+        base, _safe(platform) if platform else "*", _safe(repo_name) if repo_name else "*", "*.json"
+    )
+    items = []
+    for path in sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True)[:limit]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+        except (OSError, ValueError):
+            continue
+        name = os.path.relpath(path, base)[:-len(".json")].replace(os.sep, "/")
+        items.append({"name": name, **summary})
+    return items
+
+
+def profile_file(name: str, ext: str = "txt") -> Optional[str]:
+    """剖析结果文件的绝对路径；name 越出 PROFILE_DIR 或文件不存在时返回 None"""
+    if ext not in PROFILE_EXTS:
+        return None
+    base = os.path.realpath(profile_dir())
+    path = os.path.realpath(os.path.join(base, f"{name}.{ext}"))
+    if not path.startswith(base + os.sep) or not os.path.isfile(path):
+        return None
+    return path
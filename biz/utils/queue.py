@@ -1,9 +1,534 @@
-from multiprocessing import Process
+"""
+Webhook 任务调度：内存队列 + 分发线程，每个任务在独立子进程中执行。
+
+- 优先级通道：目标分支命中 QUEUE_PRIORITY_BRANCHES 的进入 high，作者命中 QUEUE_BOT_AUTHORS 的进入 low，其余 normal；
+  通道间按 QUEUE_LANE_WEIGHTS 加权轮转，低优先级通道不会被饿死
+- 通道内按仓库（platform/repo）轮转，单个仓库的大量任务不会挡住其他仓库
+- 并发上限：QUEUE_MAX_WORKERS（全局子进程数）、QUEUE_REPO_CONCURRENCY（单仓库同时执行数），
+  通过 data/queue/slots 下的锁文件在本机所有 worker 进程间共同生效（Windows 下为每进程各自的上限）
+- 每个通道统计排队等待时间，供 /reasoning/queue/metrics 查询（gunicorn 多进程时为当前进程的数据）
+- 子进程通过 forkserver（无 forkserver 的平台为 spawn）启动：分发线程所在进程有多个 Web 线程，
+  直接 fork 可能复制到被其他线程持有的 logging / requests / sqlite 锁导致子进程死锁
+- 已确认（200）的任务同时写入 data/queue/jobs.db，结束后删除；进程被 gunicorn 超时重启或崩溃时，
+  其未完成的任务由下一个启动的分发线程接管重新入队（任务开始时按 commit 去重，已完成的不会重复推理）。
+  任务表只保存不含凭据的任务描述，参数含凭据的任务以 journal=False 提交，仅在内存中排队
+"""
+import fnmatch
+import hashlib
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
 
 from biz.utils.log import logger
 
+try:
+    import fcntl
+except ImportError:  # Windows 下不做跨进程接管
+    fcntl = None
+
+LANES = ("high", "normal", "low")
+DEFAULT_LANE_WEIGHTS = {"high": 4, "normal": 2, "low": 1}
+# 每个通道保留最近的等待时间样本，用于计算分位数
+WAIT_SAMPLES = 1000
+
+_BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 已确认未完成任务的持久化库；各进程在 OWNER_DIR 下持有自己的锁文件，锁随进程退出释放，据此判断 owner 是否存活
+JOB_DB = os.path.join(_BASE_DIR, "data", "queue", "jobs.db")
+OWNER_DIR = os.path.join(_BASE_DIR, "data", "queue", "owners")
+# 跨进程并发槽：每个槽一个锁文件，持有 flock 即占用，进程退出时自动释放
+SLOT_DIR = os.path.join(_BASE_DIR, "data", "queue", "slots")
+
+_dispatcher_lock = threading.Lock()
+_dispatcher_pid = None
+_scheduler: Optional["FairScheduler"] = None
+_context = None
+
+
+def _patterns(name: str, default: str) -> List[str]:
+    return [p.strip() for p in os.getenv(name, default).split(",") if p.strip()]
+
+
+def job_lane(target_branch: str = "", author: str = "") -> str:
+    """按目标分支与作者划分优先级通道；GitHub App 账号（xxx[bot]）总是归入 low"""
+    author = author or ""
+    if author.endswith("[bot]") or any(
+        fnmatch.fnmatch(author, p) for p in _patterns("QUEUE_BOT_AUTHORS", "dependabot*,renovate*")
+    ):
+        return "low"
+    if any(
+        fnmatch.fnmatch(target_branch or "", p)
+        for p in _patterns("QUEUE_PRIORITY_BRANCHES", "main,master,release/*,release-*")
+    ):
+        return "high"
+    return "normal"
+
+
+def _lane_weights() -> Dict[str, int]:
+    weights = dict(DEFAULT_LANE_WEIGHTS)
+    for item in _patterns("QUEUE_LANE_WEIGHTS", ""):
+        lane, _, weight = item.partition("=")
+        if lane.strip() in weights and weight.strip().isdigit():
+            weights[lane.strip()] = max(1, int(weight))
+    return weights
+
+
+def job_context():
+    """任务子进程的 multiprocessing 上下文：优先 forkserver（由单线程的服务进程 fork，不继承 Web 线程持有的锁），否则 spawn"""
+    global _context
+    if _context is None:
+        methods = multiprocessing.get_all_start_methods()
+        _context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return _context
+
+
+def _limit_memory():
+    """
+    子进程内存上限（JOB_MEMORY_LIMIT_MB，0 表示不限制）：超大 MR 触发 MemoryError 时只终止当前任务，
+    不会拖垮整机。Linux 下限制数据段（堆与匿名映射），其他平台限制虚拟地址空间。
+    """
+    limit_mb = int(os.getenv("JOB_MEMORY_LIMIT_MB", "0"))
+    if limit_mb <= 0:
+        return
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    kind = resource.RLIMIT_DATA if sys.platform.startswith("linux") else resource.RLIMIT_AS
+    limit = limit_mb * 1024 * 1024
+    _, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(kind, (limit, hard))
+
+
+def _run_job(func, args, kwargs):
+    _limit_memory()
+    try:
+        func(*args, **kwargs)
+    except MemoryError:
+        logger.error(
+            f"Job {getattr(func, '__name__', func)} exceeded JOB_MEMORY_LIMIT_MB={os.getenv('JOB_MEMORY_LIMIT_MB')}, aborted"
+        )
+        raise SystemExit(1)
+
+
+class _Job:
+    __slots__ = ("func", "args", "kwargs", "repo", "lane", "enqueued_at", "process", "journal_id", "slots")
+
+    def __init__(self, func, args, kwargs, repo: str, lane: str, journal_id: Optional[int] = None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.repo = repo
+        self.lane = lane
+        self.enqueued_at = time.monotonic()
+        self.process = None
+        self.journal_id = journal_id
+        self.slots = ()
+
+
+class _Slots:
+    """
+    QUEUE_MAX_WORKERS / QUEUE_REPO_CONCURRENCY 的跨进程计数：分发线程以非阻塞 flock 占用 SLOT_DIR 下的槽文件，
+    子进程结束后关闭文件释放。所在进程退出时锁由内核释放，不会残留占用。
+    """
+
+    def __init__(self, max_workers: int, repo_concurrency: int):
+        self.max_workers = max_workers
+        self.repo_concurrency = repo_concurrency
+        self.enabled = fcntl is not None
+        if self.enabled:
+            try:
+                os.makedirs(SLOT_DIR, exist_ok=True)
+            except OSError as e:
+                self._disable(e)
+
+    def _try(self, prefix: str, count: int):
+        for i in range(count):
+            f = open(os.path.join(SLOT_DIR, f"{prefix}-{i}.lock"), "a")
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return f
+            except BlockingIOError:
+                f.close()
+        return None
+
+    def _disable(self, e: OSError):
+        logger.error(f"Cross-process queue limits disabled: {e}")
+        self.enabled = False
+
+    def acquire(self, repo: str) -> Optional[tuple]:
+        """同时占用一个全局槽与该仓库的一个槽，返回槽文件；任一已满时返回 None"""
+        if not self.enabled:
+            return ()
+        try:
+            return self._acquire(repo)
+        except OSError as e:
+            self._disable(e)
+            return ()
+
+    def _acquire(self, repo: str) -> Optional[tuple]:
+        worker = self._try("worker", self.max_workers)
+        if worker is None:
+            return None
+        repo_slot = self._try("repo-" + hashlib.sha1(repo.encode("utf-8")).hexdigest()[:16], self.repo_concurrency)
+        if repo_slot is None:
+            worker.close()
+            return None
+        return worker, repo_slot
+
+    def full(self) -> bool:
+        """全局槽是否已被（任意进程）占满"""
+        if not self.enabled:
+            return False
+        try:
+            worker = self._try("worker", self.max_workers)
+        except OSError as e:
+            self._disable(e)
+            return False
+        if worker is None:
+            return True
+        worker.close()
+        return False
+
+    @staticmethod
+    def release(slots: tuple):
+        for f in slots:
+            f.close()
+
+
+class _Journal:
+    """
+    任务持久化：入队前写入 JOB_DB（owner 为当前进程），子进程结束后删除。
+    单独的 SQLite 文件（WAL、synchronous=NORMAL），与业务库的写锁互不影响，入队只增加一次小事务。
+    每个进程对 OWNER_DIR/<owner>.lock 持有排他 flock；能拿到锁说明该 owner 已退出，其任务可被接管。
+    """
+
+    def __init__(self):
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._lock_file = None
+        self._conn = None
+        self._db_lock = threading.Lock()
+        if fcntl is None:
+            return
+        try:
+            os.makedirs(OWNER_DIR, exist_ok=True)
+            self._lock_file = open(os.path.join(OWNER_DIR, f"{self.owner}.lock"), "w")
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._conn = sqlite3.connect(JOB_DB, timeout=10, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS job (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    owner TEXT NOT NULL,
+                    repo TEXT NOT NULL,
+                    lane TEXT NOT NULL,
+                    payload BLOB NOT NULL,
+                    created_at INTEGER NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_job_owner ON job(owner)")
+            self._conn.commit()
+        except (OSError, sqlite3.DatabaseError) as e:
+            logger.error(f"Job journal disabled: {e}")
+            self._lock_file = self._conn = None
+
+    @property
+    def enabled(self) -> bool:
+        return self._conn is not None
+
+    def _execute(self, sql: str, params=()):
+        """执行一条语句并提交，返回 (lastrowid, rows)；出错时返回 (None, [])"""
+        try:
+            with self._db_lock, self._conn:
+                cursor = self._conn.execute(sql, params)
+                return cursor.lastrowid, cursor.fetchall()
+        except sqlite3.DatabaseError as e:
+            logger.error(f"Job journal error: {e}")
+            return None, []
+
+    def add(self, func, args, kwargs, repo: str, lane: str) -> Optional[int]:
+        """写入失败时返回 None：任务仍在内存队列中执行，只是进程退出后不可接管"""
+        if not self.enabled:
+            return None
+        try:
+            payload = pickle.dumps((func, args, kwargs))
+        except (pickle.PicklingError, AttributeError, TypeError) as e:
+            logger.warn(f"Job {getattr(func, '__name__', func)} not journaled: {e}")
+            return None
+        journal_id, _ = self._execute(
+            "INSERT INTO job (owner, repo, lane, payload, created_at) VALUES (?, ?, ?, ?, ?)",
+            (self.owner, repo, lane, payload, int(time.time())),
+        )
+        return journal_id
+
+    def done(self, journal_ids: List[int]):
+        placeholders = ",".join(["?"] * len(journal_ids))
+        self._execute(f"DELETE FROM job WHERE id IN ({placeholders})", journal_ids)
+
+    def recover(self) -> List[tuple]:
+        """接管已退出进程遗留的任务，返回 [(journal_id, repo, lane, func, args, kwargs)]"""
+        if not self.enabled:
+            return []
+        _, owners = self._execute("SELECT DISTINCT owner FROM job WHERE owner != ?", (self.owner,))
+        jobs = []
+        for (owner,) in owners:
+            path = os.path.join(OWNER_DIR, f"{owner}.lock")
+            try:
+                with open(path, "w") as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # owner 仍在运行
+                    # 持有该 owner 的锁，不会有其他进程同时接管
+                    _, rows = self._execute("SELECT id, repo, lane, payload FROM job WHERE owner = ? ORDER BY id", (owner,))
+                    self._execute("UPDATE job SET owner = ? WHERE owner = ?", (self.owner, owner))
+                os.remove(path)
+            except OSError as e:
+                logger.error(f"Failed to recover jobs of {owner}: {e}")
+                continue
+            for journal_id, repo, lane, payload in rows:
+                try:
+                    func, args, kwargs = pickle.loads(payload)
+                except Exception as e:
+                    logger.error(f"Dropping unreadable journaled job {journal_id}: {e}")
+                    self.done([journal_id])
+                    continue
+                jobs.append((journal_id, repo, lane, func, args, kwargs))
+            if rows:
+                logger.info(f"Recovered {len(rows)} unfinished jobs from exited worker {owner}")
+        self._sweep()
+        return jobs
+
+    def _sweep(self):
+        """删除已退出且无遗留任务的 owner 锁文件；只处理较旧的文件，避免与刚创建尚未加锁的进程竞争"""
+        cutoff = time.time() - 60
+        for name in os.listdir(OWNER_DIR):
+            path = os.path.join(OWNER_DIR, name)
+            try:
+                if not name.endswith(".lock") or os.path.getmtime(path) > cutoff:
+                    continue
+                with open(path, "a") as f:
+                    fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(path)
+            except (BlockingIOError, FileNotFoundError):
+                continue
+            except OSError as e:
+                logger.warn(f"Failed to remove stale owner lock {name}: {e}")
+
+
+class _LaneStats:
+    __slots__ = ("enqueued", "started", "completed", "failed", "waits")
+
+    def __init__(self):
+        self.enqueued = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+
+class FairScheduler:
+    """
+    按通道加权、通道内按仓库轮转的调度器。所有状态由同一把锁保护，
+    入队只做 O(1) 的 deque 操作，选择与派生子进程都在分发线程中完成。
+    """
+
+    def __init__(self, max_workers: int = None, repo_concurrency: int = None, weights: Dict[str, int] = None):
+        self.max_workers = max_workers or int(os.getenv("QUEUE_MAX_WORKERS", "4"))
+        self.repo_concurrency = repo_concurrency or int(os.getenv("QUEUE_REPO_CONCURRENCY", "1"))
+        weights = weights or _lane_weights()
+        # 加权轮转序列，例如 high,high,high,high,normal,normal,low
+        self._cycle = [lane for lane in LANES for _ in range(weights[lane])]
+        self._cursor = 0
+        # lane -> OrderedDict(repo -> deque[_Job])，队首仓库优先，取出任务后轮转到队尾
+        self._queues: Dict[str, "OrderedDict[str, deque]"] = {lane: OrderedDict() for lane in LANES}
+        self._running: List[_Job] = []
+        self._running_by_repo: Dict[str, int] = {}
+        self._stats = {lane: _LaneStats() for lane in LANES}
+        self._cond = threading.Condition()
+        self._slots = _Slots(self.max_workers, self.repo_concurrency)
+        self.journal: Optional[_Journal] = None
+
+    def submit(
+        self, func, args=(), kwargs=None, repo: str = "", lane: str = "normal",
+        journal_id: int = None, journal: bool = True,
+    ):
+        lane = lane if lane in LANES else "normal"
+        kwargs = kwargs or {}
+        if journal and journal_id is None and self.journal is not None:
+            journal_id = self.journal.add(func, args, kwargs, repo, lane)
+        job = _Job(func, args, kwargs, repo, lane, journal_id)
+        with self._cond:
+            self._queues[lane].setdefault(repo, deque()).append(job)
+            self._stats[lane].enqueued += 1
+            self._cond.notify()
+
+    def _pick(self) -> Optional[_Job]:
+        """按加权序列依次尝试各通道，通道内取第一个未达并发上限（含其他 worker 进程占用）的仓库"""
+        if len(self._running) >= self.max_workers or self._slots.full():
+            return None
+        for step in range(len(self._cycle)):
+            lane = self._cycle[(self._cursor + step) % len(self._cycle)]
+            repos = self._queues[lane]
+            for repo in list(repos):
+                if self._running_by_repo.get(repo, 0) >= self.repo_concurrency:
+                    continue
+                slots = self._slots.acquire(repo)
+                if slots is None:
+                    continue
+                jobs = repos[repo]
+                job = jobs.popleft()
+                job.slots = slots
+                if jobs:
+                    repos.move_to_end(repo)
+                else:
+                    del repos[repo]
+                self._cursor = (self._cursor + step + 1) % len(self._cycle)
+                return job
+        return None
+
+    def _reap(self) -> List[int]:
+        """回收已结束的子进程，返回需从任务表删除的 journal_id"""
+        finished = []
+        for job in [j for j in self._running if not j.process.is_alive()]:
+            job.process.join()
+            self._slots.release(job.slots)
+            self._running.remove(job)
+            self._running_by_repo[job.repo] -= 1
+            if not self._running_by_repo[job.repo]:
+                del self._running_by_repo[job.repo]
+            stats = self._stats[job.lane]
+            stats.completed += 1
+            if job.process.exitcode:
+                stats.failed += 1
+            if job.journal_id is not None:
+                finished.append(job.journal_id)
+        return finished
+
+    def recover(self):
+        """接管已退出进程在任务表中遗留的任务"""
+        if self.journal is None:
+            return
+        try:
+            jobs = self.journal.recover()
+        except Exception as e:
+            logger.error(f"Failed to recover journaled jobs: {e}")
+            return
+        for journal_id, repo, lane, func, args, kwargs in jobs:
+            self.submit(func, args, kwargs, repo=repo, lane=lane, journal_id=journal_id)
+
+    def run(self):
+        """分发线程主循环：回收已结束的子进程，在并发上限内按调度顺序派生新任务"""
+        self.recover()
+        while True:
+            with self._cond:
+                finished = self._reap()
+                job = self._pick()
+                if job is None and not finished:
+                    # 等待新任务入队；有任务在运行或排队（可能在等其他进程释放并发槽）时定期醒来
+                    queued = any(self._queues[lane] for lane in LANES)
+                    self._cond.wait(timeout=0.2 if self._running or queued else None)
+                    continue
+                if job is not None:
+                    self._stats[job.lane].waits.append(time.monotonic() - job.enqueued_at)
+                    self._stats[job.lane].started += 1
+            # 任务表读写与子进程启动都在锁外进行，不阻塞 webhook 线程入队
+            if finished:
+                self.journal.done(finished)
+            if job is None:
+                continue
+            try:
+                job.process = job_context().Process(target=_run_job, args=(job.func, job.args, job.kwargs))
+                job.process.start()
+            except Exception as e:
+                logger.error(f"Failed to start job {getattr(job.func, '__name__', job.func)}: {e}")
+                self._slots.release(job.slots)
+                with self._cond:
+                    self._stats[job.lane].failed += 1
+                if job.journal_id is not None:
+                    self.journal.done([job.journal_id])
+                continue
+            with self._cond:
+                self._running.append(job)
+                self._running_by_repo[job.repo] = self._running_by_repo.get(job.repo, 0) + 1
+
+    def metrics(self) -> dict:
+        with self._cond:
+            lanes = {}
+            for lane in LANES:
+                stats = self._stats[lane]
+                waits = sorted(stats.waits)
+                lanes[lane] = {
+                    "queued": sum(len(q) for q in self._queues[lane].values()),
+                    "running": sum(1 for j in self._running if j.lane == lane),
+                    "enqueued": stats.enqueued,
+                    "started": stats.started,
+                    "completed": stats.completed,
+                    "failed": stats.failed,
+                    "wait_seconds": {
+                        "avg": round(sum(waits) / len(waits), 3) if waits else 0,
+                        "p50": round(waits[len(waits) // 2], 3) if waits else 0,
+                        "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3) if waits else 0,
+                        "max": round(waits[-1], 3) if waits else 0,
+                    },
+                }
+            repos = {}
+            for lane in LANES:
+                for repo, jobs in self._queues[lane].items():
+                    repos.setdefault(repo, {"queued": 0, "running": 0})["queued"] += len(jobs)
+            for repo, count in self._running_by_repo.items():
+                repos.setdefault(repo, {"queued": 0, "running": 0})["running"] = count
+            return {
+                "pid": os.getpid(),
+                "max_workers": self.max_workers,
+                "repo_concurrency": self.repo_concurrency,
+                "running": len(self._running),
+                "lanes": lanes,
+                "repos": repos,
+            }
+
+
+def _ensure_dispatcher() -> FairScheduler:
+    global _dispatcher_pid, _scheduler
+    # gunicorn 等多进程模式下每个 worker 各自启动分发线程（线程不会随 fork 继承）
+    if _dispatcher_pid == os.getpid():
+        return _scheduler
+    with _dispatcher_lock:
+        if _dispatcher_pid != os.getpid():
+            _scheduler = FairScheduler()
+            _scheduler.journal = _Journal()
+            threading.Thread(target=_scheduler.run, name="job-dispatcher", daemon=True).start()
+            _dispatcher_pid = os.getpid()
+    return _scheduler
+
+
+def start_dispatcher():
+    """进程启动时立即启动分发线程，接管已退出进程遗留的任务（gunicorn post_fork 或单进程模式启动时调用）"""
+    _ensure_dispatcher()
+
+
+def submit_job(func, args=(), kwargs=None, repo: str = "", lane: str = "normal", journal: bool = True):
+    """
+    按仓库与优先级通道入队，由分发线程在并发上限内公平调度。
+    journal=False 时不写入任务表（参数含 token 等不应落盘的数据），进程退出后该任务不可接管。
+    """
+    _ensure_dispatcher().submit(func, args, kwargs, repo=repo, lane=lane, journal=journal)
+
 
 def handle_queue(func, *args, **kwargs):
-    """异步执行，避免阻塞 webhook 响应"""
-    p = Process(target=func, args=args, kwargs=kwargs)
-    p.start()
+    """异步执行，避免阻塞 webhook 响应：写入任务表并放入内存队列，由分发线程派生子进程，入队耗时与子进程启动无关"""
+    submit_job(func, args, kwargs)
+
+
+def queue_metrics() -> dict:
+    """当前进程的队列指标"""
+    return _ensure_dispatcher().metrics()
@@ -0,0 +1,182 @@
+"""运维命令行入口：python manage.py <command> [options]"""
+import argparse
+import datetime
+import os
+import sys
+
+# 启动时加载 conf/.env 环境变量
+try:
+    from dotenv import load_dotenv
+    env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "conf", ".env")
+    if os.path.exists(env_path):
+        load_dotenv(env_path)
+except ImportError:
+    pass
+
+
+def _date_ts(value: str) -> int:
+    """YYYY-MM-DD（本地时区当天零点）或 Unix 时间戳"""
+    if value.isdigit():
+        return int(value)
+    return int(datetime.datetime.strptime(value, "%Y-%m-%d").timestamp())
+
+
+def _columns(value: str) -> tuple:
+    """逗号分隔的导出列名，只允许 EXPORTABLE_COLUMNS 中的列（列名会拼入 SELECT）"""
+    from biz.service.storage_service import EXPORTABLE_COLUMNS
+
+    columns = tuple(c.strip() for c in value.split(",") if c.strip())
+    invalid = [c for c in columns if c not in EXPORTABLE_COLUMNS]
+    if invalid or not columns:
+        raise argparse.ArgumentTypeError(
+            f"unsupported columns {invalid or value!r}, choose from: {','.join(EXPORTABLE_COLUMNS)}"
+        )
+    return columns
+
+
+def _add_filter_args(p: argparse.ArgumentParser):
+    p.add_argument("--platform", help="gitlab|github|gitea")
+    p.add_argument("--repo", action="append", dest="repo_names", help="仓库名，可重复")
+    p.add_argument("--author", action="append", dest="authors", help="作者，可重复")
+    p.add_argument("--since", type=_date_ts, dest="created_at_gte", help="created_at 下限 (YYYY-MM-DD 或时间戳)")
+    p.add_argument("--until", type=_date_ts, dest="created_at_lte", help="created_at 上限 (YYYY-MM-DD 或时间戳)")
+
+
+def _filters(args) -> dict:
+    return {
+        "platform": args.platform,
+        "repo_names": args.repo_names,
+        "authors": args.authors,
+        "created_at_gte": args.created_at_gte,
+        "created_at_lte": args.created_at_lte,
+    }
+
+
+def cmd_export(args):
+    from biz.service.export_service import ExportService
+    from biz.service.storage_service import EXPORT_COLUMNS
+
+    columns = args.columns or EXPORT_COLUMNS
+    if args.with_raw and "raw_reasoning_json" not in columns:
+        columns += ("raw_reasoning_json",)
+    ExportService.export(
+        fmt=args.format,
+        output=args.output,
+        columns=columns,
+        since_id=args.since_id,
+        state_file=args.state_file,
+        batch_size=args.batch_size,
+        **_filters(args),
+    )
+
+
+def cmd_reprocess(args):
+    from biz.service.reprocess_service import ReprocessService
+
+    stats = ReprocessService.reprocess(
+        since_id=args.since_id,
+        state_file=args.state_file,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        dry_run=args.dry_run,
+        **_filters(args),
+    )
+    print(" ".join(f"{k}={v}" for k, v in stats.items()))
+
+
+def cmd_drain_deferred(args):
+    from biz.service.deferral_service import drain
+
+    done, retried = drain(concurrency=args.concurrency, limit=args.limit, force=args.force)
+    print(f"done={done} retry={retried}")
+
+
+def cmd_maintain(args):
+    from biz.service.storage_service import StorageService
+
+    archive = args.archive_db
+    if archive and not os.path.isabs(archive):
+        archive = os.path.join(os.path.dirname(os.path.abspath(__file__)), archive)
+    report = StorageService.maintain(
+        raw_retention_days=args.raw_retention_days, archive_path=archive or None, vacuum=not args.no_vacuum
+    )
+    before, after = report["before"], report["after"]
+    print(f"compressed raw: {report['compressed']}, archived raw: {report['archived']}, vacuum: {report.get('vacuum', '-')}")
+    print(f"db size: {before['size_bytes'] / 1048576:.1f} MB -> {after['size_bytes'] / 1048576:.1f} MB")
+    print(f"free pages: {before['free_bytes'] / 1048576:.1f} MB -> {after['free_bytes'] / 1048576:.1f} MB")
+    print(f"get_logs: {before['get_logs_ms']} ms -> {after['get_logs_ms']} ms")
+
+
+def cmd_profiles(args):
+    from biz.utils.profiling import list_profiles, profile_file
+
+    if args.name:
+        path = profile_file(args.name, "txt")
+        if path is None:
+            print(f"Profile not found: {args.name}", file=sys.stderr)
+            return 1
+        with open(path, "r", encoding="utf-8") as f:
+            sys.stdout.write(f.read())
+        return 0
+    for item in list_profiles(args.platform, args.repo, args.limit):
+        print(f"{item['name']}\t{item['wall_ms']} ms\tpeak {item['peak_alloc_kb']} KB" + (f"\t{item['error']}" if item.get("error") else ""))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="manage.py")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("export", help="流式导出业务推理日志")
+    p.add_argument("--format", choices=("csv", "jsonl", "parquet"), default="jsonl")
+    p.add_argument("--output", "-o", default="-", help="输出文件，- 表示 stdout（parquet 需指定文件）")
+    p.add_argument("--columns", type=_columns, help="逗号分隔的列名，默认导出全部业务字段")
+    p.add_argument("--with-raw", action="store_true", help="同时导出 raw_reasoning_json")
+    p.add_argument("--since-id", type=int, help="只导出 id 大于该值的记录")
+    p.add_argument("--state-file", help="增量状态文件，记录上次导出的最大 id（夜间同步用）")
+    p.add_argument("--batch-size", type=int, default=1000)
+    _add_filter_args(p)
+    p.set_defaults(func=cmd_export)
+
+    p = sub.add_parser("reprocess", help="用当前解析逻辑重新解析已保存的 LLM 原始输出并原地更新（不调用 LLM）")
+    p.add_argument("--since-id", type=int, help="只处理 id 大于该值的记录")
+    p.add_argument("--state-file", help="进度文件，每批提交后记录最大 id，中断后重新执行即可续跑")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--workers", type=int, help="解析进程数，默认 CPU 核数")
+    p.add_argument("--dry-run", action="store_true", help="只统计将被更新的记录数，不写回")
+    _add_filter_args(p)
+    p.set_defaults(func=cmd_reprocess)
+
+    p = sub.add_parser("drain-deferred", help="处理错峰延迟队列（默认仅在 OFFPEAK_WINDOW 内执行，适合 cron 调度）")
+    p.add_argument("--concurrency", type=int, help="同时进行的 LLM 调用数，默认 DEFER_DRAIN_CONCURRENCY")
+    p.add_argument("--limit", type=int, help="本次最多处理的任务数")
+    p.add_argument("--force", action="store_true", help="忽略时间窗口立即处理")
+    p.set_defaults(func=cmd_drain_deferred)
+
+    p = sub.add_parser("maintain", help="存储维护：压缩原始输出、按保留期归档、VACUUM/ANALYZE，输出前后对比")
+    p.add_argument(
+        "--raw-retention-days", type=int, default=int(os.getenv("RAW_RETENTION_DAYS", "0")),
+        help="原始 LLM 输出在主库中保留的天数，0 表示不归档（默认 RAW_RETENTION_DAYS）",
+    )
+    p.add_argument(
+        "--archive-db", default=os.getenv("RAW_ARCHIVE_DB", "data/archive.db"),
+        help="归档库路径，为空时超期原始输出直接删除（默认 RAW_ARCHIVE_DB）",
+    )
+    p.add_argument("--no-vacuum", action="store_true", help="跳过空间回收")
+    p.set_defaults(func=cmd_maintain)
+
+    p = sub.add_parser("profiles", help="列出任务剖析结果，或输出指定结果的报告")
+    p.add_argument("name", nargs="?", help="剖析结果名（列表第一列），省略时列出全部")
+    p.add_argument("--platform")
+    p.add_argument("--repo")
+    p.add_argument("--limit", type=int, default=50)
+    p.set_defaults(func=cmd_profiles)
+
+    args = parser.parse_args(argv)
+    from biz.service.storage_service import StorageService
+    StorageService.init_db()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
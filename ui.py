@@ -6,6 +6,12 @@ import os
 
 import pandas as pd
 import streamlit as st
+from dateutil import tz
+
+try:
+    from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+except ImportError:  # Python < 3.9
+    ZoneInfo = None
 
 from biz.service.storage_service import StorageService
 
@@ -13,8 +19,14 @@ st.set_page_config(
     layout="wide", page_title="业务变更跟踪", page_icon="📋", initial_sidebar_state="expanded"
 )
 
-# 初始化数据库
-StorageService.init_db()
+
+@st.cache_resource(show_spinner=False)
+def init_db():
+    """每个进程仅初始化一次数据库，避免每次交互重复执行建表语句"""
+    StorageService.init_db()
+
+
+init_db()
 
 # 从 env 加载（可选）
 try:
@@ -26,27 +38,115 @@ except ImportError:
     pass
 
 PAGE_SIZE = 20
+# 全文检索最多返回的条数，达到该值时提示结果被截断
+SEARCH_LIMIT = 200
+# 查询缓存有效期（秒）；新数据写入时版本号变化，缓存立即失效
+CACHE_TTL = int(os.getenv("UI_CACHE_TTL", "300"))
 
 
-def get_data(platform=None, repo_names=None, authors=None, created_at_gte=None, created_at_lte=None):
-    df = StorageService.get_logs(
-        platform=platform,
-        repo_names=repo_names,
-        authors=authors,
-        created_at_gte=created_at_gte,
-        created_at_lte=created_at_lte,
-    )
-    if df.empty:
-        return df
+def _display_tz(name: str) -> datetime.tzinfo:
+    """UI_TZ 指定的 IANA 时区；未设置或无效时使用服务器本地时区规则（随夏令时切换，而非启动时的固定偏移）"""
+    if name and ZoneInfo is not None:
+        try:
+            return ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            print(f"Unknown UI_TZ={name!r}, using server local time (pip install tzdata on Windows)")
+    return tz.tzlocal()
+
+
+LOCAL_TZ = _display_tz(os.getenv("UI_TZ", ""))
+# 实时视图：轮询间隔（秒）、首次加载条数、视图中保留的最多条数
+LIVE_POLL_SECONDS = int(os.getenv("UI_LIVE_POLL_SECONDS", "10"))
+LIVE_INITIAL_ROWS = 50
+LIVE_MAX_ROWS = 500
+
+
+def format_created_at(df: pd.DataFrame) -> pd.DataFrame:
     if "created_at" in df.columns:
-        df["created_at"] = df["created_at"].apply(
-            lambda ts: datetime.datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
-            if isinstance(ts, (int, float))
-            else ts
+        df["created_at"] = (
+            pd.to_datetime(df["created_at"], unit="s", utc=True)
+            .dt.tz_convert(LOCAL_TZ)
+            .dt.strftime("%Y-%m-%d %H:%M:%S")
         )
     return df
 
 
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_data(version, platform=None, repo_names=None, authors=None, created_at_gte=None, created_at_lte=None, keyword=None):
+    """version 来自 StorageService.get_data_version()，仅作为缓存键"""
+    if keyword:
+        # 全文检索：结果按相关度排序
+        df = StorageService.search_logs(
+            keyword,
+            platform=platform,
+            repo_names=repo_names,
+            authors=authors,
+            created_at_gte=created_at_gte,
+            created_at_lte=created_at_lte,
+            limit=SEARCH_LIMIT,
+        )
+    else:
+        df = StorageService.get_logs(
+            platform=platform,
+            repo_names=repo_names,
+            authors=authors,
+            created_at_gte=created_at_gte,
+            created_at_lte=created_at_lte,
+        )
+    if df.empty:
+        return df
+    return format_created_at(df)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_filter_options(version):
+    return StorageService.get_filter_options()
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_category_stats(version, **filters):
+    return StorageService.get_category_stats(group_by=("repo_name",), **filters)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_trends(version, **filters):
+    return StorageService.get_trends(**filters)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_llm_usage_stats(version, **filters):
+    return StorageService.get_llm_usage_stats(**filters)
+
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def get_deferred(deferred_version):
+    """deferred_version 为延迟队列的 (总数, 最早入队时间)，仅作为缓存键"""
+    df = StorageService.get_deferred()
+    if not df.empty:
+        format_created_at(df)
+        df["diff_size"] = (df["diff_size"] / 1024).round(1)
+    return df
+
+
+def render_deferred_backlog():
+    """错峰延迟队列：等待 OFFPEAK_WINDOW 处理的 MR"""
+    stats = StorageService.get_deferred_stats()
+    if not stats["total"]:
+        return
+    reasons = "，".join(f"{k} {v}" for k, v in sorted(stats["reasons"].items()))
+    with st.expander(f"⏳ 错峰队列：{stats['total']} 个 MR 等待处理（{reasons}）"):
+        df = get_deferred((stats["total"], stats["oldest"]))
+        if df.empty:
+            return
+        display_cols = [
+            "platform", "repo_name", "request_title", "target_branch", "author",
+            "reason", "diff_size", "attempts", "created_at",
+        ]
+        df_display = df[display_cols].copy()
+        df_display.columns = ["平台", "仓库", "标题", "目标分支", "作者", "原因", "diff (KB)", "重试次数", "入队时间"]
+        st.dataframe(df_display, use_container_width=True, hide_index=True)
+
+
 @st.dialog("业务摘要详情", width="large")
 def show_detail_dialog(row):
     """弹窗显示业务摘要及关联详情"""
@@ -69,130 +169,286 @@ def show_detail_dialog(row):
 
 st.markdown("# 📋 业务变更跟踪")
 
+# 每次交互仅执行一次轻量版本查询，其余查询命中缓存
+data_version = StorageService.get_data_version()
+
 # 侧边栏筛选
 with st.sidebar:
+    page_name = st.radio("页面", ["变更列表", "实时", "趋势"], horizontal=True)
+
     st.markdown("### 筛选条件")
+    keyword = ""
+    if page_name == "变更列表":
+        keyword = st.text_input("关键词搜索", placeholder="如：退款 审批，多个词以空格分隔").strip()
     platforms = ["gitlab", "github", "gitea"]
     platform = st.selectbox("平台", [""] + platforms, format_func=lambda x: "全部" if not x else x)
     platform = platform or None
 
-    # 先获取全部数据以生成选项
-    _all = StorageService.get_logs()
-    if not _all.empty:
-        repos = sorted(_all["repo_name"].dropna().unique().tolist())
-        authors_list = sorted(_all["author"].dropna().unique().tolist())
-    else:
-        repos, authors_list = [], []
-
-    repo_names = st.multiselect("仓库", repos, default=[])
-    authors = st.multiselect("作者", authors_list, default=[])
+    # 选项取自趋势汇总表，无需加载全部日志
+    options = get_filter_options(data_version)
+    repo_names = st.multiselect("仓库", options["repo_names"], default=[])
+    authors = st.multiselect("作者", options["authors"], default=[])
 
     st.markdown("### 时间范围")
-    today = datetime.date.today()
+    today = datetime.datetime.now(LOCAL_TZ).date()
     days_back = st.slider("最近天数", 1, 90, 30)
     start = today - datetime.timedelta(days=days_back)
-    created_at_gte = int(datetime.datetime.combine(start, datetime.time.min).timestamp())
-    created_at_lte = int(datetime.datetime.now().timestamp())
-
-# 查询
-df = get_data(
-    platform=platform,
-    repo_names=repo_names if repo_names else None,
-    authors=authors if authors else None,
-    created_at_gte=created_at_gte,
-    created_at_lte=created_at_lte,
-)
+    created_at_gte = int(datetime.datetime.combine(start, datetime.time.min, tzinfo=LOCAL_TZ).timestamp())
+    # 不设上限（不存在未来时间的记录），保证缓存键在同一天内稳定
+    created_at_lte = None
 
-if df.empty:
-    st.info("暂无业务变更记录，请配置 Webhook 后提交 MR/PR 触发。")
-    st.markdown("**Webhook URL:** `/reasoning/webhook`")
-else:
-    total = len(df)
-    total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
-
-    # 初始化/重置页码（筛选变化时重置到第一页）
-    if "current_page" not in st.session_state:
-        st.session_state.current_page = 1
-    # 使用 session_state 存储上次筛选条件，筛选变化时重置页码
-    filter_key = (platform, tuple(repo_names or []), tuple(authors or []), created_at_gte, created_at_lte)
-    if "last_filter" not in st.session_state or st.session_state.last_filter != filter_key:
-        st.session_state.last_filter = filter_key
-        st.session_state.current_page = 1
-
-    # 限制页码在有效范围内
-    page = min(max(1, st.session_state.current_page), total_pages)
-    st.session_state.current_page = page
-    start_idx = (page - 1) * PAGE_SIZE
-    end_idx = min(start_idx + PAGE_SIZE, total)
-    df_page = df.iloc[start_idx:end_idx].copy()
-
-    st.success(f"共 {total} 条记录，第 {start_idx + 1}-{end_idx} 条")
-
-    # 表格列：去掉「请求号」
-    cols = [
-        "platform", "repo_name", "request_title",
-        "source_branch", "target_branch", "author", "created_at",
-        "business_summary", "reasoning_categories",
-    ]
-    display_cols = [c for c in cols if c in df_page.columns]
-    df_display = df_page[display_cols].copy()
-    df_display.columns = [
-        "平台", "仓库", "标题", "源分支", "目标分支", "作者", "时间",
-        "业务摘要", "分类",
-    ]
-
-    # 使用 single-cell 模式：点击行内任意单元格即可弹窗，无需点复选框
-    event = st.dataframe(
+
+def render_list_page():
+    """变更列表：全文检索 + 分页表格 + 详情弹窗"""
+    render_deferred_backlog()
+
+    # 查询
+    df = get_data(
+        data_version,
+        platform=platform,
+        repo_names=tuple(repo_names) if repo_names else None,
+        authors=tuple(authors) if authors else None,
+        created_at_gte=created_at_gte,
+        created_at_lte=created_at_lte,
+        keyword=keyword or None,
+    )
+
+    if df.empty and keyword:
+        st.info(f"未找到与「{keyword}」匹配的业务变更记录。")
+    elif df.empty:
+        st.info("暂无业务变更记录，请配置 Webhook 后提交 MR/PR 触发。")
+        st.markdown("**Webhook URL:** `/reasoning/webhook`")
+    else:
+        total = len(df)
+        total_pages = max(1, (total + PAGE_SIZE - 1) // PAGE_SIZE)
+
+        # 初始化/重置页码（筛选变化时重置到第一页）
+        if "current_page" not in st.session_state:
+            st.session_state.current_page = 1
+        # 使用 session_state 存储上次筛选条件，筛选变化时重置页码
+        filter_key = (platform, tuple(repo_names or []), tuple(authors or []), created_at_gte, created_at_lte, keyword)
+        if "last_filter" not in st.session_state or st.session_state.last_filter != filter_key:
+            st.session_state.last_filter = filter_key
+            st.session_state.current_page = 1
+
+        # 限制页码在有效范围内
+        page = min(max(1, st.session_state.current_page), total_pages)
+        st.session_state.current_page = page
+        start_idx = (page - 1) * PAGE_SIZE
+        end_idx = min(start_idx + PAGE_SIZE, total)
+        df_page = df.iloc[start_idx:end_idx].copy()
+
+        if keyword:
+            if total >= SEARCH_LIMIT:
+                # 结果被截断，实际匹配数未知
+                st.success(
+                    f"「{keyword}」匹配 ≥{SEARCH_LIMIT} 条记录，仅显示前 {total} 条，第 {start_idx + 1}-{end_idx} 条；"
+                    "可增加关键词或缩小筛选范围"
+                )
+            else:
+                st.success(f"「{keyword}」匹配 {total} 条记录（按相关度排序），第 {start_idx + 1}-{end_idx} 条")
+        else:
+            st.success(f"共 {total} 条记录，第 {start_idx + 1}-{end_idx} 条")
+
+        with st.expander("分类统计"):
+            stats = get_category_stats(
+                data_version,
+                platform=platform,
+                repo_names=list(repo_names) if repo_names else None,
+                authors=list(authors) if authors else None,
+                created_at_gte=created_at_gte,
+                created_at_lte=created_at_lte,
+            )
+            if stats.empty:
+                st.text("暂无分类数据")
+            else:
+                st.dataframe(
+                    stats.pivot_table(index="repo_name", columns="category", values="count", fill_value=0),
+                    use_container_width=True,
+                )
+
+        # 表格列：去掉「请求号」
+        cols = [
+            "platform", "repo_name", "request_title",
+            "source_branch", "target_branch", "author", "created_at",
+            "business_summary", "reasoning_categories",
+        ]
+        display_cols = [c for c in cols if c in df_page.columns]
+        df_display = df_page[display_cols].copy()
+        df_display.columns = [
+            "平台", "仓库", "标题", "源分支", "目标分支", "作者", "时间",
+            "业务摘要", "分类",
+        ]
+
+        # 使用 single-cell 模式：点击行内任意单元格即可弹窗，无需点复选框
+        event = st.dataframe(
+            df_display,
+            use_container_width=True,
+            key="biz_dataframe",
+            on_select="rerun",
+            selection_mode="single-cell",
+            column_config={
+                "业务摘要": st.column_config.TextColumn("业务摘要", width="large"),
+                "标题": st.column_config.TextColumn("标题", width="medium"),
+            },
+        )
+
+        # 点击任意单元格时弹窗显示业务摘要详情（从 cells 或 rows 获取行索引）
+        selected_row_idx = None
+        if event.selection:
+            if event.selection.rows:
+                selected_row_idx = event.selection.rows[0]
+            elif event.selection.cells:
+                selected_row_idx = event.selection.cells[0][0]  # (row_idx, col_name)
+        if selected_row_idx is not None:
+            actual_idx = df_page.index[selected_row_idx]
+            row = df.loc[actual_idx]
+            show_detail_dialog(row)
+
+        # 翻页控件（使用 form 确保按钮点击可靠触发，所有控件同一行）
+        st.divider()
+        with st.form("pagination_form"):
+            col1, col2, col3, col4, col5 = st.columns([1, 2, 2, 1, 1])
+            with col1:
+                prev_clicked = st.form_submit_button("◀ 上一页")
+            with col2:
+                st.markdown(f"第 {page} / {total_pages} 页（每页 {PAGE_SIZE} 条）")
+            with col3:
+                # 跳转到页 与 下拉框 同一行
+                r1, r2 = st.columns([1, 2])
+                with r1:
+                    st.text("跳转到页")
+                with r2:
+                    goto = st.selectbox("页", range(1, total_pages + 1), index=page - 1, key="page_select", label_visibility="collapsed")
+            with col4:
+                go_clicked = st.form_submit_button("跳转")
+            with col5:
+                next_clicked = st.form_submit_button("下一页 ▶")
+
+        # 处理翻页
+        if prev_clicked and page > 1:
+            st.session_state.current_page = page - 1
+            st.rerun()
+        if next_clicked and page < total_pages:
+            st.session_state.current_page = page + 1
+            st.rerun()
+        if go_clicked and goto != page:
+            st.session_state.current_page = goto
+            st.rerun()
+
+
+LIVE_COLUMNS = {
+    "created_at": "时间", "platform": "平台", "repo_name": "仓库", "request_title": "标题",
+    "target_branch": "目标分支", "author": "作者", "business_summary": "业务摘要", "reasoning_categories": "分类",
+}
+
+
+@st.fragment(run_every=LIVE_POLL_SECONDS)
+def live_feed(filters: dict):
+    """
+    定时只重跑本片段：按 id 增量查询新记录并插入视图顶部，单次刷新耗时与新增条数相关，与历史总量无关。
+    筛选条件变化时重新加载最新 LIVE_INITIAL_ROWS 条。
+    """
+    key = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in filters.items()))
+    state = st.session_state
+    if state.get("live_filter") != key:
+        state.live_filter = key
+        state.live_last_id = None
+        state.live_rows = pd.DataFrame()
+        state.live_new = 0
+
+    limit = LIVE_INITIAL_ROWS if state.live_last_id is None else LIVE_MAX_ROWS
+    new = StorageService.get_logs_since(state.live_last_id, limit=limit, **filters)
+    if not new.empty:
+        state.live_last_id = int(new["id"].max())
+        new = format_created_at(new).iloc[::-1]
+        state.live_new = len(new) if not state.live_rows.empty else 0
+        state.live_rows = pd.concat([new, state.live_rows], ignore_index=True).head(LIVE_MAX_ROWS)
+    else:
+        state.live_new = 0
+
+    checked = datetime.datetime.now(LOCAL_TZ).strftime("%H:%M:%S")
+    if state.live_rows.empty:
+        st.info(f"暂无业务变更记录（{checked} 检查，每 {LIVE_POLL_SECONDS} 秒刷新）")
+        return
+    st.caption(
+        f"{checked} 检查：新增 {state.live_new} 条，当前显示最新 {len(state.live_rows)} 条，每 {LIVE_POLL_SECONDS} 秒刷新"
+    )
+    df_display = state.live_rows[[c for c in LIVE_COLUMNS if c in state.live_rows.columns]].rename(columns=LIVE_COLUMNS)
+    st.dataframe(
         df_display,
         use_container_width=True,
-        key="biz_dataframe",
-        on_select="rerun",
-        selection_mode="single-cell",
-        column_config={
-            "业务摘要": st.column_config.TextColumn("业务摘要", width="large"),
-            "标题": st.column_config.TextColumn("标题", width="medium"),
-        },
+        hide_index=True,
+        column_config={"业务摘要": st.column_config.TextColumn("业务摘要", width="large")},
     )
 
-    # 点击任意单元格时弹窗显示业务摘要详情（从 cells 或 rows 获取行索引）
-    selected_row_idx = None
-    if event.selection:
-        if event.selection.rows:
-            selected_row_idx = event.selection.rows[0]
-        elif event.selection.cells:
-            selected_row_idx = event.selection.cells[0][0]  # (row_idx, col_name)
-    if selected_row_idx is not None:
-        actual_idx = df_page.index[selected_row_idx]
-        row = df.loc[actual_idx]
-        show_detail_dialog(row)
-
-    # 翻页控件（使用 form 确保按钮点击可靠触发，所有控件同一行）
-    st.divider()
-    with st.form("pagination_form"):
-        col1, col2, col3, col4, col5 = st.columns([1, 2, 2, 1, 1])
-        with col1:
-            prev_clicked = st.form_submit_button("◀ 上一页")
-        with col2:
-            st.markdown(f"第 {page} / {total_pages} 页（每页 {PAGE_SIZE} 条）")
-        with col3:
-            # 跳转到页 与 下拉框 同一行
-            r1, r2 = st.columns([1, 2])
-            with r1:
-                st.text("跳转到页")
-            with r2:
-                goto = st.selectbox("页", range(1, total_pages + 1), index=page - 1, key="page_select", label_visibility="collapsed")
-        with col4:
-            go_clicked = st.form_submit_button("跳转")
-        with col5:
-            next_clicked = st.form_submit_button("下一页 ▶")
-
-    # 处理翻页
-    if prev_clicked and page > 1:
-        st.session_state.current_page = page - 1
-        st.rerun()
-    if next_clicked and page < total_pages:
-        st.session_state.current_page = page + 1
-        st.rerun()
-    if go_clicked and goto != page:
-        st.session_state.current_page = goto
-        st.rerun()
+
+def render_live_page():
+    """实时变更流：只在片段内轮询新记录，不重跑整个页面"""
+    live_feed({
+        "platform": platform,
+        "repo_names": list(repo_names) if repo_names else None,
+        "authors": list(authors) if authors else None,
+        "created_at_gte": created_at_gte,
+    })
+
+
+TREND_DIMENSIONS = {"仓库": "repo_name", "分类": "category", "作者": "author", "平台": "platform"}
+
+
+def render_trends_page():
+    """趋势：直接读取汇总表，耗时与历史数据量无关"""
+    c1, c2 = st.columns(2)
+    with c1:
+        period = st.radio("粒度", ["day", "week"], format_func=lambda x: "按天" if x == "day" else "按周", horizontal=True)
+    with c2:
+        dim_label = st.selectbox("维度", list(TREND_DIMENSIONS.keys()))
+    dimension = TREND_DIMENSIONS[dim_label]
+
+    trends = get_trends(
+        data_version,
+        period=period,
+        dimension=dimension,
+        platform=platform,
+        repo_names=repo_names if repo_names else None,
+        authors=authors if authors else None,
+        created_at_gte=created_at_gte,
+        created_at_lte=created_at_lte,
+    )
+    if trends.empty:
+        st.info("所选时间范围内暂无变更记录。")
+        return
+    trends[dimension] = trends[dimension].replace("", "（未知）")
+    chart = trends.pivot_table(index="bucket", columns=dimension, values="count", aggfunc="sum", fill_value=0)
+    st.markdown(f"#### 每{'天' if period == 'day' else '周'}变更数（按{dim_label}）")
+    st.line_chart(chart)
+    st.dataframe(chart.sort_index(ascending=False), use_container_width=True)
+
+    usage = get_llm_usage_stats(
+        data_version,
+        period=period,
+        platform=platform,
+        repo_names=repo_names if repo_names else None,
+        authors=authors if authors else None,
+        created_at_gte=created_at_gte,
+        created_at_lte=created_at_lte,
+    )
+    if not usage.empty:
+        st.markdown("#### LLM 用量与前缀缓存命中")
+        prompt_total = int(usage["prompt_tokens"].sum())
+        cached_total = int(usage["cached_tokens"].sum())
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("调用次数", int(usage["calls"].sum()))
+        c2.metric("Prompt tokens", prompt_total)
+        c3.metric("缓存命中率", f"{cached_total * 100 / prompt_total:.1f}%" if prompt_total else "-")
+        c4.metric("平均耗时", f"{int(usage['avg_latency_ms'].mean())} ms")
+        usage["cache_hit_pct"] = (usage["cached_tokens"] * 100 / usage["prompt_tokens"]).round(1)
+        st.dataframe(usage.set_index("bucket").sort_index(ascending=False), use_container_width=True)
+
+
+if page_name == "趋势":
+    render_trends_page()
+elif page_name == "实时":
+    render_live_page()
+else:
+    render_list_page()